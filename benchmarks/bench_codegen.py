@@ -0,0 +1,84 @@
+"""
+Compare runtime SCPD services with proxies generated by
+:py:mod:`fritzclient.codegen`:
+
+* startup: parsing all SCPD documents versus loading the generated module
+* calls: rendering a ``SetSSID`` request through a runtime
+  :py:class:`fritzclient.model.Service` versus a generated method
+
+Requests are answered by a stub transport, so only client-side work is
+measured.
+
+Usage::
+
+    python benchmarks/bench_codegen.py [number-of-calls]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from pkg_resources import resource_filename, resource_string
+
+from fritzclient import codegen, model
+
+WLAN_TYPE = 'urn:dslforum-org:service:WLANConfiguration:1'
+LOCATION = 'http://192.168.179.1:49000/tr64desc.xml'
+
+RESPONSE = (
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<s:Body><u:SetSSIDResponse xmlns:u="%s" /></s:Body></s:Envelope>'
+    % WLAN_TYPE.encode('ascii'))
+
+
+class StubResponse(object):
+    status_code = 200
+    headers = {'content-type': 'text/xml; charset="utf-8"'}
+    content = RESPONSE
+    text = RESPONSE.decode('ascii')
+
+
+class StubTransport(object):
+
+    def post(self, url, data=None, headers=None):
+        return StubResponse()
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    tr064desc = resource_string('fritzclient', 'tests/data/tr64desc.xml')
+    services = list(codegen.services_from_directory(
+        tr064desc, resource_filename('fritzclient', 'tests/data/scpd')))
+    source = codegen.generate(services)
+    code = compile(source, '<generated>', 'exec')
+
+    parse = timeit.timeit(
+        lambda: [model.SCPD.parse(doc) for _, doc in services], number=20)
+
+    def load_module():
+        exec(code, {})
+
+    load = timeit.timeit(load_module, number=20)
+
+    device = model.parse_tr064desc(LOCATION, tr064desc, StubTransport())
+    document = dict(services)[WLAN_TYPE]
+    runtime = model.Service(
+        'urn:WLANConfiguration-com:serviceId:WLANConfiguration1',
+        service_type=WLAN_TYPE, scpd_doc=document, device=device)
+    generated = device.service(model.proxy_class(WLAN_TYPE))
+    assert type(generated).__module__ != 'fritzclient.model'
+
+    dynamic = timeit.timeit(lambda: runtime.SetSSID(NewSSID='home'),
+                            number=number)
+    static = timeit.timeit(lambda: generated.SetSSID('home'), number=number)
+
+    print('services:          %d' % len(services))
+    print('parse SCPDs:       %8.2f ms' % (parse / 20 * 1e3))
+    print('load generated:    %8.2f ms' % (load / 20 * 1e3))
+    print('runtime call:      %8.2f us' % (dynamic / number * 1e6))
+    print('generated call:    %8.2f us' % (static / number * 1e6))
+    print('call speedup:      %8.2fx' % (dynamic / static))
+
+
+if __name__ == '__main__':
+    main()
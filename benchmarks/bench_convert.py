@@ -0,0 +1,112 @@
+"""
+Read all output arguments of a GetInfo response, as a caller of the action
+would, in three ways:
+
+* baseline: the original :py:class:`fritzclient.minisoap.Container`, which
+  searches the tree with ``findall`` on every access and only turns
+  digit-only values into integers (reproduced here),
+* untyped: the current indexed container without converters,
+* typed: the current container with the converter table compiled by
+  :py:class:`fritzclient.model.Action` from the SCPD document.
+
+The typed and untyped runs take about the same time: the converters cost
+next to nothing. Both gain over the baseline from indexing the elements
+once, not from the converters.
+
+Usage::
+
+    python benchmarks/bench_convert.py [number-of-responses]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+import xml.etree.ElementTree as etree
+
+from pkg_resources import resource_string
+
+from fritzclient import minisoap
+from fritzclient.model import SCPD
+
+RESPONSE = (
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/">'
+    b'<s:Body><u:GetInfoResponse '
+    b'xmlns:u="urn:dslforum-org:service:DeviceInfo:1">'
+    b'<NewManufacturerName>AVM</NewManufacturerName>'
+    b'<NewManufacturerOUI>00040E</NewManufacturerOUI>'
+    b'<NewModelName>FRITZ!Box 7490</NewModelName>'
+    b'<NewDescription>FRITZ!Box 7490 113.06.85</NewDescription>'
+    b'<NewProductClass>AVMFB7490</NewProductClass>'
+    b'<NewSerialNumber>00040E000000</NewSerialNumber>'
+    b'<NewSoftwareVersion>113.06.85</NewSoftwareVersion>'
+    b'<NewHardwareVersion>FRITZ!Box 7490</NewHardwareVersion>'
+    b'<NewSpecVersion>1.0</NewSpecVersion>'
+    b'<NewProvisioningCode></NewProvisioningCode>'
+    b'<NewUpTime>123456</NewUpTime>'
+    b'<NewDeviceLog>log</NewDeviceLog>'
+    b'</u:GetInfoResponse></s:Body></s:Envelope>'
+)
+
+
+def _parse_xml_value(value):
+    return int(value) if value.isdigit() else value
+
+
+def baseline_get(body, key):
+    """
+    ``Container.get`` before the elements were indexed.
+    """
+    elems = body.findall('.//{}'.format(key))
+    if len(elems) != 1:
+        return None
+    value = elems[0].text
+    return _parse_xml_value(value) if value else elems[0]
+
+
+def read_baseline(names, response):
+    body = etree.fromstring(response)[0]
+    return dict((name, baseline_get(body, name)) for name in names)
+
+
+def read_current(names, response, converters=None):
+    container = minisoap.parse_response(response, converters)
+    return dict((name, container.get(name)) for name in names)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    document = resource_string('fritzclient',
+                               'tests/data/scpd/deviceinfoSCPD.xml')
+    action = SCPD.parse(document).actions['GetInfo']
+    converters = action.converters
+    names = sorted(converters)
+
+    baseline = read_baseline(names, RESPONSE)
+    typed = read_current(names, RESPONSE, converters)
+    assert baseline['NewUpTime'] == typed['NewUpTime'] == 123456
+    untyped = read_current(names, RESPONSE)
+    # Empty elements are returned as (different) element objects.
+    assert ([_ for _ in names if etree.iselement(baseline[_])] ==
+            [_ for _ in names if etree.iselement(untyped[_])] ==
+            ['NewProvisioningCode'])
+    assert all(baseline[_] == untyped[_] for _ in names
+               if _ != 'NewProvisioningCode')
+
+    times = [
+        ('baseline', timeit.timeit(
+            lambda: read_baseline(names, RESPONSE), number=number)),
+        ('untyped', timeit.timeit(
+            lambda: read_current(names, RESPONSE), number=number)),
+        ('typed', timeit.timeit(
+            lambda: read_current(names, RESPONSE, converters),
+            number=number)),
+    ]
+
+    print('responses: %d' % number)
+    for label, seconds in times:
+        print('%-9s %8.2f us/response  %5.2fx' % (
+            label + ':', seconds / number * 1e6, times[0][1] / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Compare peak memory of decoding a large SCPD document from a complete tree
+and incrementally with :py:func:`fritzclient.marshal.decode`.
+
+Requires Python 3 (tracemalloc).
+
+Usage::
+
+    python benchmarks/bench_decode.py [number-of-actions]
+"""
+from __future__ import print_function
+
+from io import BytesIO
+import sys
+import tracemalloc
+import xml.etree.ElementTree as etree
+
+from fritzclient import marshal
+from fritzclient.model import SCPD
+
+NS = 'urn:dslforum-org:service-1-0'
+
+
+def make_document(actions):
+    parts = ['<scpd xmlns="%s"><actionList>' % NS]
+    for number in range(actions):
+        parts.append(
+            '<action><name>Action%d</name><argumentList>'
+            '<argument><name>NewValue</name><direction>out</direction>'
+            '<relatedStateVariable>Value%d</relatedStateVariable>'
+            '</argument></argumentList></action>' % (number, number))
+    parts.append('</actionList><serviceStateTable>')
+    for number in range(actions):
+        parts.append(
+            '<stateVariable sendEvents="no"><name>Value%d</name>'
+            '<dataType>ui4</dataType></stateVariable>' % number)
+    parts.append('</serviceStateTable></scpd>')
+    return ''.join(parts).encode('utf-8')
+
+
+def peak(func):
+    tracemalloc.start()
+    result = func()
+    _, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak_size
+
+
+def main():
+    actions = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    document = make_document(actions)
+
+    def from_tree():
+        root = etree.fromstring(document)
+        return SCPD.decode(root, '{%s}' % NS)
+
+    def streaming():
+        return marshal.decode(BytesIO(document))
+
+    tree_result, tree_peak = peak(from_tree)
+    stream_result, stream_peak = peak(streaming)
+    assert len(tree_result.actions) == len(stream_result.actions) == actions
+
+    print('document:  %8d KiB' % (len(document) // 1024))
+    print('tree:      %8d KiB peak' % (tree_peak // 1024))
+    print('streaming: %8d KiB peak' % (stream_peak // 1024))
+
+
+if __name__ == '__main__':
+    main()
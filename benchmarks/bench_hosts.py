@@ -0,0 +1,57 @@
+"""
+Compare listing a host table one entry at a time with the windowed scan of
+:py:meth:`fritzclient.hosts.Hosts.hosts`.
+
+Actions are answered by a stub which sleeps for a fixed latency, so the
+result shows how much of the round trip time is hidden by the window.
+
+Usage::
+
+    python benchmarks/bench_hosts.py [number-of-hosts] [latency-ms]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from fritzclient.hosts import Hosts
+
+
+def make_execute(count, latency):
+
+    def execute(action, params=None, converters=None):
+        time.sleep(latency)
+        if action == 'GetHostNumberOfEntries':
+            return {'NewHostNumberOfEntries': count}
+        index = params['NewIndex']
+        return {
+            'NewMACAddress': '00:11:22:33:%02x:%02x' % divmod(index, 256),
+            'NewIPAddress': '192.168.179.%d' % (index % 256),
+            'NewAddressSource': 'DHCP',
+            'NewLeaseTimeRemaining': 3600,
+            'NewInterfaceType': 'Ethernet',
+            'NewActive': True,
+            'NewHostName': 'host%d' % index,
+        }
+
+    return execute
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    latency = float(sys.argv[2]) / 1e3 if len(sys.argv) > 2 else 0.02
+    proxy = Hosts({Hosts.TYPE: '/upnp/control/hosts'}, None,
+                  ('http', '192.168.179.1:49000'))
+    proxy._execute_uncached = make_execute(count, latency)
+
+    print('hosts: %d, latency: %.1f ms' % (count, latency * 1e3))
+    for window in (1, 4, 8, 16):
+        start = time.time()
+        result = list(proxy.hosts(window=window, use_list=False))
+        elapsed = time.time() - start
+        assert len(result) == count
+        print('window %2d:  %8.2f s' % (window, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure the memory retained by the decoded description graph of many
+devices of the same model: one :py:class:`fritzclient.model.Device` and a
+:py:class:`fritzclient.model.Service` per SCPD document. The graphs are
+built without interning, with interning, and with SCPD definitions shared
+through a :py:class:`fritzclient.cache.DefinitionStore`.
+
+Requires Python 3 (tracemalloc).
+
+Usage::
+
+    python benchmarks/bench_model_memory.py [number-of-devices]
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import tracemalloc
+
+from pkg_resources import resource_listdir, resource_string
+
+from fritzclient import marshal, model
+from fritzclient.cache import DefinitionStore
+
+
+def load_documents():
+    tr064desc = resource_string('fritzclient', 'tests/data/tr64desc.xml')
+    scpds = [resource_string('fritzclient', 'tests/data/scpd/' + name)
+             for name in sorted(resource_listdir('fritzclient',
+                                                 'tests/data/scpd'))]
+    return tr064desc, scpds
+
+
+def build(tr064desc, scpds, definitions):
+    device = marshal.decode(tr064desc)
+    services = [model.Service('urn:example:serviceId:{}'.format(number),
+                              scpd_doc=doc, definitions=definitions)
+                for number, doc in enumerate(scpds)]
+    return device, services
+
+
+class Unshared(object):
+    """
+    A definition store which parses every document again.
+    """
+
+    def get(self, data):
+        return model.SCPD.parse(data)
+
+
+def retained(count, tr064desc, scpds, definitions):
+    gc.collect()
+    tracemalloc.start()
+    graphs = [build(tr064desc, scpds, definitions) for _ in range(count)]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del graphs
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tr064desc, scpds = load_documents()
+
+    original = model._intern
+    model._intern = lambda value: value
+    try:
+        plain = retained(count, tr064desc, scpds, Unshared())
+    finally:
+        model._intern = original
+    interned = retained(count, tr064desc, scpds, Unshared())
+    store = DefinitionStore(model.SCPD.parse)
+    shared = retained(count, tr064desc, scpds, store)
+
+    print('devices:           %d' % count)
+    print('plain:             %8.1f KiB/device' % (plain / count / 1024.0))
+    print('interned:          %8.1f KiB/device' % (interned / count / 1024.0))
+    print('shared:            %8.1f KiB/device' % (shared / count / 1024.0))
+    print('store hit rate:    %8.1f %%' % (store.hit_rate * 100))
+    print('store bytes saved: %8d KiB' % (store.bytes_saved // 1024))
+
+
+if __name__ == '__main__':
+    main()
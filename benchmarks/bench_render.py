@@ -0,0 +1,57 @@
+"""
+Compare SOAP message rendering with ElementTree and with precompiled
+templates.
+
+Usage::
+
+    python benchmarks/bench_render.py [number-of-messages]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+import xml.etree.ElementTree as etree
+
+from fritzclient import minisoap
+
+CONTEXT = 'urn:dslforum-org:service:Hosts:1'
+ACTION = 'GetSpecificHostEntry'
+ARGS = {'NewMACAddress': '00:11:22:33:44:55'}
+
+
+def render_with_elementtree(context, method, args=None):
+    """
+    The previous implementation of ``minisoap.render_message``.
+    """
+    etree.register_namespace('s', minisoap.SOAP_ENVELOPE_NS)
+    etree.register_namespace('u', context)
+    ns = minisoap.SOAP_ENVELOPE_NS
+    doc = etree.Element(etree.QName(ns, 'Envelope'))
+    doc.set(etree.QName(ns, 'encodingStyle'), minisoap.SOAP_ENCODING_NS)
+    body = etree.SubElement(doc, etree.QName(ns, 'Body'))
+    method_el = etree.SubElement(body, etree.QName(context, method))
+    for key, value in (args or {}).items():
+        etree.SubElement(method_el, key).text = str(value)
+    return etree.tostring(doc)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    assert (render_with_elementtree(CONTEXT, ACTION, ARGS) ==
+            minisoap.render_message(CONTEXT, ACTION, ARGS))
+
+    old = timeit.timeit(
+        lambda: render_with_elementtree(CONTEXT, ACTION, ARGS),
+        number=number)
+    new = timeit.timeit(
+        lambda: minisoap.render_message(CONTEXT, ACTION, ARGS),
+        number=number)
+
+    print('messages:    %d' % number)
+    print('elementtree: %8.2f us/message' % (old / number * 1e6))
+    print('template:    %8.2f us/message' % (new / number * 1e6))
+    print('speedup:     %8.2fx' % (old / new))
+
+
+if __name__ == '__main__':
+    main()
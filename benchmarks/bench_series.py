@@ -0,0 +1,82 @@
+"""
+Compare the memory and rate computation time of a
+:py:class:`fritzclient.series.CounterSeries` with a ``deque`` of
+``(timestamp, value)`` tuples, for a wrapping ``ui4`` counter. The series
+needs a fraction of the memory, but computing rates is slower because the
+values are boxed while reading the arrays.
+
+Requires Python 3 (tracemalloc).
+
+Usage::
+
+    python benchmarks/bench_series.py [number-of-samples]
+"""
+from __future__ import print_function
+
+from collections import deque
+import gc
+import sys
+import timeit
+import tracemalloc
+
+from fritzclient.series import CounterSeries
+
+
+def samples(count):
+    value = 0
+    for second in range(count):
+        value = (value + 12500000 + second % 7) % 2 ** 32
+        yield 1500000000.0 + second, value
+
+
+def fill_series(count):
+    series = CounterSeries(capacity=count)
+    for timestamp, value in samples(count):
+        series.append(timestamp, value)
+    return series
+
+
+def fill_deque(count):
+    return deque(samples(count), maxlen=count)
+
+
+def deque_rates(buf):
+    rates = []
+    previous = None
+    for timestamp, value in buf:
+        if previous is not None:
+            delta = value - previous[1]
+            if delta < 0:
+                delta += 2 ** 32
+            rates.append(delta / (timestamp - previous[0]))
+        previous = timestamp, value
+    return rates
+
+
+def retained(fill, count):
+    gc.collect()
+    tracemalloc.start()
+    buf = fill(count)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return buf, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    series, series_size = retained(fill_series, count)
+    buf, deque_size = retained(fill_deque, count)
+    series_time = min(timeit.repeat(series.rates, number=1, repeat=5))
+    deque_time = min(timeit.repeat(lambda: deque_rates(buf), number=1,
+                                   repeat=5))
+
+    print('samples:        %d' % count)
+    print('series:         %6.1f bytes/sample %8.2f ms/rates' % (
+        series_size / float(count), series_time * 1000))
+    print('deque:          %6.1f bytes/sample %8.2f ms/rates' % (
+        deque_size / float(count), deque_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
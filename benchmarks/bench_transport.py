@@ -0,0 +1,51 @@
+"""
+Compare SOAP throughput with and without connection reuse.
+
+A local keep-alive HTTP server stands in for the FritzBox. The same action
+is executed repeatedly, first opening a new connection for every call, then
+through a pooled :py:class:`fritzclient.transport.Transport`.
+
+Usage::
+
+    python benchmarks/bench_transport.py [number-of-calls]
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from fritzclient import minisoap
+from fritzclient.tests.helpers import SOAPHandler, start_server, stop_server
+from fritzclient.transport import Transport
+
+NAMESPACE = 'urn:dslforum-org:service:DeviceInfo:1'
+
+
+def run(url, calls, transport=None):
+    start = time.time()
+    for _ in range(calls):
+        minisoap.execute(url, NAMESPACE, 'GetSecurityPort',
+                         transport=transport)
+    return calls / (time.time() - start)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = start_server(SOAPHandler)
+    url = server.url('/upnp/control/deviceinfo')
+
+    try:
+        without_reuse = run(url, calls)
+        with Transport() as transport:
+            with_reuse = run(url, calls, transport)
+    finally:
+        stop_server(server)
+
+    print('calls:            %d' % calls)
+    print('new connections:  %8.1f req/s' % without_reuse)
+    print('pooled transport: %8.1f req/s' % with_reuse)
+    print('speedup:          %8.2fx' % (with_reuse / without_reuse))
+
+
+if __name__ == '__main__':
+    main()
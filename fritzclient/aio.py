@@ -0,0 +1,467 @@
+"""
+Asynchronous TR-064 client built on :py:mod:`asyncio`.
+
+This mirrors :py:func:`fritzclient.minisoap.execute`,
+:py:class:`fritzclient.model.ProxyObject` and
+:py:func:`fritzclient.model.get_root_device` without blocking. Messages are
+rendered and parsed with the same codec as the blocking client.
+
+HTTP is spoken directly over asyncio streams, so no additional dependency is
+needed. This module requires Python 3.7 or newer.
+"""
+import asyncio
+import logging
+from collections import deque
+from urllib.parse import urlsplit
+
+from fritzclient import instrument, minisoap, model, tr064
+from fritzclient.transport import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_READ_TIMEOUT,
+)
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncResponse(object):
+    """
+    A received HTTP response. It offers the same attributes as a
+    :py:class:`requests.Response` which are needed by
+    :py:func:`fritzclient.minisoap.handle_response`.
+
+        status_code
+            The HTTP status code.
+
+        headers
+            A dictionary of response headers. Keys are lower-case.
+
+        content
+            The response body as bytes.
+    """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+
+class _NoResponse(ConnectionResetError):
+    """
+    The connection was closed before any byte of a response arrived.
+    """
+
+
+async def _read_response(reader):
+    """
+    Read one HTTP response from *reader*.
+
+    Returns a tuple ``(response, keep_alive)``.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        raise _NoResponse('Connection closed by remote host')
+    version, status = status_line.decode('latin-1').split()[:2]
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = (version == 'HTTP/1.1' and
+                  headers.get('connection', '').lower() != 'close')
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';')[0].strip(), 16)
+            if size == 0:
+                while await reader.readline() not in (b'\r\n', b'\n', b''):
+                    pass  # skip trailers
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        content = b''.join(chunks)
+    elif 'content-length' in headers:
+        content = await reader.readexactly(int(headers['content-length']))
+    else:
+        content = await reader.read()
+        keep_alive = False
+
+    headers.setdefault('content-type', '')
+    return AsyncResponse(int(status), headers, content), keep_alive
+
+
+class AsyncTransport(object):
+    """
+    Asynchronous counterpart of :py:class:`fritzclient.transport.Transport`.
+
+    One instance can be shared by many hosts. For each host it keeps up to
+    *pool_size* keep-alive connections and never has more than *pool_size*
+    requests in flight. Additional requests to the same host wait for a
+    free slot, while requests to other hosts proceed.
+
+        pool_size
+            The maximum number of concurrent requests and kept-alive
+            connections per host.
+
+        connect_timeout
+            Seconds to wait for a connection to be established.
+
+        read_timeout
+            Seconds to wait for a complete response.
+
+        ssl
+            An optional :py:class:`ssl.SSLContext` used for ``https`` URLs.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, ssl=None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._ssl = ssl
+        self._idle = {}
+        self._limits = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _limit(self, key):
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self.pool_size)
+        return self._limits[key]
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        ssl = (self._ssl or True) if scheme == 'https' else None
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl),
+            self.connect_timeout)
+
+    async def request(self, method, url, data=None, headers=None):
+        """
+        Send an HTTP request and return an :py:class:`AsyncResponse`.
+
+        @param method: The HTTP method.
+        @param url: The target URL.
+        @param data: The request body as bytes.
+        @param headers: An optional dictionary of HTTP headers.
+        """
+        parts = urlsplit(url)
+        default_port = 443 if parts.scheme == 'https' else 80
+        key = (parts.scheme, parts.hostname, parts.port or default_port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        data = data or b''
+        lines = ['{} {} HTTP/1.1'.format(method, path),
+                 'Host: {}'.format(parts.netloc),
+                 'Content-Length: {}'.format(len(data))]
+        for name, value in (headers or {}).items():
+            lines.append('{}: {}'.format(name, value))
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data
+
+        async with self._limit(key):
+            idle = self._idle.setdefault(key, deque())
+            while True:
+                reused = bool(idle)
+                if reused:
+                    reader, writer = idle.pop()
+                    if reader.at_eof():
+                        # Closed by the device while it was idle.
+                        writer.close()
+                        continue
+                else:
+                    reader, writer = await self._connect(key)
+                try:
+                    writer.write(message)
+                    await writer.drain()
+                    response, keep_alive = await asyncio.wait_for(
+                        _read_response(reader), self.read_timeout)
+                except _NoResponse:
+                    writer.close()
+                    if reused:
+                        # The device closed the idle connection before it
+                        # answered. Retry on another one. Once a response
+                        # has started, the request may have taken effect
+                        # and is never sent again.
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+        return response
+
+    async def post(self, url, data=None, headers=None):
+        return await self.request('POST', url, data, headers)
+
+    async def get(self, url, headers=None):
+        return await self.request('GET', url, headers=headers)
+
+    async def close(self):
+        """
+        Close all idle connections.
+        """
+        for idle in self._idle.values():
+            while idle:
+                _, writer = idle.pop()
+                writer.close()
+
+
+async def execute(url, namespace, action, params=None, transport=None,
+                  converters=None):
+    """
+    Asynchronous counterpart of :py:func:`fritzclient.minisoap.execute`.
+
+    @param url: The control URL of the service.
+    @param namespace: The service type (a URN from the TR-064 standard).
+    @param action: The action name.
+    @param params: An optional dictionary of parameters.
+    @param transport: An optional :py:class:`AsyncTransport`. If not given,
+                      a temporary one is used for this call only.
+    @param converters: An optional dictionary of converters for the
+                       returned :py:class:`fritzclient.minisoap.Container`.
+    """
+    if instrument._LISTENERS:
+        return await _execute_instrumented(url, namespace, action, params,
+                                           transport, converters)
+
+    headers = minisoap.make_headers(namespace, action)
+    payload = minisoap.render_message(namespace, action, params)
+    response = await _post(url, payload, headers, transport)
+    return minisoap.handle_response(response, url, payload, headers,
+                                    converters)
+
+
+async def _post(url, payload, headers, transport):
+    if transport is None:
+        async with AsyncTransport() as temporary:
+            return await temporary.post(url, payload, headers)
+    return await transport.post(url, payload, headers)
+
+
+async def _execute_instrumented(url, namespace, action, params, transport,
+                                converters):
+    """
+    :py:func:`execute` with a :py:class:`fritzclient.instrument.Call`. The
+    connect and transfer phases are not told apart from waiting.
+    """
+    clock = instrument.clock
+    call = instrument.Call(url, namespace, action)
+    started = clock()
+    try:
+        headers = minisoap.make_headers(namespace, action)
+        payload = minisoap.render_message(namespace, action, params)
+        call.request_size = len(payload)
+        rendered = clock()
+        call.render = rendered - started
+
+        response = await _post(url, payload, headers, transport)
+        received = clock()
+        call.wait = received - rendered
+        call.status = response.status_code
+        call.response_size = len(response.content)
+        try:
+            return minisoap.handle_response(response, url, payload, headers,
+                                            converters)
+        finally:
+            call.parse = clock() - received
+    except Exception as exc:
+        call.failed(exc)
+        raise
+    finally:
+        call.total = clock() - started
+        instrument.notify(call)
+
+
+class AsyncProxyObject(model.ProxyObject):
+    """
+    Asynchronous counterpart of :py:class:`fritzclient.model.ProxyObject`.
+    The *transport* must be an :py:class:`AsyncTransport`. Lazy
+    :py:class:`fritzclient.model.ResponseValue` attributes and
+    :py:meth:`refresh` are not supported and raise
+    :py:exc:`NotImplementedError`.
+    """
+
+    async def _execute_action(self, action, params=None, converters=None):
+        LOG.info("Executing %r with params %r", action, params)
+
+        url = self._control_url()
+
+        return await execute(url, self.__class__.TYPE, action, params,
+                             transport=self._transport,
+                             converters=converters)
+
+    def _response(self, action):
+        raise NotImplementedError(
+            'Lazy response values are not supported by {}. Await '
+            '_execute_action({!r}) instead.'.format(
+                type(self).__name__, action))
+
+    def refresh(self):
+        raise NotImplementedError(
+            'refresh() is not supported by {}'.format(type(self).__name__))
+
+
+_PROXY_CLASSES = {}
+
+
+def proxy_class(service_type):
+    """
+    Return a generic :py:class:`AsyncProxyObject` subclass for
+    *service_type*.
+    """
+    cls = _PROXY_CLASSES.get(service_type)
+    if cls is None:
+        name = str(service_type.split(':')[-2].replace('-', '_'))
+        cls = type(name, (AsyncProxyObject,), {'TYPE': service_type})
+        _PROXY_CLASSES[service_type] = cls
+    return cls
+
+
+class AsyncRootDevice(model.RootDevice):
+    """
+    Asynchronous counterpart of :py:class:`fritzclient.model.RootDevice`,
+    returned by :py:func:`get_root_device`.
+
+    Its proxies must be :py:class:`AsyncProxyObject` subclasses, and
+    :py:meth:`execute` and :py:meth:`use_security_port` are coroutines.
+    The SCPD based :py:meth:`get_service` and :py:meth:`get_scpd` are not
+    supported and raise :py:exc:`NotImplementedError`.
+    """
+
+    def service(self, proxy_class, max_age=None):
+        if not issubclass(proxy_class, AsyncProxyObject):
+            raise TypeError('{} is not an AsyncProxyObject '
+                            'subclass'.format(proxy_class.__name__))
+        return super(AsyncRootDevice, self).service(proxy_class, max_age)
+
+    async def execute(self, service_type, action, params=None):
+        proxy = self.service(proxy_class(service_type))
+        return await proxy._execute_action(action, params)
+
+    async def use_security_port(self, port=None):
+        if port is None:
+            response = await self.execute(model.DeviceInfo.TYPE,
+                                          'GetSecurityPort')
+            port = response['NewSecurityPort']
+        return super(AsyncRootDevice, self).use_security_port(port)
+
+    def get_service(self, service_type):
+        raise NotImplementedError(
+            'get_service() is not supported by the asynchronous client')
+
+    def get_scpd(self, service_type):
+        raise NotImplementedError(
+            'get_scpd() is not supported by the asynchronous client')
+
+
+class EventStream(object):
+    """
+    An asynchronous iterator over the :py:class:`fritzclient.gena.Event`
+    notifications of one subscription. Create it with :py:func:`subscribe`.
+
+    Events are queued until they are consumed. Closing the stream cancels
+    the subscription and ends the iteration.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self, loop):
+        self.subscription = None
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def _put(self, event):
+        # Called in a thread of the event server.
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._queue.get()
+        if event is self._CLOSED:
+            self._queue.put_nowait(self._CLOSED)
+            raise StopAsyncIteration
+        return event
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Cancel the subscription and end the iteration.
+        """
+        if self.subscription is not None:
+            await self._loop.run_in_executor(None, self.subscription.cancel)
+            self.subscription = None
+        self._queue.put_nowait(self._CLOSED)
+
+
+async def subscribe(server, device, service_type, **kwargs):
+    """
+    Subscribe to the events of a service and return an
+    :py:class:`EventStream`. The (blocking) subscription request is sent in
+    a thread.
+
+    @param server: A :py:class:`fritzclient.gena.EventServer`.
+    @param device: A :py:class:`fritzclient.model.RootDevice`.
+    @param service_type: The service type URN.
+    @param kwargs: Passed on to
+                   :py:meth:`fritzclient.gena.EventServer.subscribe`.
+    """
+    loop = asyncio.get_running_loop()
+    stream = EventStream(loop)
+    stream.subscription = await loop.run_in_executor(
+        None, lambda: server.subscribe(device, service_type, stream._put,
+                                       **kwargs))
+    return stream
+
+
+async def get_root_device(location=None, transport=None):
+    """
+    Asynchronous counterpart of :py:func:`fritzclient.model.get_root_device`.
+    Returns an :py:class:`AsyncRootDevice`.
+
+    Service proxies of the returned device must be
+    :py:class:`AsyncProxyObject` subclasses. Without a *transport*, the
+    description is fetched over a temporary connection and the proxies open
+    a new connection per call.
+    """
+    if not location:
+        # No location given. Run the (blocking) SSDP discovery in a thread.
+        loop = asyncio.get_running_loop()
+        tr064_response = await loop.run_in_executor(None, tr064.discover)
+        location = tr064_response['location']
+
+    if transport is None:
+        async with AsyncTransport() as temporary:
+            response = await temporary.get(location)
+    else:
+        response = await transport.get(location)
+    return model.parse_tr064desc(location, response.content, transport,
+                                 device_class=AsyncRootDevice)
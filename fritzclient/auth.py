@@ -0,0 +1,145 @@
+"""
+HTTP digest authentication with nonce reuse.
+
+Protected TR-064 actions require digest authentication (RFC 2617). A client
+answering every request's challenge needs two round trips per action.
+:py:class:`DigestAuth` instead keeps the last nonce of each host and
+authorizes later requests up front with an incremented nonce count. A new
+challenge is only answered when the device reports the nonce as stale or
+replaces it.
+"""
+import hashlib
+import os
+import threading
+
+try:
+    from urlparse import urlsplit
+except ImportError:  # Python 3
+    from urllib.parse import urlsplit
+
+from requests.utils import parse_dict_header
+
+_HASHES = {
+    'MD5': hashlib.md5,
+    'MD5-SESS': hashlib.md5,
+    'SHA-256': hashlib.sha256,
+    'SHA-256-SESS': hashlib.sha256,
+}
+
+
+def _hash(func, value):
+    return func(value.encode('utf-8')).hexdigest()
+
+
+class _Challenge(object):
+    """
+    The digest parameters received from one host and the number of requests
+    authorized with its nonce so far.
+    """
+
+    def __init__(self, params):
+        self.realm = params.get('realm', '')
+        self.nonce = params.get('nonce', '')
+        self.opaque = params.get('opaque')
+        self.algorithm = params.get('algorithm', 'MD5').upper()
+        qops = [_.strip() for _ in params.get('qop', '').split(',')]
+        self.qop = 'auth' if 'auth' in qops else None
+        self.nonce_count = 0
+
+
+class DigestAuth(object):
+    """
+    Digest credentials shared by all connections of a
+    :py:class:`fritzclient.transport.Transport`. Instances are thread-safe.
+
+        username
+            The user name. FritzBoxes without users accept any name.
+
+        password
+            The password.
+    """
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+        self.challenges = 0
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def authorization(self, method, url):
+        """
+        Return the ``Authorization`` header for a request, or ``None`` if
+        the host of *url* has not sent a challenge yet.
+        """
+        parts = urlsplit(url)
+        with self._lock:
+            challenge = self._hosts.get(parts.netloc)
+            if challenge is None:
+                return None
+            challenge.nonce_count += 1
+            nonce_count = challenge.nonce_count
+
+        func = _HASHES[challenge.algorithm]
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        nc = '%08x' % nonce_count
+        cnonce = hashlib.sha1(os.urandom(16)).hexdigest()[:16]
+
+        ha1 = _hash(func, '%s:%s:%s' % (
+            self.username, challenge.realm, self.password))
+        if challenge.algorithm.endswith('-SESS'):
+            ha1 = _hash(func, '%s:%s:%s' % (ha1, challenge.nonce, cnonce))
+        ha2 = _hash(func, '%s:%s' % (method, path))
+        if challenge.qop:
+            response = _hash(func, '%s:%s:%s:%s:%s:%s' % (
+                ha1, challenge.nonce, nc, cnonce, challenge.qop, ha2))
+        else:
+            response = _hash(func, '%s:%s:%s' % (ha1, challenge.nonce, ha2))
+
+        fields = [
+            ('username', self.username),
+            ('realm', challenge.realm),
+            ('nonce', challenge.nonce),
+            ('uri', path),
+            ('response', response),
+            ('algorithm', challenge.algorithm),
+        ]
+        if challenge.opaque is not None:
+            fields.append(('opaque', challenge.opaque))
+        header = 'Digest ' + ', '.join('%s="%s"' % _ for _ in fields)
+        if challenge.qop:
+            header += ', qop=%s, nc=%s, cnonce="%s"' % (challenge.qop, nc,
+                                                        cnonce)
+        return header
+
+    def challenge(self, url, header, sent):
+        """
+        Remember the challenge of a ``401`` response and return ``True`` if
+        the request should be repeated with new credentials: if none were
+        sent, or if the nonce sent was stale or has been replaced. Challenges
+        with an unsupported algorithm are ignored and return ``False``.
+
+        @param url: The URL of the request.
+        @param header: The ``WWW-Authenticate`` header of the response.
+        @param sent: The ``Authorization`` header sent with the request, or
+                     ``None``.
+        """
+        if not header.lower().startswith('digest '):
+            return False
+        params = parse_dict_header(header[len('digest '):])
+        challenge = _Challenge(params)
+        if challenge.algorithm not in _HASHES:
+            return False
+        stale = params.get('stale', '').lower() == 'true'
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._hosts[host] = challenge
+            self.challenges += 1
+        if sent is None or stale:
+            return True
+        # Some devices replace an expired nonce without the stale flag. With
+        # the same nonce, the credentials themselves were rejected.
+        previous = parse_dict_header(sent[len('digest '):]).get('nonce')
+        return params.get('nonce') != previous
@@ -0,0 +1,346 @@
+"""
+Caches to avoid repeated requests to a device.
+
+:py:class:`DescriptionCache` is a persistent on-disk cache for device and
+service descriptions. :py:class:`ResultCache` is an in-memory cache for the
+results of read-only actions. :py:class:`DefinitionStore` shares parsed
+service descriptions between devices.
+
+
+Fetching ``tr64desc.xml`` and the SCPD documents of all services takes many
+requests to a slow embedded HTTP server. These documents only change with
+the firmware. :py:class:`DescriptionCache` stores them on disk, keyed by the
+device UDN and its software version.
+
+Layout of the cache directory::
+
+    index.json                  location -> [udn, software version]
+    <udn>/<version>/<document>  the raw documents
+"""
+from collections import OrderedDict
+import errno
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# os.rename does not replace existing files on Windows.
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _safe_name(value):
+    """
+    Turn *value* into something usable as file name.
+    """
+    return re.sub(r'[^A-Za-z0-9._-]', '_', str(value).lstrip('/')) or '_'
+
+
+class DescriptionCache(object):
+    """
+    Stores description documents below *directory*. The directory is
+    created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(directory)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as fptr:
+                return json.load(fptr)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, path, data):
+        """
+        Atomically replace the file at *path* with *data* (bytes).
+        """
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        fd, tmp_path = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as fptr:
+            fptr.write(data)
+        _replace(tmp_path, path)
+
+    def _document_path(self, udn, version, name):
+        return os.path.join(self.directory, _safe_name(udn),
+                            _safe_name(version), _safe_name(name))
+
+    def lookup(self, location):
+        """
+        Return the ``(udn, software_version)`` last seen at *location* or
+        ``None``.
+        """
+        entry = self._read_index().get(location)
+        return tuple(entry) if entry else None
+
+    def remember(self, location, udn, version):
+        """
+        Record that *location* serves the device *udn* running firmware
+        *version*. Documents of older versions of the device are removed.
+        """
+        with self._lock:
+            index = self._read_index()
+            index[location] = [udn, version]
+            self._write(self._index_path(),
+                        json.dumps(index, indent=2).encode('utf-8'))
+
+        device_dir = os.path.join(self.directory, _safe_name(udn))
+        if not os.path.isdir(device_dir):
+            return
+        for name in os.listdir(device_dir):
+            if name != _safe_name(version):
+                LOG.debug('Removing outdated descriptions %s of %s',
+                          name, udn)
+                shutil.rmtree(os.path.join(device_dir, name),
+                              ignore_errors=True)
+
+    def load(self, udn, version, name):
+        """
+        Return the cached document *name* (usually the URL path) as bytes or
+        ``None`` if it is not cached.
+        """
+        try:
+            with open(self._document_path(udn, version, name), 'rb') as fptr:
+                return fptr.read()
+        except (IOError, OSError):
+            return None
+
+    def store(self, udn, version, name, data):
+        """
+        Store the document *name* (usually the URL path).
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._write(self._document_path(udn, version, name), data)
+
+
+#: Prefixes of actions which modify the device. They are never cached.
+WRITE_PREFIXES = ('Set', 'Add', 'Delete')
+
+#: Seconds for which results of ``Get*`` actions are cached by default.
+DEFAULT_RESULT_TTL = 1.0
+
+#: Maximum number of results kept by a :py:class:`ResultCache`.
+DEFAULT_MAX_RESULTS = 256
+
+
+def _base_action_name(action):
+    """
+    Strip vendor prefixes like ``X_AVM-DE_`` from an action name.
+    """
+    return re.sub(r'^X_(AVM[-_]DE_)?', '', action)
+
+
+class _Call(object):
+    """
+    An action call which is currently in flight.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResultCache(object):
+    """
+    A bounded in-memory cache for results of read-only actions of one
+    device.
+
+    Results are kept for a per-action time-to-live. When the cache is full,
+    the least recently used result is evicted. Concurrent identical calls
+    are coalesced: only the first one is sent to the device, the others
+    wait for its result.
+
+    Actions starting with ``Set``, ``Add`` or ``Delete`` are never cached
+    and drop all cached results of their service. Other actions are cached
+    if they are listed in *ttls* or start with ``Get``.
+
+        ttls
+            A dictionary mapping action names to seconds.
+
+        default_ttl
+            Seconds for which results of other ``Get*`` actions are kept.
+            ``0`` disables caching of actions not listed in *ttls*.
+
+        max_results
+            The maximum number of cached results.
+    """
+
+    def __init__(self, ttls=None, default_ttl=DEFAULT_RESULT_TTL,
+                 max_results=DEFAULT_MAX_RESULTS, clock=time.time):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._clock = clock
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def ttl(self, action):
+        """
+        Return the number of seconds results of *action* are cached.
+        """
+        name = _base_action_name(action)
+        if name.startswith(WRITE_PREFIXES):
+            return 0
+        if action in self.ttls:
+            return self.ttls[action]
+        if name.startswith('Get'):
+            return self.default_ttl
+        return 0
+
+    def invalidate(self, url=None):
+        """
+        Drop cached results. If *url* is given, only the results of the
+        service with that control URL are dropped.
+        """
+        with self._lock:
+            if url is None:
+                self._results.clear()
+                return
+            for key in [_ for _ in self._results if _[0] == url]:
+                del self._results[key]
+
+    def call(self, url, action, params, func, converters=None):
+        """
+        Return the result of ``func()``, which executes *action* at the
+        control URL *url* with *params* and *converters*, from the cache if
+        possible. Results converted differently are cached separately.
+        """
+        ttl = self.ttl(action)
+        if ttl <= 0:
+            if _base_action_name(action).startswith(WRITE_PREFIXES):
+                self.invalidate(url)
+            return func()
+
+        key = (url, action, tuple(sorted((params or {}).items())),
+               frozenset((converters or {}).items()))
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is not None and entry[0] > self._clock():
+                self._results[key] = entry
+                self.hits += 1
+                return entry[1]
+            call = self._in_flight.get(key)
+            if call is None:
+                owner = True
+                call = self._in_flight[key] = _Call()
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as exc:
+            call.error = exc
+            raise
+        else:
+            with self._lock:
+                self._results[key] = (self._clock() + ttl, call.result)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result
+
+
+class DefinitionStore(object):
+    """
+    A process-wide store of parsed service descriptions, deduplicated by a
+    hash of the document contents.
+
+    Devices of the same model and firmware serve identical SCPD documents.
+    Each distinct document is parsed once and all services using it share
+    the resulting immutable definitions.
+
+        parse
+            A function parsing a document, like
+            :py:meth:`fritzclient.model.SCPD.parse`.
+
+    The counters ``hits`` and ``misses`` count lookups, ``bytes_saved`` the
+    size of the documents which did not need to be parsed again.
+    """
+
+    def __init__(self, parse):
+        self._parse = parse
+        self._definitions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self._definitions)
+
+    @property
+    def hit_rate(self):
+        """
+        The fraction of lookups served without parsing.
+        """
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def get(self, data):
+        """
+        Return the definitions parsed from the document *data*.
+
+        @param data: The document contents as bytes.
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        key = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            definition = self._definitions.get(key)
+            if definition is not None:
+                self.hits += 1
+                self.bytes_saved += len(data)
+                return definition
+            self.misses += 1
+
+        # Parse outside of the lock. If another thread parsed the same
+        # document meanwhile, its result is kept.
+        definition = self._parse(data)
+        with self._lock:
+            return self._definitions.setdefault(key, definition)
+
+    def clear(self):
+        """
+        Drop all definitions and reset the counters.
+        """
+        with self._lock:
+            self._definitions.clear()
+            self.hits = self.misses = self.bytes_saved = 0
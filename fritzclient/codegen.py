@@ -0,0 +1,173 @@
+"""
+Ahead-of-time generation of service proxies from SCPD documents.
+
+The generated module contains one :py:class:`fritzclient.model.ProxyObject`
+subclass per service type. Each action is a plain method with a fixed
+signature, a pre-rendered message template and a typed result converter.
+Importing the module registers the classes with
+:py:func:`fritzclient.model.register_proxy_class`, so
+:py:meth:`fritzclient.model.RootDevice.get_service` uses them instead of
+fetching and parsing the SCPD documents at runtime.
+
+Usage::
+
+    python -m fritzclient.codegen tr64desc.xml scpd-directory > proxies.py
+
+The device description maps the SCPD documents found in the directory to
+their service types.
+"""
+from __future__ import print_function
+
+import keyword
+import os
+import re
+import sys
+
+from fritzclient import datatypes, marshal
+from fritzclient.model import SCPD
+
+HEADER = '''"""
+Service proxies generated by fritzclient.codegen. Do not edit.
+"""
+from fritzclient import datatypes
+from fritzclient.minisoap import MessageTemplate
+from fritzclient.model import ProxyObject, register_proxy_class
+'''
+
+
+def identifier(name):
+    """
+    Turn *name* into a valid Python identifier.
+    """
+    result = re.sub(r'\W', '_', name)
+    if not result or result[0].isdigit() or keyword.iskeyword(result):
+        result = '_' + result
+    return result
+
+
+def class_name(service_type):
+    """
+    Return the class name for *service_type*, e.g. ``WLANConfiguration1``
+    for ``urn:dslforum-org:service:WLANConfiguration:1``.
+    """
+    parts = service_type.split(':')
+    return identifier(parts[-2] + parts[-1])
+
+
+def _converter_name(data_type):
+    return 'datatypes.' + datatypes.converter(data_type).__name__
+
+
+def generate_class(service_type, scpd, name=None):
+    """
+    Return the source of a proxy class for one service.
+
+    @param service_type: The service type URN.
+    @param scpd: The :py:class:`fritzclient.model.SCPD` of the service.
+    @param name: The class name. Defaults to :py:func:`class_name`.
+    """
+    name = name or class_name(service_type)
+    actions = sorted(scpd.actions.values(), key=lambda _: _.name)
+    lines = [
+        '',
+        '',
+        'class {}(ProxyObject):'.format(name),
+        '',
+        '    TYPE = {!r}'.format(service_type),
+        '    ACTIONS = (',
+    ]
+    lines.extend('        {!r},'.format(_.name) for _ in actions)
+    lines.append('    )')
+
+    methods = set()
+    for number, action in enumerate(actions):
+        method = identifier(action.name)
+        while method in methods:
+            method += '_'
+        methods.add(method)
+        in_names = [_.name for _ in action.in_arguments]
+        parameters = [identifier(_) for _ in in_names]
+        outputs = sorted((arg.name, _converter_name(arg.variable.data_type))
+                         for arg in action.out_arguments
+                         if arg.variable is not None)
+        template = '_TEMPLATE_{}'.format(number)
+        converters = '_CONVERTERS_{}'.format(number)
+
+        lines.append('')
+        lines.append('    {} = MessageTemplate('.format(template))
+        lines.append('        TYPE, {!r}, {!r})'.format(
+            action.name, tuple(in_names)))
+        if outputs:
+            lines.append('    {} = {{'.format(converters))
+            for out_name, converter in outputs:
+                lines.append('        {!r}: {},'.format(out_name, converter))
+            lines.append('    }')
+        else:
+            lines.append('    {} = {{}}'.format(converters))
+        lines.append('')
+        lines.append('    def {}({}):'.format(
+            method, ', '.join(['self'] + parameters)))
+        params = ', '.join('{!r}: {}'.format(original, parameter)
+                           for original, parameter
+                           in zip(in_names, parameters))
+        lines.append('        return self._execute_action(')
+        lines.append('            {!r}, {{{}}},'.format(action.name, params))
+        lines.append('            converters=self.{},'.format(converters))
+        lines.append('            template=self.{})'.format(template))
+    return '\n'.join(lines) + '\n'
+
+
+def generate(services):
+    """
+    Return the source of a module with proxy classes for *services*.
+
+    @param services: An iterable of ``(service_type, scpd_document)``
+                     tuples. The documents are bytes.
+    """
+    classes = []
+    names = set()
+    for service_type, document in sorted(services):
+        name = class_name(service_type)
+        while name in names:
+            name += '_'
+        names.add(name)
+        classes.append(generate_class(service_type, SCPD.parse(document),
+                                      name))
+
+    footer = ['', '', 'for _cls in (']
+    footer.extend('        {},'.format(_) for _ in sorted(names))
+    footer.append('):')
+    footer.append('    register_proxy_class(_cls)')
+    return HEADER + ''.join(classes) + '\n'.join(footer) + '\n'
+
+
+def services_from_directory(description, directory):
+    """
+    Yield ``(service_type, scpd_document)`` tuples for the services of the
+    device *description* whose SCPD documents are found in *directory*.
+
+    @param description: The ``tr64desc.xml`` document as bytes.
+    @param directory: A directory containing SCPD documents.
+    """
+    device = marshal.decode(description)
+    for service in device.iter_services():
+        path = os.path.join(directory, os.path.basename(service.scpdurl))
+        if os.path.exists(path):
+            with open(path, 'rb') as fptr:
+                yield service.service_type, fptr.read()
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if len(args) != 2:
+        print('Usage: python -m fritzclient.codegen '
+              '<tr64desc.xml> <scpd-directory>', file=sys.stderr)
+        return 1
+    with open(args[0], 'rb') as fptr:
+        description = fptr.read()
+    sys.stdout.write(generate(services_from_directory(description, args[1])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Conversion of UPnP state variable values to Python values.
+
+SCPD documents declare the data type of every state variable. The functions
+in this module convert the text of a SOAP response element into a native
+value of that type. Empty elements are converted to ``None``, except for
+strings which become ``''``.
+"""
+from datetime import datetime, timedelta, tzinfo
+import re
+
+
+class FixedOffset(tzinfo):
+    """
+    A time zone with a fixed offset in minutes east of UTC.
+    """
+
+    def __init__(self, minutes):
+        self._offset = timedelta(minutes=minutes)
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return timedelta(0)
+
+    def tzname(self, dt):
+        return None
+
+    def __repr__(self):
+        return 'FixedOffset({})'.format(
+            int(self._offset.total_seconds() // 60))
+
+
+_DATETIME = re.compile(
+    r'^(\d{4})-(\d\d)-(\d\d)(?:T(\d\d):(\d\d):(\d\d)(?:\.\d+)?)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+
+
+def to_string(text):
+    return text
+
+
+def to_int(text):
+    return int(text) if text.strip() else None
+
+
+def to_float(text):
+    return float(text) if text.strip() else None
+
+
+def to_boolean(text):
+    text = text.strip().lower()
+    if not text:
+        return None
+    if text in ('1', 'true', 'yes'):
+        return True
+    if text in ('0', 'false', 'no'):
+        return False
+    raise ValueError('Not a boolean: {!r}'.format(text))
+
+
+def to_datetime(text):
+    """
+    Convert an ISO 8601 date or date and time. If the value has a time zone
+    designator, the result is time zone aware.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    match = _DATETIME.match(text)
+    if not match:
+        raise ValueError('Not a dateTime: {!r}'.format(text))
+    fields = [int(_ or 0) for _ in match.groups()[:6]]
+    zone = match.group(7)
+    tz = None
+    if zone == 'Z':
+        tz = FixedOffset(0)
+    elif zone:
+        sign = -1 if zone[0] == '-' else 1
+        digits = zone[1:].replace(':', '')
+        tz = FixedOffset(sign * (int(digits[:2]) * 60 + int(digits[2:])))
+    return datetime(*fields, tzinfo=tz)
+
+
+def to_date(text):
+    """
+    Convert an ISO 8601 date. A time part, if given, is dropped.
+    """
+    value = to_datetime(text)
+    return value.date() if value is not None else None
+
+
+#: Converters for UPnP data types. Types which are not listed are kept as
+#: strings.
+CONVERTERS = {
+    'ui1': to_int,
+    'ui2': to_int,
+    'ui4': to_int,
+    'ui8': to_int,
+    'i1': to_int,
+    'i2': to_int,
+    'i4': to_int,
+    'i8': to_int,
+    'int': to_int,
+    'r4': to_float,
+    'r8': to_float,
+    'number': to_float,
+    'float': to_float,
+    'fixed.14.4': to_float,
+    'boolean': to_boolean,
+    'date': to_date,
+    'dateTime': to_datetime,
+    'dateTime.tz': to_datetime,
+}
+
+
+def converter(data_type):
+    """
+    Return the conversion function for a UPnP *data_type*.
+    """
+    return CONVERTERS.get(data_type, to_string)
@@ -0,0 +1,531 @@
+"""
+A Prometheus exporter for TR-064 devices.
+
+The exporter polls device information, WAN, DSL and WLAN counters and the
+number of known hosts of one or many devices with a
+:py:class:`fritzclient.scheduler.Scheduler`, and keeps the last answer of
+each action. A scrape of ``/metrics`` renders these answers and never waits
+for a device, so its latency does not depend on how slow the devices are.
+The exporter also reports how long each action took to collect.
+
+Run it with::
+
+    python -m fritzclient.exporter http://192.168.178.1:49000/tr64desc.xml
+
+The password is read from the ``FRITZCLIENT_PASSWORD`` environment variable.
+Both the Prometheus text format and OpenMetrics are served, depending on the
+``Accept`` header of the scrape.
+"""
+from __future__ import print_function
+
+import argparse
+from collections import namedtuple
+import logging
+import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as etree
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+try:
+    from urlparse import urlparse
+except ImportError:  # Python 3
+    from urllib.parse import urlparse
+
+from fritzclient import tr064
+from fritzclient.fleet import Fleet
+from fritzclient.scheduler import Scheduler
+
+LOG = logging.getLogger(__name__)
+
+#: The default port, as allocated for FritzBox exporters.
+DEFAULT_PORT = 9133
+
+#: The default number of seconds between two collections of an action.
+DEFAULT_INTERVAL = 30
+
+#: Seconds between attempts to load devices which could not be reached.
+RETRY_INTERVAL = 60
+
+TEXT_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+OPENMETRICS_CONTENT_TYPE = ('application/openmetrics-text; version=1.0.0; '
+                            'charset=utf-8')
+
+
+#: One metric read from an action response. *convert* turns the value of
+#: the output argument *argument* into a number. If *labels* is given, the
+#: value is always 1 and the labels are read from the output arguments
+#: instead, as ``(label, argument)`` pairs.
+Metric = namedtuple('Metric', 'name kind help argument convert labels')
+
+#: An action collected from every device offering *service_type*. *labels*
+#: are added to all of its metrics.
+Collection = namedtuple('Collection', 'service_type action metrics labels')
+
+
+def _metric(name, kind, help, argument=None, convert=float, labels=()):
+    return Metric(name, kind, help, argument, convert, labels)
+
+
+def _is_up(value):
+    return 1.0 if value == 'Up' else 0.0
+
+
+def _kilo(value):
+    return float(value) * 1000
+
+
+def _tenth(value):
+    return float(value) / 10
+
+
+DEVICE_INFO = 'urn:dslforum-org:service:DeviceInfo:1'
+WAN_COMMON = 'urn:dslforum-org:service:WANCommonInterfaceConfig:1'
+WAN_DSL = 'urn:dslforum-org:service:WANDSLInterfaceConfig:1'
+WLAN = 'urn:dslforum-org:service:WLANConfiguration:{}'
+HOSTS = 'urn:dslforum-org:service:Hosts:1'
+
+#: The actions collected from each device. Services a device does not offer
+#: are skipped.
+COLLECTIONS = (
+    Collection(DEVICE_INFO, 'GetInfo', (
+        _metric('fritzbox_info', 'gauge', 'Device information.', labels=(
+            ('model', 'NewModelName'),
+            ('serial', 'NewSerialNumber'),
+            ('software_version', 'NewSoftwareVersion'),
+            ('hardware_version', 'NewHardwareVersion'))),
+        _metric('fritzbox_uptime_seconds', 'gauge',
+                'Seconds since the device started.', 'NewUpTime'),
+    ), ()),
+    Collection(WAN_COMMON, 'GetCommonLinkProperties', (
+        _metric('fritzbox_wan_link_up', 'gauge',
+                'Whether the physical WAN link is up.',
+                'NewPhysicalLinkStatus', _is_up),
+        _metric('fritzbox_wan_max_upstream_bits_per_second', 'gauge',
+                'Maximum upstream rate of the WAN link.',
+                'NewLayer1UpstreamMaxBitRate'),
+        _metric('fritzbox_wan_max_downstream_bits_per_second', 'gauge',
+                'Maximum downstream rate of the WAN link.',
+                'NewLayer1DownstreamMaxBitRate'),
+    ), ()),
+    Collection(WAN_COMMON, 'GetTotalBytesSent', (
+        _metric('fritzbox_wan_sent_bytes_total', 'counter',
+                'Bytes sent on the WAN link. Wraps at 2^32.',
+                'NewTotalBytesSent'),
+    ), ()),
+    Collection(WAN_COMMON, 'GetTotalBytesReceived', (
+        _metric('fritzbox_wan_received_bytes_total', 'counter',
+                'Bytes received on the WAN link. Wraps at 2^32.',
+                'NewTotalBytesReceived'),
+    ), ()),
+    Collection(WAN_COMMON, 'GetTotalPacketsSent', (
+        _metric('fritzbox_wan_sent_packets_total', 'counter',
+                'Packets sent on the WAN link.', 'NewTotalPacketsSent'),
+    ), ()),
+    Collection(WAN_COMMON, 'GetTotalPacketsReceived', (
+        _metric('fritzbox_wan_received_packets_total', 'counter',
+                'Packets received on the WAN link.',
+                'NewTotalPacketsReceived'),
+    ), ()),
+    Collection(WAN_DSL, 'GetInfo', (
+        _metric('fritzbox_dsl_up', 'gauge', 'Whether the DSL link is up.',
+                'NewStatus', _is_up),
+        _metric('fritzbox_dsl_upstream_bits_per_second', 'gauge',
+                'Current upstream rate of the DSL link.',
+                'NewUpstreamCurrRate', _kilo),
+        _metric('fritzbox_dsl_downstream_bits_per_second', 'gauge',
+                'Current downstream rate of the DSL link.',
+                'NewDownstreamCurrRate', _kilo),
+        _metric('fritzbox_dsl_max_upstream_bits_per_second', 'gauge',
+                'Attainable upstream rate of the DSL link.',
+                'NewUpstreamMaxRate', _kilo),
+        _metric('fritzbox_dsl_max_downstream_bits_per_second', 'gauge',
+                'Attainable downstream rate of the DSL link.',
+                'NewDownstreamMaxRate', _kilo),
+        _metric('fritzbox_dsl_upstream_noise_margin_db', 'gauge',
+                'Upstream noise margin of the DSL link.',
+                'NewUpstreamNoiseMargin', _tenth),
+        _metric('fritzbox_dsl_downstream_noise_margin_db', 'gauge',
+                'Downstream noise margin of the DSL link.',
+                'NewDownstreamNoiseMargin', _tenth),
+        _metric('fritzbox_dsl_upstream_attenuation_db', 'gauge',
+                'Upstream attenuation of the DSL link.',
+                'NewUpstreamAttenuation', _tenth),
+        _metric('fritzbox_dsl_downstream_attenuation_db', 'gauge',
+                'Downstream attenuation of the DSL link.',
+                'NewDownstreamAttenuation', _tenth),
+    ), ()),
+    Collection(WAN_DSL, 'GetStatisticsTotal', (
+        _metric('fritzbox_dsl_crc_errors_total', 'counter',
+                'CRC errors on the DSL link.', 'NewCRCErrors'),
+        _metric('fritzbox_dsl_fec_errors_total', 'counter',
+                'FEC errors on the DSL link.', 'NewFECErrors'),
+        _metric('fritzbox_dsl_errored_seconds_total', 'counter',
+                'Errored seconds of the DSL link.', 'NewErroredSecs'),
+        _metric('fritzbox_dsl_severely_errored_seconds_total', 'counter',
+                'Severely errored seconds of the DSL link.',
+                'NewSeverelyErroredSecs'),
+    ), ()),
+    Collection(HOSTS, 'GetHostNumberOfEntries', (
+        _metric('fritzbox_hosts', 'gauge',
+                'Number of entries in the host table.',
+                'NewHostNumberOfEntries'),
+    ), ()),
+)
+
+# One WLAN service per band and the guest network.
+COLLECTIONS += tuple(
+    collection
+    for number in ('1', '2', '3')
+    for collection in (
+        Collection(WLAN.format(number), 'GetInfo', (
+            _metric('fritzbox_wlan_up', 'gauge',
+                    'Whether the WLAN is up.', 'NewStatus', _is_up),
+            _metric('fritzbox_wlan_channel', 'gauge',
+                    'The channel of the WLAN.', 'NewChannel'),
+        ), (('wlan', number),)),
+        Collection(WLAN.format(number), 'GetTotalAssociations', (
+            _metric('fritzbox_wlan_associations', 'gauge',
+                    'Number of associated stations.',
+                    'NewTotalAssociations'),
+        ), (('wlan', number),)),
+        Collection(WLAN.format(number), 'GetStatistics', (
+            _metric('fritzbox_wlan_sent_packets_total', 'counter',
+                    'Packets sent on the WLAN.', 'NewTotalPacketsSent'),
+            _metric('fritzbox_wlan_received_packets_total', 'counter',
+                    'Packets received on the WLAN.',
+                    'NewTotalPacketsReceived'),
+        ), (('wlan', number),)),
+    ))
+
+
+def _escape(value):
+    return (value.replace('\\', r'\\').replace('\n', r'\n')
+            .replace('"', r'\"'))
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join('{}="{}"'.format(key, _escape(u'%s' % val))
+                               for key, val in labels) + '}'
+    return '{} {!r}\n'.format(name, float(value))
+
+
+def _action_converters(service, action):
+    """
+    Return the converters of *action* as declared in the SCPD document, or
+    ``None`` if *service* does not offer it.
+
+    @param service: A :py:class:`fritzclient.model.Service` or a proxy
+                    generated by :py:mod:`fritzclient.codegen`.
+    """
+    names = getattr(service, 'ACTIONS', None)
+    if names is not None:
+        if action not in names:
+            return None
+        return getattr(service,
+                       '_CONVERTERS_{}'.format(names.index(action)), None)
+    action = service.actions.get(action)
+    return action.converters if action is not None else None
+
+
+def _short_type(service_type):
+    """
+    Return ``WANCommonInterfaceConfig:1`` for a service type URN.
+    """
+    return ':'.join(service_type.split(':')[-2:])
+
+
+class _Entry(object):
+    """
+    The collected state of one action of one device.
+    """
+
+    def __init__(self, job, collection, labels):
+        self.job = job
+        self.collection = collection
+        self.labels = labels
+        #: The last response or ``None`` if the last collection failed.
+        self.values = None
+        self.duration_sum = 0.0
+        self.count = 0
+
+
+class Exporter(object):
+    """
+    Collects metrics of TR-064 devices in the background and renders the
+    latest values on request.
+
+        interval
+            Seconds between two collections of an action.
+
+        workers
+            The number of worker threads of the scheduler.
+
+        jitter
+            See :py:class:`fritzclient.scheduler.Scheduler`.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, workers=8, jitter=1.0):
+        self.interval = interval
+        self._scheduler = Scheduler(workers=workers, jitter=jitter)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(set(_.job.device for _ in list(self._entries.values())))
+
+    def add(self, device):
+        """
+        Start collecting the metrics of a device. Its samples are labelled
+        with the host and port of its location. The responses are converted
+        to the data types declared in the SCPD documents of the device, if
+        these can be loaded.
+
+        @param device: A :py:class:`fritzclient.model.RootDevice`.
+        """
+        services = {}
+        for collection in COLLECTIONS:
+            service_type = collection.service_type
+            if service_type not in device.control_urls:
+                continue
+            if service_type not in services:
+                try:
+                    services[service_type] = device.get_service(service_type)
+                except Exception as exc:
+                    LOG.debug('No SCPD document for %s: %s', service_type,
+                              exc)
+                    services[service_type] = None
+            service = services[service_type]
+            converters = (_action_converters(service, collection.action)
+                          if service is not None else None)
+            job = self._scheduler.add(device, service_type,
+                                      collection.action, self.interval,
+                                      callback=self._update,
+                                      converters=converters)
+            labels = ((('device', urlparse(device.location).netloc),) +
+                      collection.labels)
+            with self._lock:
+                self._entries[job] = _Entry(job, collection, labels)
+
+    def remove(self, device):
+        """
+        Stop collecting the metrics of a device.
+        """
+        with self._lock:
+            entries = [_ for _ in self._entries.values()
+                       if _.job.device is device]
+            for entry in entries:
+                del self._entries[entry.job]
+        for entry in entries:
+            self._scheduler.remove(entry.job)
+
+    def _update(self, result):
+        with self._lock:
+            entry = self._entries.get(result.item)
+            if entry is None:
+                return
+            entry.values = result.value if result.error is None else None
+            entry.duration_sum += result.item.duration
+            entry.count += 1
+
+    def render(self, openmetrics=False):
+        """
+        Return the collected metrics in the Prometheus text format, or in
+        the OpenMetrics format if *openmetrics* is true. No request is sent
+        to any device.
+        """
+        families = {}
+        up = {}
+        collect = []
+        with self._lock:
+            for entry in self._entries.values():
+                job = entry.job
+                host = entry.labels[0][1]
+                up[host] = up.get(host, False) or entry.values is not None
+                action_labels = (entry.labels[0],
+                                 ('service', _short_type(job.service_type)),
+                                 ('action', job.action))
+                collect.append((action_labels, entry.duration_sum,
+                                entry.count, job.errors, job.overruns))
+                if entry.values is None:
+                    continue
+                for metric in entry.collection.metrics:
+                    sample = self._sample(metric, entry)
+                    if sample is not None:
+                        families.setdefault(metric.name, []).append(sample)
+
+        lines = []
+
+        def family(name, kind, help, samples):
+            if openmetrics and kind == 'counter':
+                name = name[:-len('_total')]
+            lines.append('# HELP {} {}\n'.format(name, help))
+            lines.append('# TYPE {} {}\n'.format(name, kind))
+            lines.extend(samples)
+
+        seen = set()
+        for collection in COLLECTIONS:
+            for metric in collection.metrics:
+                if metric.name in families and metric.name not in seen:
+                    seen.add(metric.name)
+                    family(metric.name, metric.kind, metric.help,
+                           sorted(families[metric.name]))
+
+        family('fritzbox_up', 'gauge',
+               'Whether the last collection of any action succeeded.',
+               [_sample('fritzbox_up', (('device', host),), value)
+                for host, value in sorted(up.items())])
+        collect.sort()
+        name = 'fritzbox_exporter_collect_duration_seconds'
+        family(name, 'summary', 'Seconds taken to collect an action.',
+               [_sample(name + suffix, labels, value)
+                for labels, total, count, _, _ in collect
+                for suffix, value in (('_sum', total), ('_count', count))])
+        name = 'fritzbox_exporter_collect_errors_total'
+        family(name, 'counter', 'Failed collections of an action.',
+               [_sample(name, _[0], _[3]) for _ in collect])
+        name = 'fritzbox_exporter_collect_overruns_total'
+        family(name, 'counter',
+               'Collections skipped because the previous one was still '
+               'in flight.',
+               [_sample(name, _[0], _[4]) for _ in collect])
+        if openmetrics:
+            lines.append('# EOF\n')
+        return ''.join(lines)
+
+    @staticmethod
+    def _sample(metric, entry):
+        values = entry.values
+
+        def value_of(argument):
+            # Without converters, empty elements are returned as elements.
+            value = values.get(argument)
+            return None if etree.iselement(value) else value
+
+        if metric.labels:
+            labels = entry.labels + tuple(
+                (label, value_of(argument) or '')
+                for label, argument in metric.labels)
+            return _sample(metric.name, labels, 1)
+        value = value_of(metric.argument)
+        if value is None:
+            return None
+        try:
+            return _sample(metric.name, entry.labels, metric.convert(value))
+        except (TypeError, ValueError):
+            LOG.debug('Unable to convert %s=%r', metric.argument, value)
+            return None
+
+    def serve(self, host='', port=DEFAULT_PORT):
+        """
+        Serve ``/metrics`` in a background thread and return the bound port.
+        """
+        self._httpd = _HTTPServer((host, port), _MetricsHandler)
+        self._httpd.exporter = self
+        thread = threading.Thread(target=self._httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self._httpd.server_address[1]
+
+    def close(self):
+        """
+        Stop collecting and serving.
+        """
+        self._scheduler.close()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        openmetrics = ('application/openmetrics-text' in
+                       self.headers.get('accept', ''))
+        body = self.server.exporter.render(openmetrics).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE
+                         if openmetrics else TEXT_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOG.debug(format, *args)
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m fritzclient.exporter',
+        description='Export metrics of TR-064 devices to Prometheus.')
+    parser.add_argument('locations', nargs='*', metavar='location',
+                        help='URL of a tr64desc.xml document. Discovered '
+                             'with SSDP if not given.')
+    parser.add_argument('--host', default='',
+                        help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='Seconds between two collections.')
+    parser.add_argument('--username', default=None)
+    parser.add_argument('--secure', action='store_true',
+                        help='Send actions over HTTPS.')
+    options = parser.parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+
+    pending = options.locations or [tr064.discover()['location']]
+    fleet = Fleet(username=options.username,
+                  password=os.environ.get('FRITZCLIENT_PASSWORD'))
+    exporter = Exporter(options.interval)
+    port = exporter.serve(options.host, options.port)
+    print('Serving metrics on port {}'.format(port), file=sys.stderr)
+    try:
+        while True:
+            failed = []
+            for result in fleet.add_all(pending):
+                try:
+                    if result.error is not None:
+                        raise result.error
+                    if options.secure:
+                        result.value.use_security_port()
+                except Exception as exc:
+                    LOG.warning('Unable to load %s: %s', result.item, exc)
+                    failed.append(result.item)
+                else:
+                    exporter.add(result.value)
+            pending = failed
+            time.sleep(RETRY_INTERVAL)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        exporter.close()
+        fleet.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Manage many TR-064 devices from one process.
+
+A :py:class:`Fleet` keeps a registry of devices and shares connection pools,
+caches and concurrency limits between them. Actions can be run on all
+devices in parallel with :py:meth:`Fleet.map`, and
+:py:meth:`Fleet.subscribe` receives the events of all devices with one
+shared :py:class:`fritzclient.gena.EventServer`.
+"""
+from collections import namedtuple
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:  # Python 3
+    import queue
+
+try:
+    from urlparse import urlparse
+except ImportError:  # Python 3
+    from urllib.parse import urlparse
+
+from fritzclient.cache import ResultCache
+from fritzclient.gena import EventServer
+from fritzclient.model import get_root_device
+from fritzclient.transport import Transport
+
+LOG = logging.getLogger(__name__)
+
+#: Maximum number of requests in flight for the whole fleet.
+DEFAULT_MAX_WORKERS = 32
+
+#: Maximum number of requests in flight per host.
+DEFAULT_PER_HOST = 2
+
+
+#: The outcome of running a function on one item of a fleet. Exactly one of
+#: *value* and *error* is set.
+Result = namedtuple('Result', 'item value error')
+
+
+class Fleet(object):
+    """
+    A registry of devices sharing connection pools and caches.
+
+        max_workers
+            The maximum number of requests in flight for the whole fleet.
+
+        per_host
+            The maximum number of requests in flight per host. This is also
+            the size of the connection pool kept for each host.
+
+        cache
+            An optional :py:class:`fritzclient.cache.DescriptionCache`
+            shared by all devices.
+
+        result_ttls
+            If given, each device gets a
+            :py:class:`fritzclient.cache.ResultCache` using these TTLs.
+
+        transport_options
+            Additional keyword arguments for each
+            :py:class:`fritzclient.transport.Transport`.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS,
+                 per_host=DEFAULT_PER_HOST, cache=None, result_ttls=None,
+                 **transport_options):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.cache = cache
+        self.result_ttls = result_ttls
+        self._transport_options = transport_options
+        self._global_limit = threading.BoundedSemaphore(max_workers)
+        self._host_limits = {}
+        self._transports = {}
+        self._by_location = {}
+        self._by_udn = {}
+        self._event_server = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._by_location)
+
+    def __iter__(self):
+        return iter(list(self._by_location.values()))
+
+    def __getitem__(self, key):
+        """
+        Return a device by location or UDN.
+        """
+        with self._lock:
+            if key in self._by_location:
+                return self._by_location[key]
+            return self._by_udn[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._by_location or key in self._by_udn
+
+    def _host_limit(self, host):
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.per_host)
+            return self._host_limits[host]
+
+    def transport(self, location):
+        """
+        Return the shared transport for the host of *location*.
+        """
+        host = urlparse(location).netloc
+        with self._lock:
+            if host not in self._transports:
+                self._transports[host] = Transport(
+                    pool_size=self.per_host, **self._transport_options)
+            return self._transports[host]
+
+    def add(self, location):
+        """
+        Register the device at *location* and return it. Adding a location
+        which is already registered returns the existing device.
+        """
+        with self._lock:
+            if location in self._by_location:
+                return self._by_location[location]
+
+        result_cache = None
+        if self.result_ttls is not None:
+            result_cache = ResultCache(self.result_ttls)
+        device = get_root_device(location,
+                                 transport=self.transport(location),
+                                 cache=self.cache,
+                                 result_cache=result_cache)
+        with self._lock:
+            self._by_location[location] = device
+            self._by_udn[device.udn] = device
+        return device
+
+    def add_all(self, locations):
+        """
+        Register many devices in parallel. This is a generator yielding a
+        :py:class:`Result` per location as soon as it is registered.
+        """
+        return self._run(self.add, locations, lambda _: _)
+
+    def remove(self, key):
+        """
+        Remove a device by location or UDN.
+        """
+        device = self[key]
+        with self._lock:
+            del self._by_location[device.location]
+            del self._by_udn[device.udn]
+
+    def map(self, action, devices=None, service_type=None, params=None):
+        """
+        Run *action* on many devices in parallel.
+
+        This is a generator yielding a :py:class:`Result` per device as soon
+        as the action completes on that device, in no particular order.
+        Failures are reported in the result instead of being raised.
+
+        @param action: Either a callable taking a
+                       :py:class:`fritzclient.model.RootDevice`, or the
+                       name of a TR-064 action of *service_type*.
+        @param devices: The devices to run on. Defaults to all devices.
+        @param service_type: The service type URN if *action* is a name.
+        @param params: An optional dictionary of action parameters if
+                       *action* is a name.
+        """
+        if callable(action):
+            func = action
+        else:
+            def func(device):
+                return device.execute(service_type, action, params)
+        if devices is None:
+            devices = list(self)
+        return self._run(func, devices, lambda _: _.location)
+
+    @property
+    def event_server(self):
+        """
+        The :py:class:`fritzclient.gena.EventServer` shared by all
+        subscriptions of the fleet. It is started on first use.
+        """
+        with self._lock:
+            if self._event_server is None:
+                self._event_server = EventServer()
+            return self._event_server
+
+    def subscribe(self, service_type, callback, devices=None, **kwargs):
+        """
+        Subscribe to the events of a service on many devices in parallel.
+
+        This is a generator yielding a :py:class:`Result` per device with
+        the :py:class:`fritzclient.gena.Subscription` as value. The
+        subscriptions are renewed until they are cancelled or the fleet is
+        closed.
+
+        @param service_type: The service type URN.
+        @param callback: Called with each :py:class:`fritzclient.gena.Event`
+                         of any device.
+        @param devices: The devices to subscribe on. Defaults to all devices.
+        @param kwargs: Passed on to
+                       :py:meth:`fritzclient.gena.EventServer.subscribe`.
+        """
+        server = self.event_server
+
+        def func(device):
+            return server.subscribe(device, service_type, callback, **kwargs)
+        if devices is None:
+            devices = list(self)
+        return self._run(func, devices, lambda _: _.location)
+
+    def _run(self, func, items, location_of):
+        """
+        Call *func* on all *items* in worker threads, respecting the global
+        and per-host limits, and yield :py:class:`Result` objects as they
+        complete.
+        """
+        items = list(items)
+        if not items:
+            return
+        tasks = queue.Queue()
+        results = queue.Queue()
+        for item in items:
+            tasks.put(item)
+
+        def worker():
+            while True:
+                try:
+                    item = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                host = urlparse(location_of(item)).hostname
+                with self._host_limit(host), self._global_limit:
+                    try:
+                        value = func(item)
+                    except Exception as exc:
+                        LOG.debug('Failed on %r: %s', item, exc)
+                        results.put(Result(item, None, exc))
+                    else:
+                        results.put(Result(item, value, None))
+
+        for _ in range(min(self.max_workers, len(items))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for _ in range(len(items)):
+            yield results.get()
+
+    def close(self):
+        """
+        Cancel all event subscriptions and close all connection pools.
+        """
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            event_server, self._event_server = self._event_server, None
+        if event_server is not None:
+            event_server.close()
+        for transport in transports:
+            transport.close()
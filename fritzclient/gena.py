@@ -0,0 +1,420 @@
+"""
+UPnP event subscriptions (GENA).
+
+Instead of polling status variables, a client can ``SUBSCRIBE`` to the
+evented state variables of a service. The device then sends a ``NOTIFY``
+request with a ``propertyset`` to a callback URL whenever one of them
+changes.
+
+An :py:class:`EventServer` is a small HTTP server in a background thread
+which receives these notifications for any number of subscriptions and
+devices. It also renews each subscription before it times out::
+
+    with EventServer() as server:
+        server.subscribe(device, 'urn:dslforum-org:service:Hosts:1', print)
+        ...
+
+The callback is called with an :py:class:`Event` in a thread of the server.
+See :py:func:`fritzclient.aio.subscribe` for an asynchronous iterator.
+"""
+import binascii
+from collections import namedtuple
+import logging
+import os
+import socket
+import threading
+import time
+import xml.etree.ElementTree as etree
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit
+except ImportError:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit
+
+import requests
+
+LOG = logging.getLogger(__name__)
+
+#: The subscription duration requested from the device, in seconds.
+DEFAULT_TIMEOUT = 1800
+
+#: Subscriptions are renewed this many seconds before they expire. Short
+#: subscriptions are renewed after half of their duration.
+RENEW_MARGIN = 60
+
+#: Seconds to wait before a failed renewal is retried.
+RETRY_DELAY = 30
+
+#: The largest event sequence number. The next one wraps to 1.
+MAX_SEQ = 4294967295
+
+EVENT_NS = '{urn:schemas-upnp-org:event-1-0}'
+
+
+class GENAError(Exception):
+    """
+    A subscription request was rejected by the device.
+    """
+
+
+#: One notification of a subscription. *changes* maps the names of the
+#: changed state variables to their values.
+Event = namedtuple('Event', 'subscription seq changes')
+
+
+def parse_propertyset(data, converters=None):
+    """
+    Return a dictionary of the state variables in a ``propertyset``.
+
+    @param data: The notification body as bytes.
+    @param converters: An optional dictionary of conversion functions by
+                       variable name. Other values are kept as strings.
+    """
+    converters = converters or {}
+    changes = {}
+    root = etree.fromstring(data)
+    for prop in root.iter(EVENT_NS + 'property'):
+        for element in prop:
+            name = element.tag.rsplit('}', 1)[-1]
+            text = element.text or ''
+            func = converters.get(name)
+            changes[name] = func(text) if func else text
+    return changes
+
+
+def parse_timeout(header, default=DEFAULT_TIMEOUT):
+    """
+    Return the seconds of a ``TIMEOUT`` header like ``Second-1800``.
+    ``Second-infinite`` and missing or invalid values give *default*.
+    """
+    value = (header or '').strip().lower()
+    if value.startswith('second-'):
+        value = value[len('second-'):]
+        if value.isdigit():
+            return int(value)
+    return default
+
+
+def local_address(host, port=80):
+    """
+    Return the local IP address used to reach *host*. No packet is sent.
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.connect((host, port))
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+class Subscription(object):
+    """
+    A subscription to the events of one service of a device. Instances are
+    created by :py:meth:`EventServer.subscribe`.
+
+        device
+            The :py:class:`fritzclient.model.RootDevice`.
+
+        service_type
+            The service type URN.
+
+        sid
+            The subscription identifier assigned by the device.
+
+        expires
+            The time (as returned by :py:func:`time.time`) at which the
+            device drops the subscription unless it is renewed.
+
+        values
+            The last known value of each evented variable.
+    """
+
+    def __init__(self, server, device, service_type, callback,
+                 timeout=DEFAULT_TIMEOUT, converters=None):
+        self.device = device
+        self.service_type = service_type
+        self.callback = callback
+        self.timeout = timeout
+        self.converters = converters
+        self.url = device.event_url(service_type)
+        self.token = binascii.hexlify(os.urandom(8)).decode('ascii')
+        self.sid = None
+        self.expires = None
+        self.duration = timeout
+        self.retry_at = None
+        self.seq = None
+        self.values = {}
+        self._server = server
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Subscription {} {} {}>'.format(
+            self.device.location, self.service_type, self.sid)
+
+    def _send(self, method, headers):
+        transport = self._server.transport
+        if transport is not None:
+            return transport.request(method, self.url, headers=headers)
+        return requests.request(method, self.url, headers=headers)
+
+    def _accept(self, response):
+        if response.status_code != 200:
+            raise GENAError('{} {} for {}'.format(
+                response.status_code, response.reason, self.url))
+        self.sid = response.headers.get('sid', self.sid)
+        timeout = parse_timeout(response.headers.get('timeout'),
+                                self.timeout)
+        self.duration = timeout
+        self.expires = time.time() + timeout
+
+    def subscribe(self):
+        """
+        Send a new ``SUBSCRIBE`` request.
+        """
+        callback = self._server.callback_url(self)
+        response = self._send('SUBSCRIBE', {
+            'CALLBACK': '<{}>'.format(callback),
+            'NT': 'upnp:event',
+            'TIMEOUT': 'Second-{}'.format(self.timeout),
+        })
+        with self._lock:
+            self.seq = None
+            self.retry_at = None
+            self._accept(response)
+        LOG.debug('Subscribed %r', self)
+
+    def renew(self):
+        """
+        Renew the subscription. If it has expired or the device does not
+        know it any more, a new subscription is made.
+        """
+        if self.sid is None or time.time() >= self.expires:
+            self.subscribe()
+            return
+        response = self._send('SUBSCRIBE', {
+            'SID': self.sid,
+            'TIMEOUT': 'Second-{}'.format(self.timeout),
+        })
+        if response.status_code == 412:
+            LOG.info('Subscription %r was lost, subscribing again', self)
+            self.subscribe()
+            return
+        with self._lock:
+            self.retry_at = None
+            self._accept(response)
+        LOG.debug('Renewed %r', self)
+
+    def cancel(self):
+        """
+        Cancel the subscription.
+        """
+        self._server._remove(self)
+        if self.sid is None:
+            return
+        try:
+            self._send('UNSUBSCRIBE', {'SID': self.sid})
+        except requests.RequestException as exc:
+            LOG.debug('Unable to unsubscribe %r: %s', self, exc)
+        self.sid = None
+
+    def renew_at(self):
+        """
+        Return the time at which the subscription should be renewed.
+        """
+        margin = min(RENEW_MARGIN, self.duration / 2.0)
+        return max(self.expires - margin, self.retry_at or 0)
+
+    def notify(self, seq, data):
+        """
+        Handle a notification and call the callback. Notifications older
+        than the last one are dropped.
+        """
+        with self._lock:
+            if self.seq is not None and seq != 0:
+                expected = 1 if self.seq == MAX_SEQ else self.seq + 1
+                if 0 <= self.seq - seq < MAX_SEQ // 2:
+                    LOG.debug('Dropping stale event %d of %r', seq, self)
+                    return
+                if seq != expected:
+                    LOG.info('Missed events before %d of %r', seq, self)
+            self.seq = seq
+            changes = parse_propertyset(data, self.converters)
+            self.values.update(changes)
+        self.callback(Event(self, seq, changes))
+
+
+class _NotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_NOTIFY(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        subscription = self.server.owner._lookup(self.path.strip('/'))
+        sid = self.headers.get('sid')
+        if subscription is None or (subscription.sid is not None and
+                                    sid != subscription.sid):
+            self.send_response(412)
+        else:
+            try:
+                subscription.notify(int(self.headers.get('seq', 0)), body)
+            except Exception:
+                LOG.exception('Unable to handle event for %r', subscription)
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        LOG.debug(format, *args)
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EventServer(object):
+    """
+    Receives event notifications for many subscriptions and renews them.
+
+        host
+            The local address to listen on. Defaults to all addresses.
+
+        port
+            The local port. Defaults to a free port.
+
+        callback_host
+            The address devices should send notifications to. Defaults to
+            the local address used to reach each device.
+
+        transport
+            An optional :py:class:`fritzclient.transport.Transport` for the
+            subscription requests. The transports of the devices are not
+            used, as they may be asynchronous.
+    """
+
+    def __init__(self, host='', port=0, callback_host=None, transport=None):
+        self.callback_host = callback_host
+        self.transport = transport
+        self._httpd = _HTTPServer((host, port), _NotifyHandler)
+        self._httpd.owner = self
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever),
+            threading.Thread(target=self._renew_loop),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def callback_url(self, subscription):
+        """
+        Return the callback URL of *subscription*.
+        """
+        host = self.callback_host or local_address(
+            urlsplit(subscription.url).hostname)
+        if ':' in host:
+            host = '[{}]'.format(host)
+        return 'http://{}:{}/{}'.format(host, self.port, subscription.token)
+
+    def subscribe(self, device, service_type, callback,
+                  timeout=DEFAULT_TIMEOUT, converters=None):
+        """
+        Subscribe to the events of a service and return the
+        :py:class:`Subscription`.
+
+        @param device: A :py:class:`fritzclient.model.RootDevice`.
+        @param service_type: The service type URN.
+        @param callback: Called with an :py:class:`Event` for every
+                         notification.
+        @param timeout: The requested subscription duration in seconds.
+        @param converters: An optional dictionary of conversion functions by
+                           variable name, e.g. from
+                           :py:attr:`fritzclient.model.Service.event_converters`.
+        @raises GENAError: If the device rejected the subscription.
+        """
+        subscription = Subscription(self, device, service_type, callback,
+                                    timeout, converters)
+        with self._lock:
+            self._subscriptions[subscription.token] = subscription
+        try:
+            subscription.subscribe()
+        except Exception:
+            self._remove(subscription)
+            raise
+        with self._lock:
+            self._wakeup.notify()
+        return subscription
+
+    def _lookup(self, token):
+        with self._lock:
+            return self._subscriptions.get(token)
+
+    def _remove(self, subscription):
+        with self._lock:
+            self._subscriptions.pop(subscription.token, None)
+
+    def _due(self):
+        """
+        Return the subscriptions due for renewal and the seconds until the
+        next one is due.
+        """
+        now = time.time()
+        due = []
+        wait = None
+        for subscription in self._subscriptions.values():
+            if subscription.expires is None:
+                continue
+            remaining = subscription.renew_at() - now
+            if remaining <= 0:
+                due.append(subscription)
+            elif wait is None or remaining < wait:
+                wait = remaining
+        return due, wait
+
+    def _renew_loop(self):
+        while True:
+            with self._lock:
+                due, wait = self._due()
+                if not due:
+                    self._wakeup.wait(wait)
+                if not self._running:
+                    return
+            for subscription in due:
+                try:
+                    subscription.renew()
+                except Exception as exc:
+                    LOG.warning('Unable to renew %r: %s', subscription, exc)
+                    subscription.retry_at = time.time() + RETRY_DELAY
+
+    def close(self):
+        """
+        Cancel all subscriptions and stop the server.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.values())
+        for subscription in subscriptions:
+            subscription.cancel()
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+        self._httpd.shutdown()
+        self._httpd.server_close()
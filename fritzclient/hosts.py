@@ -0,0 +1,257 @@
+"""
+Listing the hosts known to a device.
+
+The ``Hosts`` service only offers the host table one entry at a time:
+``GetHostNumberOfEntries`` followed by ``GetGenericHostEntry`` per index.
+Sent one after another, a table of 150 hosts takes seconds.
+:py:meth:`Hosts.hosts` keeps up to *window* of these requests in flight and
+yields the entries as they arrive. If the device offers a host list
+document (``X_AVM-DE_GetHostListPath``), the whole table is downloaded with
+a single request instead.
+
+The proxy is not registered for its service type; get one with
+``device.service(Hosts)``.
+"""
+from collections import namedtuple
+import logging
+import threading
+import xml.etree.ElementTree as etree
+
+try:
+    import Queue as queue
+except ImportError:  # Python 3
+    import queue
+
+try:
+    from urlparse import urljoin, urlunparse
+except ImportError:  # Python 3
+    from urllib.parse import urljoin, urlunparse
+
+import requests
+
+from fritzclient import datatypes, minisoap
+from fritzclient.minisoap import SOAPError
+from fritzclient.model import ProxyObject
+
+LOG = logging.getLogger(__name__)
+
+#: The default number of ``GetGenericHostEntry`` requests in flight.
+DEFAULT_WINDOW = 8
+
+#: UPnP error code of an index beyond the end of the table.
+INVALID_INDEX = '713'
+
+#: The number of passes over a table which keeps changing.
+MAX_PASSES = 3
+
+
+#: One entry of the host table.
+Host = namedtuple('Host', 'index mac_address ip_address address_source '
+                          'lease_time_remaining interface_type active '
+                          'host_name')
+
+#: Field names of :py:class:`Host`, their argument names and converters.
+_FIELDS = (
+    ('mac_address', 'MACAddress', datatypes.to_string),
+    ('ip_address', 'IPAddress', datatypes.to_string),
+    ('address_source', 'AddressSource', datatypes.to_string),
+    ('lease_time_remaining', 'LeaseTimeRemaining', datatypes.to_int),
+    ('interface_type', 'InterfaceType', datatypes.to_string),
+    ('active', 'Active', datatypes.to_boolean),
+    ('host_name', 'HostName', datatypes.to_string),
+)
+
+_ENTRY_CONVERTERS = dict(('New' + name, func) for _, name, func in _FIELDS)
+
+
+def _error_code(exc):
+    """
+    Return the UPnP error code of a :py:class:`SOAPError`.
+    """
+    return str(exc).split(':', 1)[0].strip()
+
+
+def parse_host_list(data):
+    """
+    Yield the :py:class:`Host` entries of a host list document.
+
+    @param data: The document as bytes.
+    """
+    root = etree.fromstring(data)
+    for index, item in enumerate(root.iter('Item')):
+        values = {}
+        for field, name, func in _FIELDS:
+            values[field] = func(item.findtext(name) or '')
+        yield Host(index=index, **values)
+
+
+class Hosts(ProxyObject):
+
+    TYPE = 'urn:dslforum-org:service:Hosts:1'
+
+    def __init__(self, *args, **kwargs):
+        super(Hosts, self).__init__(*args, **kwargs)
+        self._list_offered = True
+
+    def _execute_uncached(self, action, params=None, converters=None):
+        """
+        Execute *action* bypassing the result cache of the proxy. The host
+        table changes while it is read, so a cached count or entry would
+        hide exactly the changes the scan has to detect.
+        """
+        LOG.info("Executing %r with params %r", action, params)
+        return minisoap.execute(self._control_url(), self.__class__.TYPE,
+                                action, params, transport=self._transport,
+                                converters=converters)
+
+    def number_of_entries(self):
+        """
+        Return the number of entries of the host table.
+        """
+        response = self._execute_uncached(
+            'GetHostNumberOfEntries',
+            converters={'NewHostNumberOfEntries': datatypes.to_int})
+        return response['NewHostNumberOfEntries']
+
+    def entry(self, index):
+        """
+        Return the :py:class:`Host` at *index* (starting at 0).
+        """
+        response = self._execute_uncached('GetGenericHostEntry',
+                                          {'NewIndex': index},
+                                          converters=_ENTRY_CONVERTERS)
+        return Host(index=index, **dict(
+            (field, response['New' + name]) for field, name, _ in _FIELDS))
+
+    def list_path(self):
+        """
+        Return the path of the host list document, or ``None`` if the device
+        does not offer one. The path contains a session id which expires,
+        so it is requested again on every call; only a device without the
+        action is remembered.
+        """
+        if not self._list_offered:
+            return None
+        try:
+            response = self._execute_uncached('X_AVM-DE_GetHostListPath')
+        except SOAPError as exc:
+            LOG.debug('No host list document: %s', exc)
+            self._list_offered = False
+            return None
+        return response['NewX_AVM-DE_HostListPath'] or None
+
+    def _fetch_list(self):
+        """
+        Return the entries of the host list document, or ``None`` if the
+        device does not offer one or it cannot be downloaded.
+        """
+        path = self.list_path()
+        if not path:
+            return None
+        url = urljoin(urlunparse(self._host[0:2] + ('/', '', '', '')), path)
+        get = self._transport.get if self._transport else requests.get
+        try:
+            response = get(url)
+            response.raise_for_status()
+            return list(parse_host_list(response.content))
+        except (requests.RequestException, etree.ParseError) as exc:
+            LOG.warning('Cannot read the host list document, scanning the '
+                        'table instead: %s', exc)
+            return None
+
+    def _scan(self, count, window):
+        """
+        Fetch the entries ``0`` to ``count - 1`` with a pool of *window*
+        worker threads and yield ``(index, host, exc)`` in index order.
+
+        The workers take the next index from a queue as soon as their
+        previous request is answered, so a slow entry holds up one worker
+        only. Closing the generator stops the workers after their current
+        request.
+        """
+        tasks = queue.Queue()
+        results = queue.Queue()
+        for index in range(count):
+            tasks.put(index)
+        stopped = threading.Event()
+
+        def worker():
+            while not stopped.is_set():
+                try:
+                    index = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    results.put((index, self.entry(index), None))
+                except Exception as exc:
+                    results.put((index, None, exc))
+
+        for _ in range(min(window, count)):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        pending = {}
+        try:
+            for index in range(count):
+                while index not in pending:
+                    result = results.get()
+                    pending[result[0]] = result
+                yield pending.pop(index)
+        finally:
+            stopped.set()
+
+    def hosts(self, window=DEFAULT_WINDOW, use_list=True):
+        """
+        Yield a :py:class:`Host` for each entry of the host table.
+
+        Up to *window* entries are fetched concurrently and yielded in index
+        order. The number of entries is checked once after each pass over
+        the table. If it changed, or an index beyond the end of the table
+        was hit, the entries have shifted and the table is read again.
+        Entries with a MAC address which was already yielded are skipped,
+        so a changing table neither loses nor repeats hosts which stay.
+
+        @param window: The maximum number of requests in flight.
+        @param use_list: Download the host list document if the device
+                         offers one. If the download fails, the table is
+                         scanned entry by entry.
+        """
+        if use_list:
+            entries = self._fetch_list()
+            if entries is not None:
+                for host in entries:
+                    yield host
+                return
+
+        seen = set()
+        count = self.number_of_entries()
+        for _ in range(MAX_PASSES):
+            shrunk = None
+            scan = self._scan(count, window)
+            try:
+                for index, host, exc in scan:
+                    if exc is not None:
+                        if (not isinstance(exc, SOAPError) or
+                                _error_code(exc) != INVALID_INDEX):
+                            raise exc
+                        shrunk = exc
+                        break
+                    if host.mac_address in seen:
+                        continue
+                    if host.mac_address:
+                        seen.add(host.mac_address)
+                    yield host
+            finally:
+                scan.close()
+            changed = self.number_of_entries()
+            if changed == count:
+                if shrunk is not None:
+                    # The box reports an entry it cannot return.
+                    raise shrunk
+                return
+            LOG.debug('Host table changed from %d to %d entries during the '
+                      'scan', count, changed)
+            count = changed
+        LOG.warning('Host table still changing after %d passes, some hosts '
+                    'may be missing', MAX_PASSES)
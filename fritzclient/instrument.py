@@ -0,0 +1,286 @@
+"""
+Timing and instrumentation of SOAP calls.
+
+Listeners are called with a :py:class:`Call` after every action executed by
+:py:func:`fritzclient.minisoap.execute` or
+:py:func:`fritzclient.aio.execute`. A call is split into these phases:
+
+    render
+        Rendering the SOAP envelope.
+
+    connect
+        Opening new connections, including the TLS handshake. Zero if a
+        pooled connection was reused. Only known for calls sent through a
+        :py:class:`fritzclient.transport.Transport`.
+
+    wait
+        Sending the request and waiting for the response headers.
+
+    transfer
+        Receiving the response body. Only known for blocking calls.
+
+    parse
+        Parsing the response.
+
+:py:class:`Statistics` is a listener which aggregates counters and
+histograms by host, service type and action::
+
+    stats = Statistics()
+    add_listener(stats)
+    ...
+    print(stats[host, service_type, 'GetInfo'].phases['wait'].mean)
+
+Without listeners, calls are not measured at all.
+"""
+from bisect import bisect_left
+import logging
+import threading
+import time
+
+try:
+    from urlparse import urlsplit
+except ImportError:  # Python 3
+    from urllib.parse import urlsplit
+
+LOG = logging.getLogger(__name__)
+
+#: A monotonic clock if available.
+clock = getattr(time, 'perf_counter', time.time)
+
+#: The phases of a call, in order.
+PHASES = ('render', 'connect', 'wait', 'transfer', 'parse')
+
+#: The default histogram bucket bounds in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+_LISTENERS = []
+_local = threading.local()
+
+
+class Call(object):
+    """
+    The measurements of one executed action. Phase durations are in
+    seconds and ``None`` if they are not known (see the module
+    documentation).
+
+        host, service_type, action
+            What was called.
+
+        status
+            The HTTP status code, or ``None`` if no response arrived.
+
+        fault_code
+            The UPnP error code of a SOAP fault, e.g. ``'401'``.
+
+        error
+            The exception raised by the call, if any.
+
+        request_size, response_size
+            The body sizes in bytes.
+
+        total
+            Seconds the whole call took.
+    """
+
+    __slots__ = ('host', 'service_type', 'action', 'status', 'fault_code',
+                 'error', 'request_size', 'response_size', 'total') + PHASES
+
+    def __init__(self, url, service_type, action):
+        self.host = urlsplit(url).hostname
+        self.service_type = service_type
+        self.action = action
+        self.status = None
+        self.fault_code = None
+        self.error = None
+        self.request_size = None
+        self.response_size = None
+        self.total = None
+        for phase in PHASES:
+            setattr(self, phase, None)
+
+    def __repr__(self):
+        return '<Call {} {} {} {:.3f}s>'.format(
+            self.host, self.action, self.status, self.total or 0.0)
+
+    def failed(self, exc):
+        """
+        Record the exception *exc* raised by the call.
+        """
+        self.error = exc
+        if hasattr(exc, 'faultcode'):
+            # A fritzclient.minisoap.SOAPError with a "code: text" message.
+            self.fault_code = str(exc).split(':', 1)[0].strip()
+
+
+def add_listener(listener):
+    """
+    Call *listener* with a :py:class:`Call` after every action.
+    """
+    _LISTENERS.append(listener)
+
+
+def remove_listener(listener):
+    """
+    Stop calling *listener*.
+    """
+    _LISTENERS.remove(listener)
+
+
+def notify(call):
+    """
+    Pass *call* to all listeners. Failing listeners are logged and do not
+    affect the call.
+    """
+    for listener in list(_LISTENERS):
+        try:
+            listener(call)
+        except Exception:
+            LOG.exception('Instrumentation listener %r failed', listener)
+
+
+def _start_connect_timer():
+    _local.connect = 0.0
+
+
+def _stop_connect_timer():
+    value = getattr(_local, 'connect', None)
+    _local.connect = None
+    return value
+
+
+def _add_connect_time(seconds):
+    """
+    Called by :py:mod:`fritzclient.transport` when a connection has been
+    opened in the current thread.
+    """
+    if getattr(_local, 'connect', None) is not None:
+        _local.connect += seconds
+
+
+class Histogram(object):
+    """
+    Counts values in buckets with fixed upper bounds. Values above the
+    largest bound are counted in an extra bucket.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket containing the *q*-quantile
+        (``0 < q <= 1``), or ``inf`` if it is above all bounds.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class CallStats(object):
+    """
+    Aggregated :py:class:`Call` measurements of one action of one host.
+
+        calls
+            The number of calls.
+
+        errors
+            The number of calls which raised an exception, including SOAP
+            faults.
+
+        statuses, faults
+            Dictionaries counting HTTP status codes and UPnP fault codes.
+
+        request_bytes, response_bytes
+            The total body sizes.
+
+        phases
+            A :py:class:`Histogram` per phase name and for ``total``.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.calls = 0
+        self.errors = 0
+        self.statuses = {}
+        self.faults = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.phases = dict((_, Histogram(buckets))
+                           for _ in PHASES + ('total',))
+
+    def add(self, call):
+        self.calls += 1
+        if call.error is not None:
+            self.errors += 1
+        if call.status is not None:
+            self.statuses[call.status] = self.statuses.get(call.status, 0) + 1
+        if call.fault_code is not None:
+            self.faults[call.fault_code] = self.faults.get(
+                call.fault_code, 0) + 1
+        self.request_bytes += call.request_size or 0
+        self.response_bytes += call.response_size or 0
+        for name, histogram in self.phases.items():
+            value = getattr(call, name)
+            if value is not None:
+                histogram.add(value)
+
+
+class Statistics(object):
+    """
+    A listener aggregating calls into :py:class:`CallStats` keyed by
+    ``(host, service_type, action)``. Instances are thread-safe and can be
+    read while calls are recorded.
+
+        buckets
+            The histogram bucket bounds in seconds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, call):
+        key = (call.host, call.service_type, call.action)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = CallStats(self.buckets)
+            stats.add(call)
+
+    def __len__(self):
+        return len(self._stats)
+
+    def __getitem__(self, key):
+        return self._stats[key]
+
+    def keys(self):
+        with self._lock:
+            return list(self._stats)
+
+    def reset(self):
+        """
+        Drop all aggregated values.
+        """
+        with self._lock:
+            self._stats.clear()
@@ -1,19 +1,73 @@
+"""
+Decoding of XML documents into :py:class:`fritzclient.model.XMLObject`
+instances.
+
+Documents are decoded incrementally with :py:func:`iterparse`. Elements are
+dropped from the tree as soon as the builder of the document class has
+consumed them, so the complete tree is never held in memory. Passing a
+file-like object, like a streamed HTTP response body, overlaps parsing with
+the transfer.
+"""
+from io import BytesIO
 import xml.etree.ElementTree as etree
 
-from fritzclient.model import XMLObject
+#: Maps qualified root tags to the classes decoding them.
+REGISTRY = {}
+
+
+def register(cls):
+    """
+    Register *cls* for each of its namespaces (``cls.NS``) and its root tag
+    (``cls.ROOT``). A class registered later for the same tag replaces the
+    earlier one.
+    """
+    for ns in cls.NS:
+        REGISTRY['{%s}%s' % (ns, cls.ROOT)] = cls
+
+
+def lookup(tag):
+    """
+    Return the class registered for the qualified root *tag*.
 
+    @raises ValueError: If no class is registered.
+    """
+    try:
+        return REGISTRY[tag]
+    except KeyError:
+        raise ValueError('Unsupported element: {!r}'.format(tag))
 
-def decode(data):
-    document = etree.fromstring(data)
-    tag = document.tag
 
-    if not tag.endswith('root'):
-        raise ValueError('Unsupported data')
+def decode(data, tags=None):
+    """
+    Decode an XML document into an instance of the
+    :py:class:`fritzclient.model.XMLObject` subclass registered for its root
+    element.
 
-    for cls in XMLObject.__subclasses__():
-        for ns in cls.NS:
-            if ns in tag:
-                main_element = document.find(ns + cls.TAGNAME)
-                return cls.decode(main_element, ns)
+    @param data: The document as bytes or as file-like object.
+    @param tags: An optional collection of accepted qualified root tags.
+    @raises ValueError: If no class is registered for the root element or it
+                        is not in *tags*.
+    """
+    if not hasattr(data, 'read'):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        data = BytesIO(data)
 
-    raise ValueError('Unsupported element: {!r}'.format(tag))
+    builder = None
+    stack = []
+    for event, element in etree.iterparse(data, events=('start', 'end')):
+        if event == 'start':
+            if builder is None:
+                tag = element.tag
+                if tags is not None and tag not in tags:
+                    raise ValueError('Unsupported element: {!r}'.format(tag))
+                cls = lookup(tag)
+                builder = cls.builder(tag[:-len(cls.ROOT)])
+            builder.start(element)
+            stack.append(element)
+        else:
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if builder.end(element, parent) and parent is not None:
+                parent.remove(element)
+    return builder.close()
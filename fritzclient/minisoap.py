@@ -2,8 +2,18 @@ import xml.etree.ElementTree as etree
 
 import requests
 
+from fritzclient import instrument
 
-etree.register_namespace('s', 'http://schemas.xmlsoap.org/soap/envelope/')
+try:
+    basestring
+except NameError:  # Python 3
+    basestring = str
+
+SOAP_ENVELOPE_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+SOAP_ENCODING_NS = 'http://schemas.xmlsoap.org/soap/encoding/'
+
+#: The maximum number of compiled message templates which are kept.
+MAX_TEMPLATES = 1024
 
 
 class SOAPError(Exception):
@@ -48,32 +58,191 @@ def _parse_xml_value(value):
         return value
 
 
+#: Index marker for element names which occur more than once.
+_DUPLICATE = object()
+
+#: Lookup default for element names which do not occur. Converted values
+#: may be ``None``.
+_MISSING = object()
+
+
 class Container(object):
     """
     Simple container class for easy access to XML nodes.
+
+    Elements are looked up by tag name anywhere below the wrapped element.
+    On first access, all descendants are indexed by tag name, so further
+    lookups do not need to walk the tree again.
+
+    Empty elements are returned as elements, others as (converted) text.
+    Names which occur more than once cannot be looked up and raise a
+    :py:exc:`KeyError`.
+
+    Without *converters*, digit-only values are returned as integers and
+    everything else as string. *converters* may map element names to
+    functions converting the element text (see
+    :py:mod:`fritzclient.datatypes`). These are applied to all elements
+    they cover, including empty ones.
     """
 
-    def __init__(self, element):
+    def __init__(self, element, converters=None):
         self._element = element
+        self._converters = converters or {}
+        self._index = None
+        self._leaves = None
+
+    def _build_index(self):
+        index = {}
+        leaves = []
+        converters = self._converters
+        for elem in self._element.iter():
+            if elem is self._element:
+                continue
+            if elem.tag in index:
+                index[elem.tag] = _DUPLICATE
+                continue
+            if elem.tag in converters:
+                try:
+                    index[elem.tag] = converters[elem.tag](elem.text or '')
+                except ValueError:
+                    index[elem.tag] = elem.text
+            elif elem.text:
+                index[elem.tag] = _parse_xml_value(elem.text)
+            else:
+                index[elem.tag] = elem
+            if len(elem) == 0:
+                leaves.append(elem.tag)
+        self._index = index
+        self._leaves = [_ for _ in leaves if index[_] is not _DUPLICATE]
 
     def __getitem__(self, key):
-        elems = self._element.findall('.//{}'.format(key))
-        if len(elems) == 1:
-            value = elems[0].text
-            if value:
-                return _parse_xml_value(value)
-            else:
-                return elems[0]
-        elif len(elems) > 1:
-            raise KeyError('Multiple elements found for key {}'.format(key))
-        else:
+        if self._index is None:
+            self._build_index()
+        value = self._index.get(key, _MISSING)
+        if value is _MISSING:
             raise KeyError('No such element: {}'.format(key))
+        elif value is _DUPLICATE:
+            raise KeyError('Multiple elements found for key {}'.format(key))
+        return value
+
+    def __contains__(self, key):
+        if self._index is None:
+            self._build_index()
+        return self._index.get(key, _DUPLICATE) is not _DUPLICATE
 
     def get(self, key, default=None):
-        try:
-            return self[key]
-        except KeyError:
+        if self._index is None:
+            self._build_index()
+        value = self._index.get(key, _DUPLICATE)
+        if value is _DUPLICATE:
             return default
+        return value
+
+    def keys(self):
+        """
+        Return the names of all unique leaf elements. For an action
+        response, these are the output arguments.
+        """
+        if self._index is None:
+            self._build_index()
+        return list(self._leaves)
+
+    def items(self):
+        """
+        Return ``(name, value)`` pairs for all names in :py:meth:`keys`.
+        """
+        if self._index is None:
+            self._build_index()
+        return [(key, self._index[key]) for key in self._leaves]
+
+    def as_dict(self):
+        """
+        Return all unique leaf elements as dictionary.
+        """
+        return dict(self.items())
+
+
+def _escape_attrib(text):
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;'))
+
+
+def _escape_cdata(text):
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return text.encode('ascii', 'xmlcharrefreplace')
+
+
+class MessageTemplate(object):
+    """
+    A precompiled SOAP envelope for one action and a fixed sequence of
+    argument names.
+
+    The constant parts of the message are rendered once. Rendering a message
+    only escapes the argument values and joins them with the constant parts.
+    The output is the same as serialising the envelope with ElementTree,
+    without touching the global namespace registry of ElementTree.
+
+    @param context: The namespace for the method element.
+    @param method: The method name.
+    @param names: The argument names in output order.
+    """
+
+    def __init__(self, context, method, names):
+        self.names = tuple(names)
+        head = ('<s:Envelope xmlns:s="{}" xmlns:u="{}" '
+                's:encodingStyle="{}"><s:Body>'.format(
+                    _escape_attrib(SOAP_ENVELOPE_NS),
+                    _escape_attrib(context),
+                    _escape_attrib(SOAP_ENCODING_NS)))
+        tail = '</s:Body></s:Envelope>'
+        if not self.names:
+            head += '<u:{} />'.format(method)
+        else:
+            head += '<u:{}>'.format(method)
+            tail = '</u:{}>'.format(method) + tail
+        self._head = head.encode('ascii')
+        self._tail = tail.encode('ascii')
+        self._args = [('<{}>'.format(name).encode('ascii'),
+                       '</{}>'.format(name).encode('ascii'),
+                       '<{} />'.format(name).encode('ascii'))
+                      for name in self.names]
+
+    def render(self, values):
+        """
+        Render a message.
+
+        @param values: The argument values, in the same order as the names
+                       given to the constructor.
+        """
+        output = [self._head]
+        for (start, end, empty), value in zip(self._args, values):
+            text = str(value)
+            if text:
+                output.extend((start, _escape_cdata(text), end))
+            else:
+                output.append(empty)
+        output.append(self._tail)
+        return b''.join(output)
+
+
+_TEMPLATES = {}
+
+
+def get_template(context, method, names=()):
+    """
+    Return the (cached) :py:class:`MessageTemplate` for an action.
+
+    @param context: The namespace for the method element.
+    @param method: The method name.
+    @param names: The argument names in output order.
+    """
+    key = (context, method, tuple(names))
+    template = _TEMPLATES.get(key)
+    if template is None:
+        if len(_TEMPLATES) >= MAX_TEMPLATES:
+            _TEMPLATES.clear()
+        template = _TEMPLATES[key] = MessageTemplate(*key)
+    return template
 
 
 def render_message(context, method, args=None):
@@ -84,52 +253,66 @@ def render_message(context, method, args=None):
     @param args: An optional dictionary of parameters.
     """
     if not args:
-        args = {}
-
-    etree.register_namespace('u', context)
-
-    ns = 'http://schemas.xmlsoap.org/soap/envelope/'
-    doc = etree.Element(etree.QName(ns, 'Envelope'))
-    doc.set(etree.QName(ns, 'encodingStyle'),
-            'http://schemas.xmlsoap.org/soap/encoding/')
-    body = etree.Element(etree.QName(ns, 'Body'))
-    method_el = etree.Element(etree.QName(context, method))
-    for key, value in args.items():
-        arg_el = etree.Element(key)
-        arg_el.text = str(value)
-        method_el.append(arg_el)
-    body.append(method_el)
-    doc.append(body)
-    output = etree.tostring(doc)
-    return output
-
-
-def parse_response(response):
+        return get_template(context, method).render(())
+
+    names = tuple(args)
+    template = get_template(context, method, names)
+    return template.render([args[name] for name in names])
+
+
+def parse_response(response, converters=None):
+    """
+    Parse a SOAP response into a :py:class:`Container`.
+
+    @param response: The response body.
+    @param converters: An optional dictionary of converters for the
+                       :py:class:`Container`.
+    """
     root = etree.fromstring(response)
     envelope = root[0]
     body = envelope[0]
-    return Container(body)
-
+    return Container(body, converters)
 
-def execute(url, namespace, action, params=None):
 
-    headers = {'soapaction': '#'.join((namespace, action)),
-               'content-type': 'text/xml',
-               'charset': 'utf-8'}
+def make_headers(namespace, action):
+    """
+    Return the HTTP headers for a SOAP request.
 
-    payload = render_message(namespace, action, params)
+    @param namespace: The service type (a URN from the TR-064 standard).
+    @param action: The action name.
+    """
+    return {'soapaction': '#'.join((namespace, action)),
+            'content-type': 'text/xml',
+            'charset': 'utf-8'}
 
-    response = requests.post(url, data=payload, headers=headers)
 
-    if not response.headers['content-type'].startswith('text/xml'):
+def handle_response(response, url, payload, headers, converters=None):
+    """
+    Convert an HTTP response into a parsed SOAP response.
+
+    This is shared between the blocking and asynchronous clients. It only
+    needs the ``status_code``, ``headers`` and ``text`` attributes of the
+    response.
+
+    @param response: The HTTP response.
+    @param url: The URL the request was sent to.
+    @param payload: The request body.
+    @param headers: The request headers.
+    @param converters: An optional dictionary of converters for the
+                       returned :py:class:`Container`.
+    @raises SOAPError: If the device returned a SOAP fault.
+    """
+    content_type = response.headers['content-type']
+    if not content_type.startswith('text/xml'):
         raise ValueError("Don't know how to handle content-type {}".format(
-            response.headers['content-type']))
+            content_type))
 
+    text = response.text
     if response.status_code != 200:
         try:
             ns = '{http://schemas.xmlsoap.org/soap/envelope/}'
             ns2 = '{urn:dslforum-org:control-1-0}'
-            envelope = etree.fromstring(response.text)
+            envelope = etree.fromstring(text)
             fault = envelope.find('./{0}Body/{0}Fault'.format(ns))
             detail = fault.find('./detail')
             error_code = detail.find(
@@ -148,8 +331,93 @@ def execute(url, namespace, action, params=None):
         except Exception as exc:
             raise SOAPError(
                 'Unparsable SOAP Error: {} from source {!r}'.format(
-                    exc, response.text))
+                    exc, text))
         else:
             raise error
 
-    return parse_response(response.text)
+    return parse_response(text, converters)
+
+
+def execute(url, namespace, action, params=None, transport=None,
+            converters=None, template=None):
+    """
+    Execute a SOAP action and return the parsed response.
+
+    @param url: The control URL of the service.
+    @param namespace: The service type (a URN from the TR-064 standard).
+    @param action: The action name.
+    @param params: An optional dictionary of parameters.
+    @param transport: An optional :py:class:`fritzclient.transport.Transport`.
+                      If given, the request is sent over one of its pooled
+                      connections. Otherwise a new connection is opened.
+    @param converters: An optional dictionary of converters for the
+                       returned :py:class:`Container`.
+    @param template: An optional :py:class:`MessageTemplate` for the action.
+                     *params* must contain a value for each of its names.
+
+    If listeners are registered with :py:mod:`fritzclient.instrument`, the
+    call is measured and passed to them.
+    """
+    if instrument._LISTENERS:
+        return _execute_instrumented(url, namespace, action, params,
+                                     transport, converters, template)
+
+    headers = make_headers(namespace, action)
+    if template is None:
+        payload = render_message(namespace, action, params)
+    else:
+        payload = template.render([params[_] for _ in template.names])
+
+    post = transport.post if transport else requests.post
+    response = post(url, data=payload, headers=headers)
+
+    return handle_response(response, url, payload, headers, converters)
+
+
+def _execute_instrumented(url, namespace, action, params, transport,
+                          converters, template):
+    """
+    :py:func:`execute` with a :py:class:`fritzclient.instrument.Call`
+    recording the phases. The response body is streamed to measure the
+    transfer separately.
+    """
+    clock = instrument.clock
+    call = instrument.Call(url, namespace, action)
+    started = clock()
+    try:
+        headers = make_headers(namespace, action)
+        if template is None:
+            payload = render_message(namespace, action, params)
+        else:
+            payload = template.render([params[_] for _ in template.names])
+        call.request_size = len(payload)
+        rendered = clock()
+        call.render = rendered - started
+
+        post = transport.post if transport else requests.post
+        instrument._start_connect_timer()
+        try:
+            response = post(url, data=payload, headers=headers, stream=True)
+        finally:
+            connect = instrument._stop_connect_timer()
+        received = clock()
+        if transport is not None:
+            call.connect = connect
+        call.wait = received - rendered - (call.connect or 0.0)
+        call.status = response.status_code
+
+        content = response.content
+        transferred = clock()
+        call.transfer = transferred - received
+        call.response_size = len(content)
+        try:
+            return handle_response(response, url, payload, headers,
+                                   converters)
+        finally:
+            call.parse = clock() - transferred
+    except Exception as exc:
+        call.failed(exc)
+        raise
+    finally:
+        call.total = clock() - started
+        instrument.notify(call)
@@ -1,82 +1,926 @@
 import xml.etree.ElementTree as ET
-from urlparse import urlparse, urlunparse
+try:
+    from urlparse import urlparse, urlunparse
+except ImportError:  # Python 3
+    from urllib.parse import urlparse, urlunparse
+from collections import namedtuple
 import logging
+import re
+import time
 
-from fritzclient import tr064, minisoap
+import requests
+
+try:
+    intern
+except NameError:  # Python 3
+    from sys import intern
+
+from fritzclient import datatypes, marshal, minisoap, tr064
+from fritzclient.cache import DefinitionStore
+from fritzclient.transport import Transport
 
 LOG = logging.getLogger(__name__)
 ET.register_namespace('s', 'http://schemas.xmlsoap.org/soap/envelope/')
 NS = '{urn:dslforum-org:device-1-0}'
 
+#: Namespaces used by SCPD documents.
+SCPD_NAMESPACES = ('urn:dslforum-org:service-1-0',
+                   'urn:schemas-upnp-org:service-1-0')
+
+#: Namespaces used by device description documents.
+DEVICE_NAMESPACES = ('urn:dslforum-org:device-1-0',
+                     'urn:schemas-upnp-org:device-1-0')
+
+
+class XMLObjectType(type):
+    """
+    Metaclass of :py:class:`XMLObject`. Every class which defines ``NS``
+    itself is registered with :py:func:`fritzclient.marshal.register`.
+    """
+
+    def __init__(cls, name, bases, namespace):
+        super(XMLObjectType, cls).__init__(name, bases, namespace)
+        if 'NS' in namespace:
+            marshal.register(cls)
+
+
+#: Base of :py:class:`XMLObject`, created this way to support Python 2 and 3.
+_XMLObjectBase = XMLObjectType('_XMLObjectBase', (object,),
+                               {'__slots__': ()})
+
+
+class XMLObject(_XMLObjectBase):
+    """
+    Base class of objects decoded from XML documents (see
+    :py:func:`fritzclient.marshal.decode`).
+
+    Subclasses define:
+
+        NS
+            The namespace URIs of the documents they decode.
+
+        ROOT
+            The local name of the root element.
+
+    and implement :py:meth:`builder`.
+    """
+
+    __slots__ = ()
+
+    NS = ()
+    ROOT = None
+
+    @classmethod
+    def builder(cls, ns):
+        """
+        Return a builder creating an instance from parser events. *ns* is
+        the namespace of the document in ElementTree notation
+        (``'{uri}'``).
+
+        A builder has three methods. ``start(element)`` and
+        ``end(element, parent)`` are called for the start and end of every
+        element. ``end`` returns ``True`` if the builder consumed the
+        element, so it can be dropped from the tree. ``close()`` returns the
+        instance.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def decode(cls, element, ns):
+        """
+        Create an instance from an already parsed *element*.
+        """
+        builder = cls.builder(ns)
+        _replay(builder, element, None)
+        return builder.close()
+
+
+def _replay(builder, element, parent):
+    builder.start(element)
+    for child in element:
+        _replay(builder, child, element)
+    builder.end(element, parent)
+
+
+def _intern(value):
+    """
+    Intern *value* if it is a string which can be interned. Descriptions of
+    many devices repeat the same names, types and URLs, so this keeps only
+    one copy of each in memory.
+    """
+    try:
+        return intern(value)
+    except TypeError:  # None or unicode on Python 2
+        return value
+
+
+def _identifier(name):
+    """
+    Replace the characters of *name* which are not valid in identifiers.
+    """
+    return re.sub(r'\W', '_', name)
+
+
+def _text(element, path, ns):
+    value = element.findtext(path.format(ns))
+    return _intern(value.strip()) if value is not None else None
+
+
+#: A service entry of a device description.
+ServiceDescription = namedtuple(
+    'ServiceDescription',
+    'service_type service_id control_url event_suburl scpdurl')
+
+
+class Device(XMLObject):
+    """
+    A device decoded from a device description (``tr64desc.xml`` or the
+    UPnP description).
+
+        icons
+            A list of dictionaries with the icon properties.
+
+        services
+            A list of :py:class:`ServiceDescription` instances.
+
+        devices
+            A list of embedded :py:class:`Device` instances.
+
+        spec_version
+            The specification version of the document, like ``'1.0'``.
+            Only set on the top-level device.
+    """
+
+    NS = DEVICE_NAMESPACES
+    ROOT = 'root'
+
+    FIELDS = (
+        ('device_type', 'deviceType'),
+        ('friendly_name', 'friendlyName'),
+        ('manufacturer', 'manufacturer'),
+        ('manufacturer_url', 'manufacturerURL'),
+        ('model_description', 'modelDescription'),
+        ('model_name', 'modelName'),
+        ('model_number', 'modelNumber'),
+        ('model_url', 'modelURL'),
+        ('udn', 'UDN'),
+        ('presentation_url', 'presentationURL'),
+    )
+
+    __slots__ = tuple(_[0] for _ in FIELDS) + (
+        'icons', 'services', 'devices', 'spec_version')
+
+    def __init__(self, icons=None, services=None, devices=None,
+                 spec_version=None, **fields):
+        for name, _ in self.FIELDS:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError('Unexpected fields: {}'.format(
+                ', '.join(sorted(fields))))
+        self.icons = icons or []
+        self.services = services or []
+        self.devices = devices or []
+        self.spec_version = spec_version
+
+    def __repr__(self):
+        return '<Device {}>'.format(self.device_type)
+
+    def iter_services(self):
+        """
+        Yield the services of this device and of all embedded devices.
+        """
+        for service in self.services:
+            yield service
+        for device in self.devices:
+            for service in device.iter_services():
+                yield service
+
+    @classmethod
+    def builder(cls, ns):
+        return _DeviceBuilder(cls, ns)
+
+
+class _DeviceBuilder(object):
+    """
+    Builds a :py:class:`Device` and its embedded devices. Icons, services
+    and devices are consumed as soon as they are complete.
+    """
+
+    def __init__(self, cls, ns):
+        self._cls = cls
+        self._ns = ns
+        self._fields = dict((ns + tag, name) for name, tag in cls.FIELDS)
+        self._frames = []
+        self._spec_version = None
+        self._result = None
+
+    def start(self, element):
+        if element.tag == self._ns + 'device':
+            self._frames.append((element, {}, [], [], []))
+
+    def end(self, element, parent):
+        ns = self._ns
+        tag = element.tag
+        if not self._frames:
+            if tag == ns + 'specVersion':
+                self._spec_version = _intern('.'.join(
+                    (_.text or '').strip() for _ in element))
+                return True
+            return False
+
+        device, fields, icons, services, devices = self._frames[-1]
+        if tag == ns + 'device':
+            self._frames.pop()
+            result = self._cls(icons=icons, services=services,
+                               devices=devices, **fields)
+            if self._frames:
+                self._frames[-1][4].append(result)
+            elif self._result is None:
+                self._result = result
+            return True
+        if tag == ns + 'icon':
+            icons.append(dict(
+                (_intern(_.tag[len(ns):]), _intern((_.text or '').strip()))
+                for _ in element))
+            return True
+        if tag == ns + 'service':
+            services.append(ServiceDescription(
+                _text(element, './{}serviceType', ns),
+                _text(element, './{}serviceId', ns),
+                _text(element, './{}controlURL', ns),
+                _text(element, './{}eventSubURL', ns),
+                _text(element, './{}SCPDURL', ns)))
+            return True
+        if parent is device and tag in self._fields:
+            fields[self._fields[tag]] = _intern((element.text or '').strip())
+            return True
+        return False
+
+    def close(self):
+        if self._result is None:
+            raise ValueError('No device element found')
+        self._result.spec_version = self._spec_version
+        return self._result
+
+
+class ResponseValue(object):
+    """
+    A proxy attribute holding one output argument of an action.
+
+    The action is executed when one of its values is first read. The
+    response is then kept by the proxy, so reading other values of the same
+    action costs no further request (see :py:meth:`ProxyObject.refresh`).
+
+    @param action: The action name.
+    @param name: The name of the output argument.
+    """
+
+    def __init__(self, action, name):
+        self.action = action
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._response(self.action).get(self.name)
+
 
 class ProxyObject(object):
+    """
+    Base class for service proxies. Subclasses define the service type as
+    ``TYPE``.
 
-    def __init__(self, control_urls, tr064root, host):
+    Values exposed as :py:class:`ResponseValue` are fetched lazily. If
+    *max_age* is given, responses older than *max_age* seconds are fetched
+    again when read.
+    """
+
+    def __init__(self, control_urls, tr064root, host, transport=None,
+                 result_cache=None, max_age=None):
         self._control_urls = control_urls
         self._tr046root = tr064root
         self._host = host
+        self._transport = transport
+        self._result_cache = result_cache
+        self._max_age = max_age
+        self._responses = {}
+
+    def _control_url(self):
+        control_url = self._control_urls[self.__class__.TYPE]
+        return urlunparse((self._host[0:2] + (control_url, '', '', '')))
 
-    def _execute_action(self, action, params=None):
+    def _execute_action(self, action, params=None, converters=None,
+                        template=None):
         LOG.info("Executing %r with params %r", action, params)
 
-        control_url = self._control_urls[self.__class__.TYPE]
-        url = urlunparse((self._host[0:2] + (control_url, '', '', '')))
+        url = self._control_url()
+
+        def execute():
+            return minisoap.execute(url, self.__class__.TYPE, action, params,
+                                    transport=self._transport,
+                                    converters=converters,
+                                    template=template)
 
-        return minisoap.execute(url, self.__class__.TYPE, action, params)
+        if self._result_cache is None:
+            return execute()
+        return self._result_cache.call(url, action, params, execute,
+                                       converters)
+
+    def _response(self, action):
+        """
+        Return the kept response of *action*, executing it if needed.
+        """
+        entry = self._responses.get(action)
+        if entry is None or (self._max_age is not None and
+                             time.time() - entry[0] > self._max_age):
+            entry = (time.time(), self._execute_action(action))
+            self._responses[action] = entry
+        return entry[1]
+
+    def refresh(self):
+        """
+        Fetch all responses which have been read so far again. Responses
+        which have not been read yet stay unfetched.
+        """
+        for action in list(self._responses):
+            self._responses[action] = (time.time(),
+                                       self._execute_action(action))
+        return self
+
+
+_PROXY_CLASSES = {}
+
+
+def proxy_class(service_type):
+    """
+    Return a generic :py:class:`ProxyObject` subclass for *service_type*.
+    """
+    cls = _PROXY_CLASSES.get(service_type)
+    if cls is None:
+        name = str(service_type.split(':')[-2].replace('-', '_'))
+        cls = type(name, (ProxyObject,), {'TYPE': service_type})
+        _PROXY_CLASSES[service_type] = cls
+    return cls
+
+
+def register_proxy_class(cls):
+    """
+    Use the :py:class:`ProxyObject` subclass *cls* for its service type
+    (``cls.TYPE``). Classes generated by :py:mod:`fritzclient.codegen`
+    register themselves when their module is imported.
+    """
+    _PROXY_CLASSES[cls.TYPE] = cls
+    return cls
 
 
 class DeviceInfo(ProxyObject):
 
     TYPE = 'urn:dslforum-org:service:DeviceInfo:1'
 
-    def __init__(self, *args, **kwargs):
-        super(DeviceInfo, self).__init__(*args, **kwargs)
-        info_result = self._execute_action('GetInfo')
-        self.manufacturer_name = info_result.get('NewManufacturerName')
-        self.manufacturer_oui = info_result.get('NewManufacturerOUI')
-        self.model_name = info_result.get('NewModelName')
-        self.description = info_result.get('NewDescription')
-        self.product_class = info_result.get('NewProductClass')
-        self.serial_number = info_result.get('NewSerialNumber')
-        self.software_version = info_result.get('NewSoftwareVersion')
-        self.additional_software_versions = info_result.get(
-            'NewAdditionalSoftwareVersions')
-        self.modem_firmware_version = info_result.get(
-            'NewModemFirmwareVersion')
-        self.enabled_options = info_result.get('NewEnabledOptions')
-        self.hardware_version = info_result.get('NewHardwareVersion')
-        self.additional_hardware_versions = info_result.get(
-            'NewAdditionalHardwareVersions')
-        self.spec_version = info_result.get('NewSpecVersion')
-        self.provisioning_code = info_result.get('NewProvisioningCode')
-        self.uptime = info_result.get('NewUpTime')
-        self.firstuse_date = info_result.get('NewFirstUseDate')
-
-
-def get_root_device(location=None):
-
-    if not location:
-        # No location given. Run an SSDP discovery.
-        tr064_response = tr064.discover()
-        location = tr064_response['location']
-
-    tr064desc = tr064.get_tr064desc(location)
-    root = ET.fromstring(tr064desc)
-    if root.tag != '{ns}root'.format(ns=NS):
+    manufacturer_name = ResponseValue('GetInfo', 'NewManufacturerName')
+    manufacturer_oui = ResponseValue('GetInfo', 'NewManufacturerOUI')
+    model_name = ResponseValue('GetInfo', 'NewModelName')
+    description = ResponseValue('GetInfo', 'NewDescription')
+    product_class = ResponseValue('GetInfo', 'NewProductClass')
+    serial_number = ResponseValue('GetInfo', 'NewSerialNumber')
+    software_version = ResponseValue('GetInfo', 'NewSoftwareVersion')
+    additional_software_versions = ResponseValue(
+        'GetInfo', 'NewAdditionalSoftwareVersions')
+    modem_firmware_version = ResponseValue(
+        'GetInfo', 'NewModemFirmwareVersion')
+    enabled_options = ResponseValue('GetInfo', 'NewEnabledOptions')
+    hardware_version = ResponseValue('GetInfo', 'NewHardwareVersion')
+    additional_hardware_versions = ResponseValue(
+        'GetInfo', 'NewAdditionalHardwareVersions')
+    spec_version = ResponseValue('GetInfo', 'NewSpecVersion')
+    provisioning_code = ResponseValue('GetInfo', 'NewProvisioningCode')
+    uptime = ResponseValue('GetInfo', 'NewUpTime')
+    firstuse_date = ResponseValue('GetInfo', 'NewFirstUseDate')
+
+
+class Variable(object):
+    """
+    A state variable of a service.
+    """
+
+    __slots__ = ('name', 'data_type', 'send_events', 'default_value',
+                 'allowed_values')
+
+    def __init__(self, name, data_type, send_events=False,
+                 default_value=None, allowed_values=None):
+        self.name = name
+        self.data_type = data_type
+        self.send_events = send_events
+        self.default_value = default_value
+        self.allowed_values = tuple(allowed_values) if allowed_values \
+            else None
+
+    def __repr__(self):
+        return '<Variable {} ({})>'.format(self.name, self.data_type)
+
+
+class Argument(object):
+    """
+    An argument of an action. *direction* is either ``'in'`` or ``'out'``.
+    """
+
+    __slots__ = ('name', 'direction', 'variable')
+
+    def __init__(self, name, direction, variable):
+        self.name = name
+        self.direction = direction
+        self.variable = variable
+
+    def __repr__(self):
+        return '<Argument {} {}>'.format(self.direction, self.name)
+
+
+class Action(object):
+    """
+    An action of a service.
+
+    The ``converters`` table maps the names of the output arguments to the
+    conversion functions of their data types. It is built once when the
+    action is created.
+    """
+
+    __slots__ = ('name', 'arguments', 'converters')
+
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = tuple(arguments)
+        self.converters = dict(
+            (arg.name, datatypes.converter(arg.variable.data_type))
+            for arg in arguments
+            if arg.direction == 'out' and arg.variable is not None)
+
+    @property
+    def in_arguments(self):
+        return [_ for _ in self.arguments if _.direction == 'in']
+
+    @property
+    def out_arguments(self):
+        return [_ for _ in self.arguments if _.direction == 'out']
+
+    def __repr__(self):
+        return '<Action {}>'.format(self.name)
+
+
+class SCPD(XMLObject):
+    """
+    The parsed service description (SCPD document) of a service type.
+
+        variables
+            A list of :py:class:`Variable` instances.
+
+        actions
+            A dictionary mapping action names to :py:class:`Action`
+            instances.
+    """
+
+    NS = SCPD_NAMESPACES
+    ROOT = 'scpd'
+
+    __slots__ = ('variables', 'actions')
+
+    def __init__(self, variables, actions):
+        self.variables = tuple(variables)
+        self.actions = actions
+
+    @classmethod
+    def parse(cls, data):
+        """
+        Parse an SCPD document.
+
+        @param data: The document as bytes or file-like object.
+        @raises ValueError: If *data* is no SCPD document.
+        """
+        return marshal.decode(
+            data, tags=['{%s}%s' % (_, cls.ROOT) for _ in cls.NS])
+
+    @classmethod
+    def builder(cls, ns):
+        return _SCPDBuilder(cls, ns)
+
+
+class _SCPDBuilder(object):
+    """
+    Builds an :py:class:`SCPD`. State variables and actions are consumed as
+    soon as they are complete. Arguments are linked to their state
+    variables at the end because the action list usually comes first.
+    """
+
+    def __init__(self, cls, ns):
+        self._cls = cls
+        self._ns = ns
+        self._variables = []
+        self._actions = []
+        self._arguments = []
+
+    def start(self, element):
+        pass
+
+    def end(self, element, parent):
+        ns = self._ns
+        tag = element.tag
+        if tag == ns + 'stateVariable':
+            allowed = [(_.text or '').strip() for _ in element.iterfind(
+                './{0}allowedValueList/{0}allowedValue'.format(ns))]
+            self._variables.append(Variable(
+                _text(element, './{}name', ns),
+                _text(element, './{}dataType', ns),
+                send_events=element.get('sendEvents') == 'yes',
+                default_value=_text(element, './{}defaultValue', ns) or None,
+                allowed_values=allowed or None))
+            return True
+        if tag == ns + 'argument':
+            self._arguments.append((
+                _text(element, './{}name', ns),
+                _text(element, './{}direction', ns),
+                _text(element, './{}relatedStateVariable', ns)))
+            return True
+        if tag == ns + 'action':
+            self._actions.append((_text(element, './{}name', ns),
+                                  self._arguments))
+            self._arguments = []
+            return True
+        return False
+
+    def close(self):
+        by_name = dict((_.name, _) for _ in self._variables)
+        actions = {}
+        for name, arguments in self._actions:
+            actions[name] = Action(name, [
+                Argument(arg_name, direction, by_name.get(related))
+                for arg_name, direction, related in arguments])
+        return self._cls(self._variables, actions)
+
+
+#: Definitions of services without SCPD document.
+EMPTY_SCPD = SCPD((), {})
+
+#: The process-wide store of SCPD definitions used by :py:class:`Service`.
+DEFINITIONS = DefinitionStore(SCPD.parse)
+
+
+class Service(object):
+    """
+    A service of a device, described by its SCPD document.
+
+    Each action of the service is available as callable attribute taking
+    the input arguments as keyword arguments. Results are converted to the
+    data types declared in the SCPD. Actions can only be called on services
+    bound to a :py:class:`RootDevice` (see :py:meth:`RootDevice.get_service`).
+
+    The callables are created on access, so a service only stores its
+    identifiers and a reference to the SCPD definitions. These are shared
+    with all services using the same SCPD document through *definitions*,
+    which defaults to the process-wide :py:data:`DEFINITIONS`.
+    """
+
+    __slots__ = ('_service_id', '_service_type', '_control_url',
+                 '_event_sub_url', '_scpd_url', '_device', 'scpd')
+
+    def __init__(self, service_id, service_type=None, control_url=None,
+                 event_sub_url=None, scpd_url=None, scpd_doc=None,
+                 device=None, definitions=None):
+        self._service_id = _intern(service_id)
+        self._service_type = _intern(service_type)
+        self._control_url = _intern(control_url)
+        self._event_sub_url = _intern(event_sub_url)
+        self._scpd_url = _intern(scpd_url)
+        self._device = device
+        if definitions is None:
+            definitions = DEFINITIONS
+        self.scpd = definitions.get(scpd_doc) if scpd_doc else EMPTY_SCPD
+
+    @property
+    def variables(self):
+        return self.scpd.variables
+
+    @property
+    def actions(self):
+        return self.scpd.actions
+
+    @property
+    def event_converters(self):
+        """
+        Conversion functions of the evented state variables by name, for
+        :py:meth:`fritzclient.gena.EventServer.subscribe`.
+        """
+        return dict((_.name, datatypes.converter(_.data_type))
+                    for _ in self.scpd.variables if _.send_events)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'scpd':
+            raise AttributeError(name)
+        actions = self.scpd.actions
+        action = actions.get(name)
+        if action is None:
+            # Names like X_AVM-DE_GetNightControl are also available as
+            # identifiers, the same way fritzclient.codegen names them.
+            for action in actions.values():
+                if _identifier(action.name) == name:
+                    break
+            else:
+                raise AttributeError(name)
+        return self._make_call(action)
+
+    def __dir__(self):
+        return sorted(set(dir(type(self))) | set(self.__slots__) |
+                      set(_identifier(_) for _ in self.scpd.actions))
+
+    def _make_call(self, action):
+        def call(**params):
+            if self._device is None:
+                raise ValueError('Service {} is not bound to a '
+                                 'device'.format(self._service_id))
+            proxy = self._device.service(proxy_class(self._service_type))
+            return proxy._execute_action(action.name, params,
+                                         converters=action.converters)
+        call.__name__ = str(_identifier(action.name))
+        return call
+
+
+class RootDevice(object):
+    """
+    The root device described by a ``tr64desc.xml`` document.
+
+    Service proxies talking to this device are created with
+    :py:meth:`service`. They all share the transport of the device.
+
+    The fields of the description, like ``friendly_name``, ``services`` or
+    ``devices``, are available as attributes (see :py:class:`Device`).
+    """
+
+    def __init__(self, location, root, control_urls, transport=None,
+                 scpd_urls=None):
+        self.location = location
+        self.udn = root.udn
+        self.control_urls = control_urls
+        self.scpd_urls = scpd_urls or {}
+        self.transport = transport
+        #: An optional :py:class:`fritzclient.cache.DescriptionCache`.
+        self.cache = None
+        #: The firmware version. Only known if the device is cached.
+        self.software_version = None
+        #: An optional :py:class:`fritzclient.cache.ResultCache` shared by
+        #: all service proxies of this device.
+        self.result_cache = None
+        self._root = root
+        self._host = urlparse(location)
+
+    def __getattr__(self, name):
+        if name in Device.__slots__:
+            return getattr(self._root, name)
+        raise AttributeError(name)
+
+    @property
+    def secure(self):
+        """
+        Whether actions are sent over HTTPS.
+        """
+        return self._host.scheme == 'https'
+
+    def use_security_port(self, port=None):
+        """
+        Send the actions of proxies created from now on over HTTPS to the
+        ``SecurityPort`` of the device.
+
+        @param port: The port. If not given, it is asked from the device
+                     with ``GetSecurityPort``.
+        """
+        if port is None:
+            port = self.execute(DeviceInfo.TYPE,
+                                'GetSecurityPort')['NewSecurityPort']
+        hostname = self._host.hostname
+        if ':' in hostname:
+            hostname = '[{}]'.format(hostname)
+        self._host = urlparse('https://{}:{}'.format(hostname, port))
+        return self
+
+    def service(self, proxy_class, max_age=None):
+        """
+        Return a new proxy for one service of this device. No request is
+        sent until a value of the proxy is read.
+
+        @param proxy_class: A :py:class:`ProxyObject` subclass.
+        @param max_age: Seconds after which values of the proxy are fetched
+                        again.
+        """
+        return proxy_class(self.control_urls, self._root, self._host,
+                           transport=self.transport,
+                           result_cache=self.result_cache,
+                           max_age=max_age)
+
+    def execute(self, service_type, action, params=None):
+        """
+        Execute an action of any service of this device.
+
+        @param service_type: The service type URN.
+        @param action: The action name.
+        @param params: An optional dictionary of parameters.
+        """
+        proxy = self.service(proxy_class(service_type))
+        return proxy._execute_action(action, params)
+
+    def get_service(self, service_type):
+        """
+        Return a :py:class:`Service` bound to this device. Its SCPD document
+        is fetched (or loaded from the cache) on every call.
+
+        If a proxy class generated by :py:mod:`fritzclient.codegen` is
+        registered for *service_type*, an instance of it is returned instead
+        and no SCPD document is needed.
+
+        @param service_type: The service type URN.
+        """
+        cls = _PROXY_CLASSES.get(service_type)
+        if getattr(cls, 'ACTIONS', None) is not None:
+            return self.service(cls)
+        for srv in self._root.iter_services():
+            if srv.service_type == service_type:
+                break
+        else:
+            raise KeyError('No such service: {}'.format(service_type))
+        return Service(
+            srv.service_id,
+            service_type=service_type,
+            control_url=srv.control_url,
+            event_sub_url=srv.event_suburl,
+            scpd_url=srv.scpdurl,
+            scpd_doc=self.get_scpd(service_type),
+            device=self)
+
+    def event_url(self, service_type):
+        """
+        Return the absolute event subscription URL of a service. Events are
+        always subscribed on the port of the device description, also if
+        :py:meth:`use_security_port` was called.
+
+        @param service_type: The service type URN.
+        """
+        for srv in self._root.iter_services():
+            if srv.service_type == service_type:
+                break
+        else:
+            raise KeyError('No such service: {}'.format(service_type))
+        location = urlparse(self.location)
+        return urlunparse(location[0:2] + (srv.event_suburl, '', '', ''))
+
+    def get_scpd(self, service_type):
+        """
+        Return the SCPD document of a service as bytes. If the device has a
+        cache, the document is served from it when possible.
+
+        @param service_type: The service type URN.
+        """
+        path = self.scpd_urls[service_type]
+        if self.cache is not None:
+            data = self.cache.load(self.udn, self.software_version, path)
+            if data is not None:
+                return data
+
+        url = urlunparse((self._host[0:2] + (path, '', '', '')))
+        data = tr064.get_scpd(url, transport=self.transport)
+        if self.cache is not None:
+            self.cache.store(self.udn, self.software_version, path, data)
+        return data
+
+
+def parse_tr064desc(location, tr064desc, transport=None,
+                    device_class=None):
+    """
+    Create a :py:class:`RootDevice` from a ``tr64desc.xml`` document.
+
+    @param location: The URL the document was fetched from.
+    @param tr064desc: The document contents as bytes or file-like object.
+    @param transport: The transport used for the service proxies.
+    @param device_class: The class of the device, a :py:class:`RootDevice`
+                         subclass. Defaults to :py:class:`RootDevice`.
+    """
+    try:
+        root = marshal.decode(tr064desc, tags=('{ns}root'.format(ns=NS),))
+    except ValueError:
         raise ValueError('The document returned at {!r} is not a valid '
                          'TR-064 document!'.format(location))
 
-    spec = root.find('./{}specVersion'.format(NS))
-    spec_version = '.'.join([tag.text for tag in spec])
-
-    if spec_version != '1.0':
+    if root.spec_version != '1.0':
         raise ValueError('This library only supports TR-064 documents of '
                          'spec version 1.0! You passed in a document of '
-                         'version {!r}'.format(spec_version))
+                         'version {!r}'.format(root.spec_version))
 
+    # Services of embedded devices (WAN, LAN) are included.
     control_urls = {}
-    for srv in root.findall(
-            './{0}device/{0}serviceList/{0}service'.format(NS)):
-        service_type = srv.find('./{}serviceType'.format(NS)).text.strip()
-        control_url = srv.find('./{}controlURL'.format(NS)).text.strip()
-        control_urls[service_type] = control_url
+    scpd_urls = {}
+    for srv in root.iter_services():
+        control_urls[srv.service_type] = srv.control_url
+        scpd_urls[srv.service_type] = srv.scpdurl
+
+    if device_class is None:
+        device_class = RootDevice
+    return device_class(location, root, control_urls, transport, scpd_urls)
+
+
+def _get_cached_root_device(location, transport, cache):
+    """
+    Return the device at *location* from *cache* or ``None`` if it is not
+    cached or its firmware has changed.
+
+    Validating the cached description costs a single ``GetInfo`` call.
+    """
+    entry = cache.lookup(location)
+    if entry is None:
+        return None
+    udn, version = entry
+    tr064desc = cache.load(udn, version, urlparse(location).path)
+    if tr064desc is None:
+        return None
+
+    device = parse_tr064desc(location, tr064desc, transport)
+    try:
+        current_version = device.service(DeviceInfo).software_version
+    except minisoap.SOAPError as exc:
+        LOG.info('Unable to validate cached description of %s: %s',
+                 location, exc)
+        return None
+
+    if current_version != version:
+        LOG.info('Software version of %s changed from %s to %s',
+                 location, version, current_version)
+        return None
+
+    device.cache = cache
+    device.software_version = version
+    return device
+
+
+def _load_root_device(location, transport, cache):
+    device = None
+    if cache is not None:
+        device = _get_cached_root_device(location, transport, cache)
+
+    if device is None:
+        # The document is only needed as a whole to store it in the cache.
+        # Otherwise it is decoded while it is received.
+        tr064desc = tr064.get_tr064desc(location, transport=transport,
+                                        stream=cache is None)
+        device = parse_tr064desc(location, tr064desc, transport)
+
+    if cache is not None and device.cache is None:
+        version = device.service(DeviceInfo).software_version
+        cache.remember(location, device.udn, version)
+        cache.store(device.udn, version, urlparse(location).path, tr064desc)
+        device.cache = cache
+        device.software_version = version
+
+    return device
+
+
+def get_root_device(location=None, transport=None, cache=None,
+                    result_cache=None, discovery_cache=None, secure=False):
+    """
+    Return the :py:class:`RootDevice` at *location*.
+
+    @param location: The URL of ``tr64desc.xml``. If not given, the device is
+                     found using SSDP discovery.
+    @param transport: An optional :py:class:`fritzclient.transport.Transport`.
+    @param cache: An optional :py:class:`fritzclient.cache.DescriptionCache`.
+                  Cached descriptions are used as long as the software
+                  version of the device does not change.
+    @param result_cache: An optional :py:class:`fritzclient.cache.ResultCache`
+                         used by the service proxies of the device.
+    @param discovery_cache: An optional
+                            :py:class:`fritzclient.ssdp.DiscoveryCache`. If
+                            given, SSDP discovery only runs when no cached
+                            response is left. A cached location which can
+                            not be reached is dropped and discovery is
+                            repeated once.
+    @param secure: If true, actions are sent over HTTPS to the security port
+                   of the device (see :py:meth:`RootDevice.use_security_port`).
+    """
+
+    if transport is None:
+        transport = Transport()
+
+    if not location and discovery_cache is not None:
+        location = discovery_cache.get()['location']
+        try:
+            device = _load_root_device(location, transport, cache)
+        except requests.RequestException as exc:
+            LOG.info('Cached location %s failed (%s). Rediscovering.',
+                     location, exc)
+            discovery_cache.invalidate(location)
+            location = discovery_cache.get()['location']
+            device = _load_root_device(location, transport, cache)
+    else:
+        if not location:
+            # No location given. Run an SSDP discovery.
+            tr064_response = tr064.discover()
+            location = tr064_response['location']
+        device = _load_root_device(location, transport, cache)
+
+    device.result_cache = result_cache
+    if secure:
+        device.use_security_port()
+    return device
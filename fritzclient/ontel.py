@@ -0,0 +1,256 @@
+"""
+Call list and phone book downloads of the ``X_AVM-DE_OnTel`` service.
+
+``GetCallList`` and ``GetPhonebook`` only return the URL of an XML document
+which can hold thousands of entries. The documents are read from the
+streamed response and parsed incrementally: each ``Call`` or ``contact``
+element is turned into a compact record and dropped from the tree before
+the next one is parsed.
+
+For incremental synchronisation, :py:meth:`OnTel.calls` asks the device for
+calls newer than a known call id or list timestamp only, and
+:py:meth:`OnTel.contacts` skips contacts which were not modified since a
+given time.
+"""
+from collections import namedtuple
+from datetime import datetime
+import logging
+import xml.etree.ElementTree as etree
+
+try:
+    from urllib import urlencode
+    from urlparse import urljoin, urlunparse
+except ImportError:  # Python 3
+    from urllib.parse import urlencode, urljoin, urlunparse
+
+import requests
+
+from fritzclient import datatypes
+from fritzclient.model import ProxyObject, register_proxy_class
+
+LOG = logging.getLogger(__name__)
+
+#: Call types of the call list.
+INCOMING = 1
+MISSED = 2
+OUTGOING = 3
+ACTIVE_INCOMING = 9
+REJECTED = 10
+ACTIVE_OUTGOING = 11
+
+#: One call of the call list. *date* is a naive local time and *duration*
+#: is given in seconds.
+Call = namedtuple('Call', 'id type caller called called_number name '
+                          'number_type device port date duration path')
+
+#: One contact of a phone book. *numbers* is a tuple of ``(type, number)``
+#: tuples.
+Contact = namedtuple('Contact', 'unique_id name category numbers mod_time')
+
+
+def _to_date(text):
+    text = text.strip()
+    if not text:
+        return None
+    return datetime.strptime(text, '%d.%m.%y %H:%M')
+
+
+def _to_duration(text):
+    """
+    Convert a ``h:mm`` duration to seconds.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    hours, _, minutes = text.partition(':')
+    return (int(hours) * 60 + int(minutes or 0)) * 60
+
+
+#: Field names of :py:class:`Call`, their element names and converters.
+_CALL_FIELDS = (
+    ('id', 'Id', datatypes.to_int),
+    ('type', 'Type', datatypes.to_int),
+    ('caller', 'Caller', datatypes.to_string),
+    ('called', 'Called', datatypes.to_string),
+    ('called_number', 'CalledNumber', datatypes.to_string),
+    ('name', 'Name', datatypes.to_string),
+    ('number_type', 'Numbertype', datatypes.to_string),
+    ('device', 'Device', datatypes.to_string),
+    ('port', 'Port', datatypes.to_string),
+    ('date', 'Date', _to_date),
+    ('duration', 'Duration', _to_duration),
+    ('path', 'Path', datatypes.to_string),
+)
+
+
+def _iter_elements(source, tags):
+    """
+    Yield ``(depth, element)`` for each element named in *tags* of the
+    document read from *source* once it is complete. The element is removed
+    from the tree afterwards.
+    """
+    stack = []
+    for event, element in etree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        if element.tag in tags:
+            yield len(stack), element
+            if stack:
+                stack[-1].remove(element)
+
+
+def _call(element):
+    return Call(**dict((field, func(element.findtext(name) or ''))
+                       for field, name, func in _CALL_FIELDS))
+
+
+def _contact(element):
+    numbers = tuple((_.get('type'), (_.text or '').strip())
+                    for _ in element.iterfind('telephony/number'))
+    return Contact(
+        unique_id=datatypes.to_int(element.findtext('uniqueid') or ''),
+        name=(element.findtext('person/realName') or '').strip(),
+        category=datatypes.to_int(element.findtext('category') or ''),
+        numbers=numbers,
+        mod_time=datatypes.to_int(element.findtext('mod_time') or ''))
+
+
+class CallList(object):
+    """
+    The calls of a call list document, newest first. Iterating reads and
+    parses the document, which can only be done once. Afterwards these
+    attributes are set:
+
+        timestamp
+            The list timestamp sent by the device. Pass it as *timestamp*
+            to :py:meth:`OnTel.calls` to only fetch newer calls next time.
+
+        last_id
+            The highest call id seen, or *since_id* if no call was newer.
+
+    @param source: The document as file-like object.
+    @param since_id: If given, calls with this or a lower id are skipped.
+    """
+
+    def __init__(self, source, since_id=None):
+        self._source = source
+        self.since_id = since_id
+        self.timestamp = None
+        self.last_id = since_id
+
+    def __iter__(self):
+        try:
+            for depth, element in _iter_elements(self._source,
+                                                 ('Call', 'timestamp')):
+                if element.tag == 'timestamp':
+                    if depth == 1:
+                        self.timestamp = datatypes.to_int(element.text or '')
+                    continue
+                call = _call(element)
+                if call.id is None:
+                    yield call
+                    continue
+                if self.since_id is not None and call.id <= self.since_id:
+                    continue
+                if self.last_id is None or call.id > self.last_id:
+                    self.last_id = call.id
+                yield call
+        finally:
+            close = getattr(self._source, 'close', None)
+            if close is not None:
+                close()
+
+
+def iter_contacts(source, modified_since=None):
+    """
+    Yield a :py:class:`Contact` for each contact of a phone book document.
+
+    @param source: The document as file-like object.
+    @param modified_since: If given, contacts whose ``mod_time`` is not
+                           newer are skipped. Contacts without ``mod_time``
+                           are always yielded.
+    """
+    try:
+        for _, element in _iter_elements(source, ('contact',)):
+            contact = _contact(element)
+            if modified_since is not None and contact.mod_time is not None \
+                    and contact.mod_time <= modified_since:
+                continue
+            yield contact
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+@register_proxy_class
+class OnTel(ProxyObject):
+
+    TYPE = 'urn:dslforum-org:service:X_AVM-DE_OnTel:1'
+
+    def _open(self, url, params=None):
+        """
+        Start downloading the document at *url* and return a file-like
+        object reading its body.
+        """
+        url = urljoin(urlunparse(self._host[0:2] + ('/', '', '', '')), url)
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(sorted(
+                params.items()))
+        LOG.debug('Downloading %s', url)
+        get = self._transport.get if self._transport else requests.get
+        response = get(url, stream=True)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+
+    def call_list_url(self):
+        """
+        Return the URL of the call list document.
+        """
+        return self._execute_action('GetCallList')['NewCallListURL']
+
+    def calls(self, since_id=None, timestamp=None, days=None,
+              max_calls=None):
+        """
+        Return a :py:class:`CallList` of the calls on the device.
+
+        @param since_id: Only return calls with a higher id. The device is
+                         asked to leave out older calls.
+        @param timestamp: Only return calls since this list timestamp (see
+                          :py:attr:`CallList.timestamp`).
+        @param days: Only return calls of this many days.
+        @param max_calls: Return at most this many calls.
+        """
+        params = {}
+        if since_id is not None:
+            params['id'] = since_id
+        if timestamp is not None:
+            params['timestamp'] = timestamp
+        if days is not None:
+            params['days'] = days
+        if max_calls is not None:
+            params['max'] = max_calls
+        return CallList(self._open(self.call_list_url(), params), since_id)
+
+    def phonebook_ids(self):
+        """
+        Return the ids of all phone books.
+        """
+        value = self._execute_action('GetPhonebookList')['NewPhonebookList']
+        return [int(_) for _ in str(value).split(',') if _.strip()]
+
+    def contacts(self, phonebook_id=0, modified_since=None):
+        """
+        Yield the :py:class:`Contact` entries of a phone book.
+
+        @param phonebook_id: The id of the phone book.
+        @param modified_since: Skip contacts not modified since this time
+                               (seconds since the epoch).
+        """
+        response = self._execute_action('GetPhonebook',
+                                        {'NewPhonebookID': phonebook_id})
+        source = self._open(response['NewPhonebookURL'])
+        return iter_contacts(source, modified_since)
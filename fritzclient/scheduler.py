@@ -0,0 +1,315 @@
+"""
+Periodic execution of actions.
+
+A :py:class:`Scheduler` runs each :py:class:`Job` every *interval* seconds
+in a small pool of worker threads:
+
+* The first run of a job is delayed by a random part of its interval, so
+  jobs added at the same time do not hit the devices at the same moment.
+  Later runs keep the rate of the job without drifting.
+* If the previous run of a job is still in flight when the next one is due,
+  the tick is skipped and counted as an overrun.
+* Jobs of the same host which are due at the same time are run one after
+  another by one worker, so they share one pooled connection of the device
+  transport instead of opening several.
+
+Each job keeps its lag (how late a run started) and overrun counts, and
+:py:meth:`Scheduler.stats` sums them up.
+"""
+from collections import namedtuple
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:  # Python 3
+    import queue
+
+try:
+    from urlparse import urlparse
+except ImportError:  # Python 3
+    from urllib.parse import urlparse
+
+from fritzclient.fleet import Result
+from fritzclient.model import proxy_class
+
+LOG = logging.getLogger(__name__)
+
+#: The default number of worker threads.
+DEFAULT_WORKERS = 8
+
+#: Jobs due within this many seconds of each other run in the same batch.
+BATCH_WINDOW = 0.05
+
+
+#: The totals returned by :py:meth:`Scheduler.stats`.
+Stats = namedtuple('Stats', 'jobs runs errors overruns max_lag mean_lag')
+
+
+class Job(object):
+    """
+    An action executed periodically. Create jobs with
+    :py:meth:`Scheduler.add`. Besides the arguments given there, a job has
+    these attributes:
+
+        runs
+            The number of completed runs.
+
+        errors
+            The number of runs which raised an exception.
+
+        overruns
+            The number of ticks skipped because the previous run was still
+            in flight.
+
+        lag
+            Seconds between the time the last run was due and its start.
+
+        max_lag
+            The largest lag seen.
+
+        duration
+            Seconds the last run took.
+
+        last
+            The :py:class:`fritzclient.fleet.Result` of the last run.
+    """
+
+    def __init__(self, device, service_type, action, interval, params=None,
+                 callback=None, converters=None, lock=None):
+        self.device = device
+        self.service_type = service_type
+        self.action = action
+        self.interval = interval
+        self.params = params
+        self.callback = callback
+        self.converters = converters
+        self.host = urlparse(device.location).hostname
+        #: The time the next run is due.
+        self.due = None
+        self.running = False
+        self.cancelled = False
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.duration = 0.0
+        self.last = None
+        # Guards the counters, shared with the scheduler.
+        self._lock = lock or threading.Lock()
+
+    def __repr__(self):
+        return '<Job {} {} every {}s>'.format(self.host, self.action,
+                                              self.interval)
+
+    def run(self, scheduled=None):
+        """
+        Execute the action once and record the outcome.
+
+        @param scheduled: The time the run was due. Defaults to now.
+        """
+        started = time.time()
+        lag = max(0.0, started - (scheduled or started))
+        try:
+            proxy = self.device.service(proxy_class(self.service_type))
+            value = proxy._execute_action(self.action, self.params,
+                                          converters=self.converters)
+        except Exception as exc:
+            LOG.debug('%r failed: %s', self, exc)
+            result = Result(self, None, exc)
+        else:
+            result = Result(self, value, None)
+        with self._lock:
+            self.lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            if result.error is not None:
+                self.errors += 1
+            self.last = result
+            self.duration = time.time() - started
+            self.runs += 1
+            self.running = False
+        if self.callback is not None:
+            try:
+                self.callback(self.last)
+            except Exception:
+                LOG.exception('Callback of %r failed', self)
+
+    def cancel(self):
+        """
+        Stop running the job.
+        """
+        self.cancelled = True
+
+
+class Scheduler(object):
+    """
+    Runs :py:class:`Job` instances periodically.
+
+        workers
+            The number of worker threads. This limits the number of hosts
+            polled at the same time.
+
+        jitter
+            The part of the interval by which the first run of a job is
+            randomly delayed, between 0 and 1.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, jitter=1.0):
+        self.jitter = jitter
+        self._jobs = []
+        self._heap = []
+        self._counter = itertools.count()
+        self._batches = queue.Queue()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = True
+        self._threads = [threading.Thread(target=self._loop)]
+        self._threads.extend(threading.Thread(target=self._work)
+                             for _ in range(workers))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __iter__(self):
+        return iter(list(self._jobs))
+
+    def add(self, device, service_type, action, interval, params=None,
+            callback=None, converters=None, delay=None):
+        """
+        Add a job and return it.
+
+        @param device: A :py:class:`fritzclient.model.RootDevice`.
+        @param service_type: The service type URN.
+        @param action: The action name.
+        @param interval: Seconds between runs.
+        @param params: An optional dictionary of parameters.
+        @param callback: Called with the
+                         :py:class:`fritzclient.fleet.Result` of each run.
+        @param converters: An optional dictionary of converters for the
+                           returned :py:class:`fritzclient.minisoap.Container`.
+        @param delay: Seconds until the first run. Defaults to a random part
+                      of the interval (see *jitter*).
+        """
+        job = Job(device, service_type, action, interval, params, callback,
+                  converters, self._lock)
+        if delay is None:
+            delay = random.uniform(0, interval * self.jitter)
+        job.due = time.time() + delay
+        with self._lock:
+            self._jobs.append(job)
+            heapq.heappush(self._heap, (job.due, next(self._counter), job))
+            self._wakeup.notify()
+        return job
+
+    def remove(self, job):
+        """
+        Remove a job. A run in flight is completed.
+        """
+        job.cancel()
+        with self._lock:
+            self._jobs.remove(job)
+
+    def _take_due(self, now):
+        """
+        Pop the jobs due until *now* from the heap, schedule their next
+        run, and group them into batches by host. Jobs of the same hosts
+        which are due within :py:data:`BATCH_WINDOW` join these batches.
+        """
+        batches = {}
+        taken = []
+        while self._heap and self._heap[0][0] <= now:
+            taken.append(heapq.heappop(self._heap)[2])
+        if taken:
+            hosts = set(_.host for _ in taken)
+            others = []
+            while self._heap and self._heap[0][0] <= now + BATCH_WINDOW:
+                entry = heapq.heappop(self._heap)
+                if entry[2].host in hosts and not entry[2].running:
+                    taken.append(entry[2])
+                else:
+                    others.append(entry)
+            for entry in others:
+                heapq.heappush(self._heap, entry)
+
+        for job in taken:
+            if job.cancelled:
+                continue
+            if job.running:
+                job.overruns += 1
+                LOG.debug('Skipping %r, previous run still in flight', job)
+            else:
+                job.running = True
+                batches.setdefault(job.host, []).append((job.due, job))
+            # Keep the rate. If ticks were missed entirely, continue from
+            # the next tick in the future.
+            job.due += job.interval
+            if job.due < now:
+                missed = int((now - job.due) // job.interval) + 1
+                job.overruns += missed
+                job.due += missed * job.interval
+            heapq.heappush(self._heap, (job.due, next(self._counter), job))
+        return batches
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                now = time.time()
+                batches = self._take_due(now)
+                if not batches:
+                    wait = self._heap[0][0] - now if self._heap else None
+                    self._wakeup.wait(wait)
+                    continue
+            for batch in batches.values():
+                self._batches.put(batch)
+
+    def _work(self):
+        while True:
+            batch = self._batches.get()
+            if batch is None:
+                return
+            for scheduled, job in batch:
+                job.run(scheduled)
+
+    def stats(self):
+        """
+        Return :py:class:`Stats` summed up over all jobs.
+        """
+        with self._lock:
+            jobs = list(self._jobs)
+            runs = sum(_.runs for _ in jobs)
+            return Stats(
+                jobs=len(jobs),
+                runs=runs,
+                errors=sum(_.errors for _ in jobs),
+                overruns=sum(_.overruns for _ in jobs),
+                max_lag=max([_.max_lag for _ in jobs] or [0.0]),
+                mean_lag=(sum(_.total_lag for _ in jobs) / runs
+                          if runs else 0.0))
+
+    def close(self):
+        """
+        Stop the scheduler. Runs in flight are completed in the background.
+        """
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+        for _ in self._threads[1:]:
+            self._batches.put(None)
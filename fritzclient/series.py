@@ -0,0 +1,259 @@
+"""
+In-memory time series of traffic counters.
+
+Byte and packet counters like ``NewTotalBytesSent`` are ``ui4`` values. They
+wrap around at 2**32, which takes minutes on a fast link, and restart at
+zero when the device reboots. A :py:class:`CounterSeries` keeps the samples
+of one counter in a ring buffer backed by :py:mod:`array` arrays, so a
+sample takes 17 bytes instead of several Python objects. Values are kept as
+unsigned 64 bit integers, so wide counters stay exact. Deltas, rates and
+downsampled rates are computed over the whole buffer in one pass and
+account for wraparounds and reboots.
+
+These passes are not vectorized. :py:mod:`array` has no element-wise
+arithmetic, and vectorizing them would need numpy, which this library does
+not depend on (``requests`` is its only requirement). They run as list
+comprehensions over the arrays instead. Reading the arrays creates the
+Python objects on the fly, which makes these passes somewhat slower than
+over a list of tuples (see ``benchmarks/bench_series.py``). The gain of the
+arrays is memory, not speed.
+
+A :py:class:`CounterStore` holds the series of many devices and counters.
+Reboots are detected by the uptime of the device going backwards (see
+:py:attr:`fritzclient.model.DeviceInfo.uptime`)::
+
+    store = CounterStore()
+    store.record(device.udn, time.time(),
+                 {'sent': sent, 'received': received}, uptime=info.uptime)
+    times, rates = store[device.udn, 'sent'].rates()
+"""
+from array import array
+import threading
+
+#: The default number of samples kept per counter.
+DEFAULT_CAPACITY = 4096
+
+#: The default counter width in bits.
+DEFAULT_BITS = 32
+
+#: Marks the first sample after a reboot.
+_RESET = 1
+
+# The array type code of unsigned 64 bit integers. Python 2 has no 'Q'.
+try:
+    _UINT64 = array('Q').typecode
+except ValueError:
+    _UINT64 = 'L'
+
+
+class CounterSeries(object):
+    """
+    A ring buffer of ``(timestamp, value)`` samples of one counter. When
+    the buffer is full, the oldest sample is dropped.
+
+        capacity
+            The maximum number of samples.
+
+        bits
+            The counter width. A value lower than its predecessor is taken
+            as a wraparound at ``2 ** bits`` unless it follows a reset.
+    """
+
+    __slots__ = ('capacity', 'modulus', '_times', '_values', '_flags',
+                 '_start', '_count')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, bits=DEFAULT_BITS):
+        self.capacity = capacity
+        self.modulus = 2 ** bits
+        self._times = array('d', [0.0]) * capacity
+        self._values = array(_UINT64, [0]) * capacity
+        self._flags = array('B', [0]) * capacity
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value, reset=False):
+        """
+        Add a sample. Timestamps must not decrease.
+
+        @param timestamp: Seconds since the epoch.
+        @param value: The counter value, an integer below ``2 ** 64``.
+        @param reset: True if the counter restarted at zero since the
+                      previous sample, e.g. because the device rebooted.
+        """
+        if self._count < self.capacity:
+            index = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._times[index] = timestamp
+        self._values[index] = value
+        self._flags[index] = _RESET if reset else 0
+
+    def _ordered(self, buf):
+        if self._count < self.capacity:
+            return buf[:self._count]
+        return buf[self._start:] + buf[:self._start]
+
+    def times(self):
+        """
+        Return the sample timestamps, oldest first, as an array.
+        """
+        return self._ordered(self._times)
+
+    def values(self):
+        """
+        Return the sample values, oldest first, as an array.
+        """
+        return self._ordered(self._values)
+
+    def latest(self):
+        """
+        Return the newest ``(timestamp, value)`` sample or ``None``.
+        """
+        if not self._count:
+            return None
+        index = (self._start + self._count - 1) % self.capacity
+        return self._times[index], self._values[index]
+
+    def deltas(self):
+        """
+        Return two arrays: the timestamps of all samples but the first, and
+        the amount the counter increased since the previous sample.
+        """
+        values = self._ordered(self._values)
+        flags = self._ordered(self._flags)
+        modulus = self.modulus
+        # A reset means the counter restarted at zero.
+        deltas = array(_UINT64, [
+            value if flag else (value - previous) % modulus
+            for previous, value, flag in zip(values, values[1:], flags[1:])])
+        return self._ordered(self._times)[1:], deltas
+
+    def rates(self):
+        """
+        Return two arrays: the timestamps of all samples but the first, and
+        the rate of increase per second since the previous sample.
+        """
+        times = self._ordered(self._times)
+        values = self._ordered(self._values)
+        flags = self._ordered(self._flags)
+        modulus = self.modulus
+        ends = times[1:]
+        rates = array('d', [
+            (value if flag else (value - previous) % modulus) /
+            (end - start) if end > start else 0.0
+            for start, end, previous, value, flag in zip(
+                times, ends, values, values[1:], flags[1:])])
+        return ends, rates
+
+    def downsample(self, step):
+        """
+        Return two arrays: the start times of *step* second buckets and the
+        mean rate per second within each bucket. The increase between two
+        samples is attributed to the bucket of the later sample. Buckets
+        without samples are left out.
+        """
+        times = self._ordered(self._times)
+        ends, deltas = self.deltas()
+        starts = array('d')
+        rates = array('d')
+        bucket = None
+        amount, elapsed = 0, 0.0
+        for index in range(len(deltas)):
+            current = ends[index] - ends[index] % step
+            if current != bucket:
+                if bucket is not None:
+                    starts.append(bucket)
+                    rates.append(amount / elapsed if elapsed > 0 else 0.0)
+                bucket = current
+                amount, elapsed = 0, 0.0
+            amount += deltas[index]
+            elapsed += times[index + 1] - times[index]
+        if bucket is not None:
+            starts.append(bucket)
+            rates.append(amount / elapsed if elapsed > 0 else 0.0)
+        return starts, rates
+
+    def total(self):
+        """
+        Return the total increase over all samples in the buffer.
+        """
+        return sum(self.deltas()[1])
+
+    def clear(self):
+        """
+        Drop all samples.
+        """
+        self._start = 0
+        self._count = 0
+
+
+class CounterStore(object):
+    """
+    The :py:class:`CounterSeries` of many devices and counters, keyed by
+    ``(device, counter)`` tuples. Instances are thread-safe.
+
+        capacity
+            The number of samples kept per counter.
+
+        bits
+            A dictionary of counter widths by counter name for counters
+            which are not ``ui4``, e.g. ``{'bytes64': 64}``.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, bits=None):
+        self.capacity = capacity
+        self.bits = bits or {}
+        self._series = {}
+        self._uptimes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._series)
+
+    def __contains__(self, key):
+        return key in self._series
+
+    def __getitem__(self, key):
+        return self._series[key]
+
+    def keys(self):
+        return list(self._series)
+
+    def record(self, device, timestamp, values, uptime=None):
+        """
+        Add one sample of several counters of a device.
+
+        @param device: A key identifying the device, e.g. its UDN.
+        @param timestamp: Seconds since the epoch.
+        @param values: A dictionary of counter values by counter name.
+        @param uptime: The uptime of the device in seconds. If it is lower
+                       than the uptime recorded last, the device rebooted
+                       and all of its counters restarted at zero.
+        """
+        with self._lock:
+            reset = False
+            if uptime is not None:
+                last = self._uptimes.get(device)
+                reset = last is not None and uptime < last
+                self._uptimes[device] = uptime
+            for name, value in values.items():
+                key = (device, name)
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = CounterSeries(
+                        self.capacity, self.bits.get(name, DEFAULT_BITS))
+                series.append(timestamp, value, reset)
+
+    def remove(self, device):
+        """
+        Drop all series of a device.
+        """
+        with self._lock:
+            for key in [_ for _ in self._series if _[0] == device]:
+                del self._series[key]
+            self._uptimes.pop(device, None)
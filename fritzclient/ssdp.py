@@ -0,0 +1,256 @@
+"""
+SSDP discovery of TR-064 devices.
+"""
+from collections import OrderedDict
+import logging
+import re
+import select
+import socket
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+SSDP_GRP = '239.255.255.250'
+SSDP_PORT = 1900
+
+DISCO_MESSAGE = (
+    b'M-SEARCH * HTTP/1.1\n'
+    b'Host: 239.255.255.250:1900\n'
+    b'Man: "ssdp:discover"\n'
+    b'MX: 5\n'
+    b'ST: urn:dslforum-org:device:InternetGatewayDevice:1\n'
+)
+
+#: The search target of TR-064 root devices.
+DEFAULT_ST = 'urn:dslforum-org:device:InternetGatewayDevice:1'
+
+#: Seconds a response is valid if it does not specify a max-age.
+DEFAULT_MAX_AGE = 1800
+
+
+class SSDPError(Exception):
+    pass
+
+
+def discover():
+    sock = socket.socket(socket.AF_INET,
+                         socket.SOCK_DGRAM,
+                         socket.IPPROTO_UDP)
+    sock.settimeout(1.0)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+    sock.sendto(DISCO_MESSAGE, (SSDP_GRP, SSDP_PORT))
+    LOG.debug('Listening on {}'.format(sock))
+    try:
+        response = sock.recv(4096)
+    except socket.error as exc:
+        raise SSDPError(str(exc))
+    else:
+        return parse_response(response)
+
+
+def parse_response(response):
+    """
+    Parse an SSDP response into a dictionary with lower-case header names.
+    The HTTP status is stored as ``status_code``.
+    """
+    response = response.decode('latin-1')
+    output = {}
+    for line in response.splitlines():
+        if not line.strip():
+            continue
+        if line.startswith('HTTP/1.1'):
+            _, status, _ = line.split(None, 2)
+            status = int(status)
+            output['status_code'] = status
+            continue
+
+        name, value = line.split(':', 1)
+        name = name.lower().strip()
+        output[name] = value.strip()
+
+    return output
+
+
+def search_message(st=DEFAULT_ST, mx=3):
+    """
+    Return an M-SEARCH request for *st*. Devices spread their responses
+    over *mx* seconds.
+    """
+    return ('M-SEARCH * HTTP/1.1\r\n'
+            'Host: {}:{}\r\n'
+            'Man: "ssdp:discover"\r\n'
+            'MX: {}\r\n'
+            'ST: {}\r\n'
+            '\r\n').format(SSDP_GRP, SSDP_PORT, mx, st).encode('ascii')
+
+
+def discover_all(interfaces=None, st=DEFAULT_ST, mx=3):
+    """
+    Discover all devices answering to *st*.
+
+    This is a generator. Responses (see :py:func:`parse_response`) are
+    yielded as soon as they arrive, so callers can talk to the first device
+    while discovery is still running. Responses are collected until the
+    *mx* window of the devices has closed. Each device is yielded only
+    once, even if it answers on several interfaces.
+
+    @param interfaces: An optional list of local IPv4 addresses. The search
+                       is sent on all of them at the same time. By default,
+                       the interface chosen by the OS is used.
+    @param st: The search target.
+    @param mx: The maximum number of seconds devices wait before answering.
+    """
+    message = search_message(st, mx)
+    sockets = []
+    try:
+        for address in interfaces or [None]:
+            sock = socket.socket(socket.AF_INET,
+                                 socket.SOCK_DGRAM,
+                                 socket.IPPROTO_UDP)
+            sockets.append(sock)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            if address:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                socket.inet_aton(address))
+                sock.bind((address, 0))
+            sock.sendto(message, (SSDP_GRP, SSDP_PORT))
+            LOG.debug('Sent M-SEARCH on %s', address or 'default interface')
+
+        # Allow one more second for late responses to arrive.
+        deadline = time.time() + mx + 1
+        seen = set()
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select(sockets, [], [], remaining)
+            if not readable:
+                break
+            for sock in readable:
+                try:
+                    data, _ = sock.recvfrom(4096)
+                except socket.error as exc:
+                    LOG.debug('Unable to read SSDP response: %s', exc)
+                    continue
+                response = parse_response(data)
+                usn = response.get('usn') or response.get('location')
+                if usn in seen:
+                    continue
+                seen.add(usn)
+                yield response
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def max_age(response):
+    """
+    Return the number of seconds an SSDP response stays valid.
+    """
+    match = re.search(r'max-age\s*=\s*(\d+)',
+                      response.get('cache-control', ''))
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+def _discover_first(st):
+    """
+    Discover devices for *st* with a short *mx* window.
+    """
+    return discover_all(st=st, mx=1)
+
+
+class DiscoveryCache(object):
+    """
+    Remembers SSDP responses for as long as their ``cache-control`` header
+    allows.
+
+    Responses are kept per search target and USN. Before a response
+    expires, discovery is repeated in a background thread so callers keep
+    getting a cached location. When a cached location stops working,
+    callers should drop it with :py:meth:`invalidate`.
+
+        discover
+            A callable taking a search target and returning an iterable of
+            responses (see :py:func:`parse_response`). It defaults to
+            :py:func:`discover_all` with an *mx* of one second.
+
+        refresh_ahead
+            The fraction of the max-age before expiry at which the
+            background refresh starts.
+    """
+
+    def __init__(self, discover=_discover_first, refresh_ahead=0.1,
+                 clock=time.time):
+        self.refresh_ahead = refresh_ahead
+        self._discover = discover
+        self._clock = clock
+        self._entries = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def _store(self, st, response):
+        expires = self._clock() + max_age(response)
+        usn = response.get('usn') or response.get('location')
+        with self._lock:
+            entries = self._entries.setdefault(st, OrderedDict())
+            entries[usn] = (expires, response)
+        self._schedule_refresh(st, max_age(response))
+
+    def _schedule_refresh(self, st, age):
+        with self._lock:
+            timer = self._timers.pop(st, None)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(age * (1 - self.refresh_ahead),
+                                    self._refresh, (st,))
+            timer.daemon = True
+            self._timers[st] = timer
+        timer.start()
+
+    def _refresh(self, st):
+        LOG.debug('Refreshing SSDP responses for %s', st)
+        try:
+            for response in self._discover(st):
+                self._store(st, response)
+        except Exception:
+            LOG.exception('Unable to refresh SSDP responses for %s', st)
+
+    def get(self, st=DEFAULT_ST):
+        """
+        Return a valid response for *st*. Discovery only runs if no cached
+        response is left.
+
+        @raises SSDPError: If no device answered.
+        """
+        now = self._clock()
+        with self._lock:
+            entries = self._entries.get(st, {})
+            for usn, (expires, response) in list(entries.items()):
+                if expires > now:
+                    return response
+                del entries[usn]
+
+        for response in self._discover(st):
+            self._store(st, response)
+            return response
+        raise SSDPError('No device answered to {}'.format(st))
+
+    def invalidate(self, location):
+        """
+        Drop all responses pointing to *location*.
+        """
+        with self._lock:
+            for entries in self._entries.values():
+                for usn, (_, response) in list(entries.items()):
+                    if response.get('location') == location:
+                        del entries[usn]
+
+    def close(self):
+        """
+        Stop all background refreshes.
+        """
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
@@ -0,0 +1,194 @@
+"""
+Fake devices, servers and clocks shared by the tests and benchmarks.
+"""
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+RESPONSE = (
+    b'<?xml version="1.0"?>'
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+    b's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    b'<s:Body>'
+    b'<u:GetSecurityPortResponse xmlns:u="urn:dslforumorg:'
+    b'service:DeviceInfo:1">'
+    b'<NewSecurityPort>49443</NewSecurityPort>'
+    b'</u:GetSecurityPortResponse>'
+    b'</s:Body></s:Envelope>'
+)
+
+FAULT = (
+    b'<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+    b's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/">'
+    b'<s:Body><s:Fault>'
+    b'<faultcode>s:Client</faultcode>'
+    b'<faultstring>UPnPError</faultstring>'
+    b'<detail><UPnPError xmlns="urn:dslforum-org:control-1-0">'
+    b'<errorCode>401</errorCode>'
+    b'<errorDescription>Invalid Action</errorDescription>'
+    b'</UPnPError></detail>'
+    b'</s:Fault></s:Body></s:Envelope>'
+)
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    Serves each connection in a thread and counts the accepted connections.
+    """
+    daemon_threads = True
+    accepted = 0
+    scheme = 'http'
+
+    def process_request(self, request, client_address):
+        self.accepted += 1
+        return ThreadingMixIn.process_request(self, request, client_address)
+
+    def url(self, path=''):
+        return '%s://127.0.0.1:%d%s' % (self.scheme, self.server_address[1],
+                                        path)
+
+
+def start_server(handler, context=None, **attributes):
+    """
+    Serve *handler* on a free local port in a background thread and return
+    the server.
+
+    @param handler: The request handler class.
+    @param context: An optional :py:class:`ssl.SSLContext` to serve HTTPS.
+    @param attributes: Set on the server for the handler to use.
+    """
+    server = ThreadedHTTPServer(('127.0.0.1', 0), handler)
+    if context is not None:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        server.scheme = 'https'
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    A quiet HTTP/1.1 handler keeping connections alive like a FritzBox.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Send each response in one segment. Otherwise Nagle's algorithm and
+    # delayed ACKs stall every request on a kept-alive connection.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('content-length', 0)))
+
+    def reply(self, status, body, chunked=False, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset="utf-8"')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            half = len(body) // 2
+            for chunk in (body[:half], body[half:], b''):
+                self.wfile.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SOAPHandler(KeepAliveHandler):
+    """
+    Answers every POST with :py:data:`RESPONSE`.
+    """
+
+    def do_POST(self):
+        self.read_body()
+        self.reply(200, RESPONSE)
+
+
+class FakeProxy(object):
+    """
+    A service proxy of a :py:class:`FakeDevice`.
+    """
+
+    def __init__(self, device, service_type):
+        self.device = device
+        self.service_type = service_type
+
+    def _execute_action(self, action, params=None, converters=None):
+        device = self.device
+        with device.lock:
+            device.in_flight += 1
+            device.max_in_flight = max(device.max_in_flight,
+                                       device.in_flight)
+            device.calls.append((action, threading.current_thread().ident))
+        try:
+            time.sleep(device.delay)
+            if device.fail or action == 'Fail':
+                raise ValueError(action)
+            return dict(device.responses.get((self.service_type, action), {}))
+        finally:
+            with device.lock:
+                device.in_flight -= 1
+
+
+class FakeDevice(object):
+    """
+    Stands in for a :py:class:`fritzclient.model.RootDevice`.
+
+    Actions executed through :py:meth:`service` proxies are recorded in
+    ``calls`` as ``(action, thread ident)`` and answered from *responses*,
+    a dictionary keyed by ``(service_type, action)``. They take *delay*
+    seconds and raise :py:exc:`ValueError` if the action is ``Fail`` or
+    ``fail`` is set.
+    """
+
+    def __init__(self, location='http://10.0.0.1:49000/tr64desc.xml',
+                 udn=None, services=(), responses=None, delay=0.0):
+        self.location = location
+        self.udn = udn or 'uuid:' + location.split('/')[2]
+        self.control_urls = dict.fromkeys(services)
+        self.responses = responses or {}
+        self.delay = delay
+        self.transport = None
+        self.fail = False
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def service(self, proxy_class):
+        return FakeProxy(self, proxy_class.TYPE)
+
+    def execute(self, service_type, action, params=None):
+        return (self.udn, service_type, action, params)
+
+    def event_url(self, service_type):
+        return self.location.rsplit('/', 1)[0] + '/upnp/control/hosts'
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
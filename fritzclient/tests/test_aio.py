@@ -0,0 +1,275 @@
+from unittest import SkipTest, TestCase
+from pkg_resources import resource_string
+import sys
+import threading
+import time
+
+if sys.version_info < (3, 7):
+    raise SkipTest('The asyncio client requires Python 3.7 or newer')
+
+import asyncio
+from unittest.mock import Mock, patch
+
+import fritzclient.aio as aio
+from fritzclient import instrument
+import fritzclient.minisoap as soap
+import fritzclient.model as mdl
+from fritzclient.tests.helpers import (
+    FAULT, RESPONSE, KeepAliveHandler, start_server, stop_server)
+
+
+class FakeFritzBox(KeepAliveHandler):
+
+    def do_GET(self):
+        self.reply(200, self.server.tr64desc, chunked=True)
+
+    def do_POST(self):
+        self.read_body()
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight,
+                                       server.in_flight)
+        time.sleep(0.01)
+        with server.lock:
+            server.in_flight -= 1
+        if 'Invalid' in self.headers.get('soapaction'):
+            self.reply(500, FAULT)
+        else:
+            self.reply(200, RESPONSE)
+
+
+class FlakyFritzBox(KeepAliveHandler):
+    """
+    Fails the second request as given by ``server.failure``. Without a
+    failure, the connection is closed after the first response.
+    """
+
+    def do_POST(self):
+        self.read_body()
+        server = self.server
+        with server.lock:
+            server.posts += 1
+            number = server.posts
+        self.close_connection = number == (1 if server.failure is None
+                                           else 2)
+        if number == 2 and server.failure == 'drop':
+            return
+        if number == 2 and server.failure == 'partial':
+            self.wfile.write(b'HTTP/1.1 200 OK\r\n'
+                             b'Content-Length: 1000\r\n\r\n<s:Envelope')
+            self.wfile.flush()
+            return
+        self.reply(200, RESPONSE)
+
+
+class TestAsyncClient(TestCase):
+
+    def setUp(self):
+        self.server = start_server(
+            FakeFritzBox, lock=threading.Lock(), connections=set(),
+            in_flight=0, max_in_flight=0,
+            tr64desc=resource_string('fritzclient', 'tests/data/tr64desc.xml'))
+        self.base = self.server.url()
+        self.url = self.base + '/upnp/control/deviceinfo'
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        stop_server(self.server)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_execute(self):
+        result = self.run_async(aio.execute(self.url, 'ns',
+                                            'GetSecurityPort'))
+        self.assertEqual(result['NewSecurityPort'], 49443)
+
+    def test_execute_fault(self):
+        with self.assertRaises(soap.SOAPError) as ctx:
+            self.run_async(aio.execute(self.url, 'ns', 'InvalidAction'))
+        self.assertEqual(ctx.exception.faultcode, 's:Client')
+
+    def test_instrumentation(self):
+        calls = []
+        instrument.add_listener(calls.append)
+        try:
+            self.run_async(aio.execute(self.url, 'ns', 'GetSecurityPort'))
+            with self.assertRaises(soap.SOAPError):
+                self.run_async(aio.execute(self.url, 'ns', 'InvalidAction'))
+        finally:
+            instrument.remove_listener(calls.append)
+        self.assertEqual([_.status for _ in calls], [200, 500])
+        self.assertEqual(calls[0].response_size, len(RESPONSE))
+        self.assertGreater(calls[0].wait, 0.01)
+        self.assertIsNone(calls[0].connect)
+        self.assertEqual(calls[1].fault_code, '401')
+
+    def test_per_host_limit(self):
+        transport = aio.AsyncTransport(pool_size=2)
+        results = self.run_async(asyncio.gather(*[
+            aio.execute(self.url, 'ns', 'GetSecurityPort',
+                        transport=transport)
+            for _ in range(20)]))
+        self.run_async(transport.close())
+        self.assertEqual([_['NewSecurityPort'] for _ in results],
+                         [49443] * 20)
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(len(self.server.connections), 2)
+
+    def test_root_device(self):
+        class DeviceInfo(aio.AsyncProxyObject):
+            TYPE = 'urn:dslforum-org:service:DeviceInfo:1'
+
+        transport = aio.AsyncTransport()
+        device = self.run_async(aio.get_root_device(
+            self.base + '/tr64desc.xml', transport))
+        info = device.service(DeviceInfo)
+        result = self.run_async(info._execute_action('GetSecurityPort'))
+        self.run_async(transport.close())
+        self.assertIsInstance(device, aio.AsyncRootDevice)
+        self.assertEqual(device.udn,
+                         'uuid:739f2409-bccb-40e7-8e6c-0896D74C6BF8')
+        self.assertEqual(result['NewSecurityPort'], 49443)
+
+    def test_root_device_without_transport(self):
+        class DeviceInfo(aio.AsyncProxyObject):
+            TYPE = 'urn:dslforum-org:service:DeviceInfo:1'
+
+        close = aio.AsyncTransport.close
+        with patch.object(aio.AsyncTransport, 'close', autospec=True,
+                          side_effect=close) as mock_close:
+            device = self.run_async(aio.get_root_device(
+                self.base + '/tr64desc.xml'))
+            self.assertEqual(mock_close.call_count, 1)
+            info = device.service(DeviceInfo)
+            result = self.run_async(info._execute_action('GetSecurityPort'))
+            self.assertEqual(mock_close.call_count, 2)
+        self.assertEqual(result['NewSecurityPort'], 49443)
+
+    def test_root_device_is_async(self):
+        transport = aio.AsyncTransport()
+        device = self.run_async(aio.get_root_device(
+            self.base + '/tr64desc.xml', transport))
+        result = self.run_async(device.execute(
+            'urn:dslforum-org:service:DeviceInfo:1', 'GetSecurityPort'))
+        self.assertEqual(result['NewSecurityPort'], 49443)
+        self.assertIs(self.run_async(device.use_security_port()), device)
+        self.run_async(transport.close())
+        self.assertTrue(device.secure)
+        self.assertEqual(device._host.port, 49443)
+
+    def test_root_device_refuses_sync_members(self):
+        transport = aio.AsyncTransport()
+        device = self.run_async(aio.get_root_device(
+            self.base + '/tr64desc.xml', transport))
+        service_type = 'urn:dslforum-org:service:DeviceInfo:1'
+        with self.assertRaises(TypeError):
+            device.service(mdl.DeviceInfo)
+        with self.assertRaises(NotImplementedError):
+            device.get_service(service_type)
+        with self.assertRaises(NotImplementedError):
+            device.get_scpd(service_type)
+
+        class DeviceInfo(aio.AsyncProxyObject):
+            TYPE = service_type
+            security_port = mdl.ResponseValue('GetSecurityPort',
+                                              'NewSecurityPort')
+
+        info = device.service(DeviceInfo)
+        with self.assertRaises(NotImplementedError):
+            info.security_port
+        with self.assertRaises(NotImplementedError):
+            info.refresh()
+        self.run_async(transport.close())
+
+
+class TestRetries(TestCase):
+
+    def setUp(self):
+        self.server = start_server(FlakyFritzBox, lock=threading.Lock(),
+                                   posts=0, failure=None)
+        self.url = self.server.url('/upnp/control/deviceinfo')
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.transport = aio.AsyncTransport()
+
+    def tearDown(self):
+        self.run_async(self.transport.close())
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        stop_server(self.server)
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def execute(self):
+        return self.run_async(aio.execute(self.url, 'ns', 'GetSecurityPort',
+                                          transport=self.transport))
+
+    def test_idle_connection_closed(self):
+        self.execute()
+        # Let the loop see the end of the idle connection.
+        self.run_async(asyncio.sleep(0.1))
+        self.assertEqual(self.execute()['NewSecurityPort'], 49443)
+        self.assertEqual(self.server.posts, 2)
+        self.assertEqual(self.server.accepted, 2)
+
+    def test_closed_before_response(self):
+        self.server.failure = 'drop'
+        self.execute()
+        self.assertEqual(self.execute()['NewSecurityPort'], 49443)
+        self.assertEqual(self.server.posts, 3)
+
+    def test_closed_during_response(self):
+        self.server.failure = 'partial'
+        self.execute()
+        with self.assertRaises(asyncio.IncompleteReadError):
+            self.execute()
+        self.assertEqual(self.server.posts, 2)
+
+
+class TestEventStream(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_iterate(self):
+        stream = aio.EventStream(self.loop)
+        stream.subscription = subscription = Mock()
+        thread = threading.Thread(
+            target=lambda: [stream._put(_) for _ in range(3)])
+        thread.start()
+        thread.join()
+        received = [self.run_async(stream.__anext__()) for _ in range(3)]
+        self.assertEqual(received, [0, 1, 2])
+        self.run_async(stream.close())
+        self.assertTrue(subscription.cancel.called)
+        with self.assertRaises(StopAsyncIteration):
+            self.run_async(stream.__anext__())
+
+    def test_subscribe(self):
+        server = Mock()
+        stream = self.run_async(aio.subscribe(server, 'device',
+                                              'urn:Hosts:1', timeout=300))
+        args, kwargs = server.subscribe.call_args
+        self.assertEqual(args[:2], ('device', 'urn:Hosts:1'))
+        self.assertEqual(kwargs, {'timeout': 300})
+        self.assertIs(stream.subscription, server.subscribe.return_value)
+        args[2]('event')
+        self.assertEqual(self.run_async(stream.__anext__()), 'event')
+
+
+# vim: set path+=fritzclient :
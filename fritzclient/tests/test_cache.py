@@ -0,0 +1,263 @@
+from pkg_resources import resource_string
+from unittest import TestCase
+import shutil
+import tempfile
+import threading
+
+from mock import Mock, patch
+
+from fritzclient.cache import DefinitionStore, DescriptionCache, ResultCache
+import fritzclient.model as mdl
+from fritzclient.tests.helpers import FakeClock
+
+
+LOCATION = 'http://192.168.179.1:49000/tr64desc.xml'
+UDN = 'uuid:739f2409-bccb-40e7-8e6c-0896D74C6BF8'
+
+
+class CacheTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DescriptionCache(self.directory)
+        self.tr064desc = resource_string('fritzclient',
+                                         'tests/data/tr64desc.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestDescriptionCache(CacheTest):
+
+    def test_roundtrip(self):
+        self.cache.remember(LOCATION, UDN, '84.06.85')
+        self.cache.store(UDN, '84.06.85', '/tr64desc.xml', self.tr064desc)
+
+        other = DescriptionCache(self.directory)
+        self.assertEqual(other.lookup(LOCATION), (UDN, '84.06.85'))
+        self.assertEqual(other.load(UDN, '84.06.85', '/tr64desc.xml'),
+                         self.tr064desc)
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.lookup(LOCATION))
+        self.assertIsNone(self.cache.load(UDN, '84.06.85', '/tr64desc.xml'))
+
+    def test_new_version_removes_old_documents(self):
+        self.cache.remember(LOCATION, UDN, '84.06.85')
+        self.cache.store(UDN, '84.06.85', '/tr64desc.xml', self.tr064desc)
+        self.cache.remember(LOCATION, UDN, '84.06.90')
+        self.assertEqual(self.cache.lookup(LOCATION), (UDN, '84.06.90'))
+        self.assertIsNone(self.cache.load(UDN, '84.06.85', '/tr64desc.xml'))
+
+    def test_concurrent_remember(self):
+        locations = ['http://10.0.0.{}:49000/tr64desc.xml'.format(_)
+                     for _ in range(50)]
+        threads = [threading.Thread(target=self.cache.remember,
+                                    args=(_, UDN, '84.06.85'))
+                   for _ in locations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        other = DescriptionCache(self.directory)
+        for location in locations:
+            self.assertEqual(other.lookup(location), (UDN, '84.06.85'))
+
+
+class TestCachedRootDevice(CacheTest):
+
+    def get_root_device(self, software_version):
+        with patch('fritzclient.model.tr064') as mock_tr064, \
+                patch('fritzclient.model.minisoap') as mock_soap:
+            mock_tr064.get_tr064desc.return_value = self.tr064desc
+            mock_tr064.get_scpd.return_value = b'<scpd />'
+            mock_soap.execute.return_value = {
+                'NewSoftwareVersion': software_version}
+            device = mdl.get_root_device(LOCATION, cache=self.cache)
+            device.get_scpd('urn:dslforum-org:service:DeviceInfo:1')
+        return device, mock_tr064, mock_soap
+
+    def test_cold_start(self):
+        device, mock_tr064, mock_soap = self.get_root_device('84.06.85')
+        self.assertEqual(device.udn, UDN)
+        self.assertTrue(mock_tr064.get_tr064desc.called)
+        self.assertTrue(mock_tr064.get_scpd.called)
+
+    def test_cached_start_needs_one_request(self):
+        self.get_root_device('84.06.85')
+        device, mock_tr064, mock_soap = self.get_root_device('84.06.85')
+        self.assertEqual(device.udn, UDN)
+        self.assertEqual(device.software_version, '84.06.85')
+        self.assertFalse(mock_tr064.get_tr064desc.called)
+        self.assertFalse(mock_tr064.get_scpd.called)
+        self.assertEqual(mock_soap.execute.call_count, 1)
+
+    def test_firmware_update(self):
+        self.get_root_device('84.06.85')
+        device, mock_tr064, mock_soap = self.get_root_device('84.06.90')
+        self.assertEqual(device.software_version, '84.06.90')
+        self.assertTrue(mock_tr064.get_tr064desc.called)
+        self.assertTrue(mock_tr064.get_scpd.called)
+        self.assertEqual(self.cache.lookup(LOCATION), (UDN, '84.06.90'))
+
+
+class TestResultCache(TestCase):
+
+    URL = 'http://192.168.179.1:49000/upnp/control/wancommonifconfig1'
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResultCache(ttls={'GetTotalBytesSent': 5},
+                                 clock=self.clock)
+
+    def test_ttl(self):
+        self.assertEqual(self.cache.ttl('GetTotalBytesSent'), 5)
+        self.assertEqual(self.cache.ttl('GetInfo'), 1.0)
+        self.assertEqual(self.cache.ttl('X_AVM-DE_GetCallList'), 1.0)
+        self.assertEqual(self.cache.ttl('SetEnable'), 0)
+        self.assertEqual(self.cache.ttl('X_AVM-DE_DeleteHostEntry'), 0)
+        self.assertEqual(self.cache.ttl('Reboot'), 0)
+
+    def test_hit_until_expiry(self):
+        func = Mock(side_effect=[1, 2])
+        self.assertEqual(self.cache.call(self.URL, 'GetTotalBytesSent',
+                                         None, func), 1)
+        self.clock.now += 4
+        self.assertEqual(self.cache.call(self.URL, 'GetTotalBytesSent',
+                                         None, func), 1)
+        self.clock.now += 2
+        self.assertEqual(self.cache.call(self.URL, 'GetTotalBytesSent',
+                                         None, func), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_params_are_part_of_the_key(self):
+        func = Mock(side_effect=[1, 2])
+        self.cache.call(self.URL, 'GetGenericHostEntry', {'NewIndex': 1},
+                        func)
+        result = self.cache.call(self.URL, 'GetGenericHostEntry',
+                                 {'NewIndex': 2}, func)
+        self.assertEqual(result, 2)
+
+    def test_converters_are_part_of_the_key(self):
+        func = Mock(side_effect=['0042', 42])
+        result = self.cache.call(self.URL, 'GetInfo', None, func,
+                                 {'NewUpTime': str})
+        self.assertEqual(result, '0042')
+        result = self.cache.call(self.URL, 'GetInfo', None, func,
+                                 {'NewUpTime': int})
+        self.assertEqual(result, 42)
+        result = self.cache.call(self.URL, 'GetInfo', None, func,
+                                 {'NewUpTime': str})
+        self.assertEqual(result, '0042')
+        self.assertEqual(func.call_count, 2)
+
+    def test_write_bypasses_and_invalidates(self):
+        self.cache.call(self.URL, 'GetInfo', None, Mock(return_value=1))
+        setter = Mock(return_value='ok')
+        self.cache.call(self.URL, 'SetEnable', {'NewEnable': 1}, setter)
+        self.cache.call(self.URL, 'SetEnable', {'NewEnable': 1}, setter)
+        self.assertEqual(setter.call_count, 2)
+        result = self.cache.call(self.URL, 'GetInfo', None,
+                                 Mock(return_value=2))
+        self.assertEqual(result, 2)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_results=2, clock=self.clock)
+        cache.call(self.URL, 'GetA', None, Mock(return_value='a'))
+        cache.call(self.URL, 'GetB', None, Mock(return_value='b'))
+        cache.call(self.URL, 'GetA', None, Mock())
+        cache.call(self.URL, 'GetC', None, Mock(return_value='c'))
+        self.assertEqual(cache.call(self.URL, 'GetA', None, Mock()), 'a')
+        self.assertEqual(
+            cache.call(self.URL, 'GetB', None, Mock(return_value='new')),
+            'new')
+
+    def test_errors_are_not_cached(self):
+        with self.assertRaises(ValueError):
+            self.cache.call(self.URL, 'GetInfo', None,
+                            Mock(side_effect=ValueError))
+        result = self.cache.call(self.URL, 'GetInfo', None,
+                                 Mock(return_value=1))
+        self.assertEqual(result, 1)
+
+    def test_coalescing(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.call(self.URL, 'GetInfo', None, slow_call)))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while self.cache.coalesced < 4:
+            threading.Event().wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['result'] * 5)
+
+
+class TestProxyWithResultCache(TestCase):
+
+    @patch('fritzclient.model.minisoap')
+    def test_proxy_uses_result_cache(self, mock_soap):
+        class WANCommonInterfaceConfig(mdl.ProxyObject):
+            TYPE = 'urn:dslforum-org:service:WANCommonInterfaceConfig:1'
+
+        mock_soap.execute.return_value = {'NewTotalBytesSent': 10}
+        proxy = WANCommonInterfaceConfig(
+            {WANCommonInterfaceConfig.TYPE: '/upnp/control/wancommon'},
+            None, ('http', '192.168.179.1:49000'),
+            result_cache=ResultCache())
+        proxy._execute_action('GetTotalBytesSent')
+        proxy._execute_action('GetTotalBytesSent')
+        self.assertEqual(mock_soap.execute.call_count, 1)
+
+
+class TestDefinitionStore(TestCase):
+
+    def setUp(self):
+        self.scpd = resource_string('fritzclient',
+                                    'tests/data/scpd/wlanconfigSCPD.xml')
+        self.parse = Mock(side_effect=mdl.SCPD.parse)
+        self.store = DefinitionStore(self.parse)
+
+    def test_parse_once(self):
+        first = self.store.get(self.scpd)
+        second = self.store.get(bytes(bytearray(self.scpd)))
+        self.assertIs(first, second)
+        self.assertEqual(self.parse.call_count, 1)
+        self.assertEqual((self.store.hits, self.store.misses), (1, 1))
+        self.assertEqual(self.store.bytes_saved, len(self.scpd))
+        self.assertEqual(self.store.hit_rate, 0.5)
+
+    def test_different_documents(self):
+        other = resource_string('fritzclient',
+                                'tests/data/scpd/deviceinfoSCPD.xml')
+        self.assertIsNot(self.store.get(self.scpd), self.store.get(other))
+        self.assertEqual(len(self.store), 2)
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.hit_rate, 0.0)
+
+    def test_services_share_definitions(self):
+        services = [mdl.Service('urn:WLANConfiguration-com:serviceId:'
+                                'WLANConfiguration1',
+                                scpd_doc=self.scpd, definitions=self.store)
+                    for _ in range(3)]
+        self.assertIs(services[0].scpd, services[2].scpd)
+        self.assertIs(services[0].actions['GetSSID'],
+                      services[1].actions['GetSSID'])
+        self.assertEqual(self.parse.call_count, 1)
+
+
+# vim: set path+=fritzclient :
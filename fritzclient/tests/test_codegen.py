@@ -0,0 +1,85 @@
+from pkg_resources import resource_filename, resource_string
+from unittest import TestCase
+
+from mock import patch
+
+from fritzclient import codegen, datatypes, minisoap
+import fritzclient.model as mdl
+
+
+WLAN_TYPE = 'urn:dslforum-org:service:WLANConfiguration:1'
+INFO_TYPE = 'urn:dslforum-org:service:DeviceInfo:1'
+
+
+def load(source):
+    namespace = {}
+    exec(compile(source, '<generated>', 'exec'), namespace)
+    return namespace
+
+
+class TestCodegen(TestCase):
+
+    def setUp(self):
+        self.registered = dict(mdl._PROXY_CLASSES)
+        self.source = codegen.generate([
+            (WLAN_TYPE, resource_string(
+                'fritzclient', 'tests/data/scpd/wlanconfigSCPD.xml')),
+            (INFO_TYPE, resource_string(
+                'fritzclient', 'tests/data/scpd/deviceinfoSCPD.xml')),
+        ])
+        self.module = load(self.source)
+
+    def tearDown(self):
+        mdl._PROXY_CLASSES.clear()
+        mdl._PROXY_CLASSES.update(self.registered)
+
+    def test_identifier(self):
+        self.assertEqual(codegen.identifier('X_AVM-DE_GetInfo'),
+                         'X_AVM_DE_GetInfo')
+        self.assertEqual(codegen.identifier('class'), '_class')
+        self.assertEqual(codegen.class_name(WLAN_TYPE), 'WLANConfiguration1')
+
+    def test_classes_are_registered(self):
+        cls = self.module['WLANConfiguration1']
+        self.assertEqual(cls.TYPE, WLAN_TYPE)
+        self.assertIn('GetSSID', cls.ACTIONS)
+        self.assertIs(mdl.proxy_class(WLAN_TYPE), cls)
+        self.assertIs(mdl.proxy_class(INFO_TYPE), self.module['DeviceInfo1'])
+
+    @patch('fritzclient.model.minisoap')
+    def test_method_call(self, mock_soap):
+        cls = self.module['WLANConfiguration1']
+        proxy = cls({WLAN_TYPE: '/upnp/control/wlanconfig1'}, None,
+                    ('http', '192.168.179.1:49000'))
+        proxy.SetSSID('home')
+        args, kwargs = mock_soap.execute.call_args
+        self.assertEqual(args[2:4], ('SetSSID', {'NewSSID': 'home'}))
+        self.assertEqual(kwargs['template'].render(['home']),
+                         minisoap.render_message(WLAN_TYPE, 'SetSSID',
+                                                 {'NewSSID': 'home'}))
+
+        proxy.GetInfo()
+        args, kwargs = mock_soap.execute.call_args
+        self.assertIs(kwargs['converters']['NewEnable'], datatypes.to_boolean)
+        self.assertIs(kwargs['converters']['NewChannel'], datatypes.to_int)
+
+    def test_root_device_uses_generated_class(self):
+        device = mdl.parse_tr064desc(
+            'http://192.168.179.1:49000/tr64desc.xml',
+            resource_string('fritzclient', 'tests/data/tr64desc.xml'))
+        with patch('fritzclient.model.tr064') as mock_tr064:
+            service = device.get_service(WLAN_TYPE)
+        self.assertIsInstance(service, self.module['WLANConfiguration1'])
+        self.assertFalse(mock_tr064.get_scpd.called)
+
+    def test_from_directory(self):
+        services = dict(codegen.services_from_directory(
+            resource_string('fritzclient', 'tests/data/tr64desc.xml'),
+            resource_filename('fritzclient', 'tests/data/scpd')))
+        self.assertIn(WLAN_TYPE, services)
+        source = codegen.generate(services.items())
+        self.assertIn('class X_AVM_DE_TAM1(ProxyObject):', source)
+        load(source)
+
+
+# vim: set path+=fritzclient :
@@ -0,0 +1,224 @@
+from unittest import TestCase
+import time
+import xml.etree.ElementTree as etree
+
+from mock import Mock
+import requests
+
+from fritzclient import datatypes, exporter
+from fritzclient.exporter import Exporter
+from fritzclient.tests.helpers import FakeDevice
+
+RESPONSES = {
+    (exporter.DEVICE_INFO, 'GetInfo'): {
+        'NewModelName': 'FRITZ!Box 7490',
+        'NewSerialNumber': '0123456789AB',
+        'NewSoftwareVersion': '113.06.83',
+        'NewHardwareVersion': 'FRITZ!Box "7490"',
+        'NewUpTime': '3600',
+    },
+    (exporter.WAN_COMMON, 'GetTotalBytesSent'): {
+        'NewTotalBytesSent': '4294967000',
+    },
+    (exporter.WAN_DSL, 'GetInfo'): {
+        'NewStatus': 'Up',
+        'NewUpstreamCurrRate': '40000',
+        'NewDownstreamNoiseMargin': '95',
+    },
+    (exporter.WLAN.format('2'), 'GetTotalAssociations'): {
+        'NewTotalAssociations': '7',
+    },
+    (exporter.HOSTS, 'GetHostNumberOfEntries'): {
+        'NewHostNumberOfEntries': '42',
+    },
+}
+
+
+def fake_device(host='10.0.0.1', port=49000, delay=0.0, services=None):
+    return FakeDevice('http://{}:{}/tr64desc.xml'.format(host, port),
+                      services=services or [_.service_type
+                                            for _ in exporter.COLLECTIONS],
+                      responses=RESPONSES, delay=delay)
+
+
+class TestExporter(TestCase):
+
+    def setUp(self):
+        self.exporter = Exporter(interval=0.05, jitter=0)
+
+    def tearDown(self):
+        self.exporter.close()
+
+    def wait_for(self, condition, timeout=3.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def collected(self, device, runs=1):
+        return self.wait_for(lambda: all(
+            _.count >= runs for _ in self.exporter._entries.values()
+            if _.job.device is device))
+
+    def test_render(self):
+        device = fake_device()
+        self.exporter.add(device)
+        self.assertTrue(self.collected(device))
+        text = self.exporter.render()
+        self.assertIn(
+            'fritzbox_info{device="10.0.0.1:49000",model="FRITZ!Box 7490",'
+            'serial="0123456789AB",software_version="113.06.83",'
+            'hardware_version="FRITZ!Box \\"7490\\""} 1.0\n', text)
+        self.assertIn('# TYPE fritzbox_wan_sent_bytes_total counter\n'
+                      'fritzbox_wan_sent_bytes_total{device="10.0.0.1:49000"} '
+                      '4294967000.0\n', text)
+        self.assertIn('fritzbox_dsl_up{device="10.0.0.1:49000"} 1.0\n', text)
+        self.assertIn('fritzbox_dsl_upstream_bits_per_second'
+                      '{device="10.0.0.1:49000"} 40000000.0\n', text)
+        self.assertIn('fritzbox_dsl_downstream_noise_margin_db'
+                      '{device="10.0.0.1:49000"} 9.5\n', text)
+        self.assertIn('fritzbox_wlan_associations'
+                      '{device="10.0.0.1:49000",wlan="2"} 7.0\n', text)
+        self.assertIn('fritzbox_hosts{device="10.0.0.1:49000"} 42.0\n', text)
+        self.assertIn('fritzbox_up{device="10.0.0.1:49000"} 1.0\n', text)
+        self.assertEqual(text.count('# TYPE fritzbox_wlan_associations '),
+                         1)
+        # Arguments missing from a response are left out.
+        self.assertNotIn('fritzbox_wan_received_bytes_total{', text)
+        self.assertNotIn('# EOF', text)
+
+    def test_collection_latency(self):
+        device = fake_device(delay=0.02)
+        self.exporter.add(device)
+        self.assertTrue(self.collected(device, 2))
+        text = self.exporter.render()
+        labels = ('{device="10.0.0.1:49000",service="Hosts:1",'
+                  'action="GetHostNumberOfEntries"}')
+        line = [_ for _ in text.splitlines() if _.startswith(
+            'fritzbox_exporter_collect_duration_seconds_sum' + labels)][0]
+        self.assertGreaterEqual(float(line.split()[-1]), 0.04)
+        self.assertIn('# TYPE fritzbox_exporter_collect_duration_seconds '
+                      'summary\n', text)
+        self.assertIn('fritzbox_exporter_collect_errors_total' + labels +
+                      ' 0.0\n', text)
+
+    def test_failures(self):
+        device = fake_device(services=[exporter.HOSTS])
+        self.exporter.add(device)
+        self.assertTrue(self.collected(device))
+        device.fail = True
+        self.assertTrue(self.wait_for(lambda: 'fritzbox_hosts{' not in
+                                      self.exporter.render()))
+        text = self.exporter.render()
+        self.assertIn('fritzbox_up{device="10.0.0.1:49000"} 0.0\n', text)
+        self.assertNotIn('errors_total{device="10.0.0.1:49000",'
+                         'service="Hosts:1",'
+                         'action="GetHostNumberOfEntries"} 0.0', text)
+
+    def test_skips_missing_services(self):
+        device = fake_device(services=[exporter.DEVICE_INFO, exporter.HOSTS])
+        self.exporter.add(device)
+        self.assertEqual(sorted(_.job.action for _ in
+                                self.exporter._entries.values()),
+                         ['GetHostNumberOfEntries', 'GetInfo'])
+
+    def test_scpd_converters(self):
+        converters = {'NewHostNumberOfEntries': datatypes.to_int}
+        device = fake_device(services=[exporter.HOSTS])
+        device.get_service = Mock(return_value=Mock(
+            spec=['actions'], actions={
+                'GetHostNumberOfEntries': Mock(converters=converters)}))
+        self.exporter.add(device)
+        device.get_service.assert_called_once_with(exporter.HOSTS)
+        job = list(self.exporter._entries)[0]
+        self.assertEqual(job.converters, converters)
+
+    def test_generated_proxy_converters(self):
+        class Hosts(object):
+            ACTIONS = ('GetGenericHostEntry', 'GetHostNumberOfEntries')
+            _CONVERTERS_1 = {'NewHostNumberOfEntries': datatypes.to_int}
+
+        device = fake_device(services=[exporter.HOSTS])
+        device.get_service = Mock(return_value=Hosts())
+        self.exporter.add(device)
+        job = list(self.exporter._entries)[0]
+        self.assertEqual(job.converters, Hosts._CONVERTERS_1)
+
+    def test_empty_elements(self):
+        device = fake_device(services=[exporter.DEVICE_INFO])
+        device.responses = {(exporter.DEVICE_INFO, 'GetInfo'): {
+            'NewModelName': 'FRITZ!Box 7490',
+            'NewSerialNumber': etree.Element('NewSerialNumber'),
+            'NewUpTime': etree.Element('NewUpTime'),
+        }}
+        self.exporter.add(device)
+        self.assertTrue(self.collected(device))
+        text = self.exporter.render()
+        self.assertIn('fritzbox_info{device="10.0.0.1:49000",'
+                      'model="FRITZ!Box 7490",serial="",'
+                      'software_version="",hardware_version=""} 1.0\n', text)
+        self.assertNotIn('fritzbox_uptime_seconds{', text)
+        self.assertIn('fritzbox_up{device="10.0.0.1:49000"} 1.0\n', text)
+
+    def test_several_devices(self):
+        devices = [fake_device('10.0.0.%d' % _, services=[exporter.HOSTS])
+                   for _ in (1, 2)]
+        for device in devices:
+            self.exporter.add(device)
+        self.assertEqual(len(self.exporter), 2)
+        self.assertTrue(all(self.collected(_) for _ in devices))
+        text = self.exporter.render()
+        self.assertIn('fritzbox_hosts{device="10.0.0.1:49000"} 42.0\n'
+                      'fritzbox_hosts{device="10.0.0.2:49000"} 42.0\n', text)
+        self.exporter.remove(devices[0])
+        self.assertNotIn('device="10.0.0.1:49000"', self.exporter.render())
+
+    def test_same_host_different_ports(self):
+        devices = [fake_device(port=_, services=[exporter.HOSTS])
+                   for _ in (49000, 49001)]
+        devices[1].fail = True
+        for device in devices:
+            self.exporter.add(device)
+        self.assertTrue(all(self.collected(_) for _ in devices))
+        text = self.exporter.render()
+        self.assertIn('fritzbox_hosts{device="10.0.0.1:49000"} 42.0\n', text)
+        self.assertNotIn('fritzbox_hosts{device="10.0.0.1:49001"}', text)
+        self.assertIn('fritzbox_up{device="10.0.0.1:49000"} 1.0\n'
+                      'fritzbox_up{device="10.0.0.1:49001"} 0.0\n', text)
+
+    def test_openmetrics(self):
+        device = fake_device(services=[exporter.WAN_COMMON])
+        self.exporter.add(device)
+        self.assertTrue(self.collected(device))
+        text = self.exporter.render(openmetrics=True)
+        self.assertIn('# TYPE fritzbox_wan_sent_bytes counter\n'
+                      'fritzbox_wan_sent_bytes_total'
+                      '{device="10.0.0.1:49000"} ',
+                      text)
+        self.assertTrue(text.endswith('# EOF\n'))
+
+    def test_scrape_does_not_wait_for_devices(self):
+        device = fake_device(delay=0.5, services=[exporter.HOSTS])
+        self.exporter.add(device)
+        port = self.exporter.serve('127.0.0.1', 0)
+        url = 'http://127.0.0.1:%d/metrics' % port
+        self.assertTrue(self.collected(device))
+        calls = len(device.calls)
+        start = time.time()
+        response = requests.get(url)
+        self.assertLess(time.time() - start, 0.3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'],
+                         exporter.TEXT_CONTENT_TYPE)
+        self.assertIn('fritzbox_hosts{device="10.0.0.1:49000"} 42.0',
+                      response.text)
+        self.assertLessEqual(len(device.calls) - calls, 1)
+
+        response = requests.get(url, headers={
+            'Accept': 'application/openmetrics-text; version=1.0.0'})
+        self.assertTrue(response.text.endswith('# EOF\n'))
+        self.assertEqual(requests.get(url[:-len('metrics')]).status_code,
+                         404)
+
+
+# vim: set path+=fritzclient :
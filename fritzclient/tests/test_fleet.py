@@ -0,0 +1,131 @@
+from unittest import TestCase
+import threading
+import time
+
+from mock import patch
+
+from fritzclient.fleet import Fleet
+from fritzclient.tests.helpers import FakeDevice
+
+
+def fake_get_root_device(location, transport, cache, result_cache):
+    return FakeDevice(location)
+
+
+class ConcurrencyCounter(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = {}
+        self.maximum = {}
+
+    def __call__(self, device):
+        host = device.location.split('/')[2].split(':')[0]
+        with self.lock:
+            self.current[host] = self.current.get(host, 0) + 1
+            self.current['all'] = self.current.get('all', 0) + 1
+            for key in (host, 'all'):
+                self.maximum[key] = max(self.maximum.get(key, 0),
+                                        self.current[key])
+        time.sleep(0.02)
+        with self.lock:
+            self.current[host] -= 1
+            self.current['all'] -= 1
+        return host
+
+
+@patch('fritzclient.fleet.get_root_device', fake_get_root_device)
+class TestFleet(TestCase):
+
+    LOCATIONS = ['http://10.0.0.{}:49000/tr64desc.xml'.format(_)
+                 for _ in range(1, 6)]
+
+    def test_registry(self):
+        fleet = Fleet()
+        for location in self.LOCATIONS:
+            fleet.add(location)
+        device = fleet.add(self.LOCATIONS[0])
+
+        self.assertEqual(len(fleet), 5)
+        self.assertIs(fleet[self.LOCATIONS[0]], device)
+        self.assertIs(fleet['uuid:10.0.0.1:49000'], device)
+
+        fleet.remove('uuid:10.0.0.1:49000')
+        self.assertNotIn(self.LOCATIONS[0], fleet)
+        self.assertEqual(len(fleet), 4)
+
+    def test_add_all(self):
+        fleet = Fleet()
+        results = list(fleet.add_all(self.LOCATIONS))
+        self.assertEqual(sorted(_.item for _ in results), self.LOCATIONS)
+        self.assertEqual(len(fleet), 5)
+
+    def test_shared_transport_per_host(self):
+        fleet = Fleet()
+        first = fleet.transport('http://10.0.0.1:49000/tr64desc.xml')
+        second = fleet.transport('http://10.0.0.1:49000/other.xml')
+        other = fleet.transport('http://10.0.0.2:49000/tr64desc.xml')
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_map_action(self):
+        fleet = Fleet()
+        list(fleet.add_all(self.LOCATIONS))
+        results = list(fleet.map('GetInfo', service_type='urn:DeviceInfo:1'))
+        self.assertEqual(len(results), 5)
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(result.value, (result.item.udn,
+                                            'urn:DeviceInfo:1', 'GetInfo',
+                                            None))
+
+    def test_map_reports_errors(self):
+        fleet = Fleet()
+        list(fleet.add_all(self.LOCATIONS[:2]))
+
+        def fail(device):
+            raise ValueError(device.udn)
+
+        results = list(fleet.map(fail))
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertIsInstance(result.error, ValueError)
+            self.assertIsNone(result.value)
+
+    def test_global_limit(self):
+        fleet = Fleet(max_workers=2)
+        list(fleet.add_all(self.LOCATIONS))
+        counter = ConcurrencyCounter()
+        list(fleet.map(counter))
+        self.assertEqual(counter.maximum['all'], 2)
+
+    def test_per_host_limit(self):
+        fleet = Fleet(per_host=1)
+        devices = [FakeDevice('http://10.0.0.1:{}/tr64desc.xml'.format(_),
+                              str(_)) for _ in range(4)]
+        counter = ConcurrencyCounter()
+        list(fleet.map(counter, devices))
+        self.assertEqual(counter.maximum['10.0.0.1'], 1)
+
+    @patch('fritzclient.fleet.EventServer')
+    def test_subscribe(self, mock_server):
+        # Create the child mock up front. The workers would otherwise race
+        # to create it on Python 2 and count their calls on different mocks.
+        server = mock_server.return_value
+        server.subscribe
+        fleet = Fleet()
+        list(fleet.add_all(self.LOCATIONS[:3]))
+        callback = []
+        results = list(fleet.subscribe('urn:Hosts:1', callback.append,
+                                       timeout=300))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(mock_server.call_count, 1)
+        self.assertEqual(server.subscribe.call_count, 3)
+        self.assertEqual(server.subscribe.call_args[0][1:],
+                         ('urn:Hosts:1', callback.append))
+        self.assertEqual(server.subscribe.call_args[1], {'timeout': 300})
+        fleet.close()
+        self.assertTrue(server.close.called)
+
+
+# vim: set path+=fritzclient :
@@ -0,0 +1,190 @@
+from unittest import TestCase
+import threading
+import time
+
+import requests
+
+from fritzclient import datatypes, gena
+from fritzclient.model import Service
+from fritzclient.tests.helpers import (
+    FakeDevice, KeepAliveHandler, start_server, stop_server)
+
+HOSTS_TYPE = 'urn:dslforum-org:service:Hosts:1'
+
+PROPERTYSET = (
+    b'<?xml version="1.0"?>'
+    b'<e:propertyset xmlns:e="urn:schemas-upnp-org:event-1-0">'
+    b'<e:property><HostNumberOfEntries>%d</HostNumberOfEntries>'
+    b'</e:property>'
+    b'<e:property><X_AVM-DE_ChangeCounter>7</X_AVM-DE_ChangeCounter>'
+    b'</e:property>'
+    b'</e:propertyset>'
+)
+
+SCPD = (
+    b'<?xml version="1.0"?>'
+    b'<scpd xmlns="urn:dslforum-org:service-1-0">'
+    b'<specVersion><major>1</major><minor>0</minor></specVersion>'
+    b'<actionList />'
+    b'<serviceStateTable>'
+    b'<stateVariable sendEvents="yes"><name>HostNumberOfEntries</name>'
+    b'<dataType>ui2</dataType></stateVariable>'
+    b'<stateVariable sendEvents="no"><name>HostName</name>'
+    b'<dataType>string</dataType></stateVariable>'
+    b'</serviceStateTable>'
+    b'</scpd>'
+)
+
+
+class FakeEventSource(KeepAliveHandler):
+    """
+    Answers GENA requests like a FritzBox and records them.
+    """
+
+    def do_SUBSCRIBE(self):
+        server = self.server
+        headers = dict((_.lower(), self.headers.get(_))
+                       for _ in ('CALLBACK', 'NT', 'SID', 'TIMEOUT'))
+        server.requests.append(('SUBSCRIBE', headers))
+        if headers['sid'] and headers['sid'] not in server.sids:
+            self.send_response(412)
+        else:
+            sid = headers['sid'] or 'uuid:sid-%d' % len(server.requests)
+            server.sids.add(sid)
+            self.send_response(200)
+            self.send_header('SID', sid)
+            self.send_header('TIMEOUT', 'Second-%d' % server.granted)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        server.received.set()
+
+    def do_UNSUBSCRIBE(self):
+        self.server.requests.append(('UNSUBSCRIBE',
+                                     {'sid': self.headers.get('SID')}))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def notify(subscription, seq, entries=1, sid=None):
+    url = subscription._server.callback_url(subscription)
+    return requests.request('NOTIFY', url, data=PROPERTYSET % entries,
+                            headers={'NT': 'upnp:event',
+                                     'NTS': 'upnp:propchange',
+                                     'SID': sid or subscription.sid,
+                                     'SEQ': str(seq),
+                                     'Content-Type': 'text/xml'})
+
+
+class TestParsing(TestCase):
+
+    def test_propertyset(self):
+        self.assertEqual(gena.parse_propertyset(PROPERTYSET % 3), {
+            'HostNumberOfEntries': '3', 'X_AVM-DE_ChangeCounter': '7'})
+
+    def test_propertyset_converters(self):
+        changes = gena.parse_propertyset(
+            PROPERTYSET % 3, {'HostNumberOfEntries': datatypes.to_int})
+        self.assertEqual(changes['HostNumberOfEntries'], 3)
+
+    def test_timeout(self):
+        self.assertEqual(gena.parse_timeout('Second-300'), 300)
+        self.assertEqual(gena.parse_timeout('second-infinite', 10), 10)
+        self.assertEqual(gena.parse_timeout(None, 20), 20)
+
+    def test_event_converters(self):
+        service = Service('urn:Hosts-com:serviceId:Hosts1',
+                          service_type=HOSTS_TYPE, scpd_doc=SCPD)
+        self.assertEqual(service.event_converters,
+                         {'HostNumberOfEntries': datatypes.to_int})
+
+
+class TestEventServer(TestCase):
+
+    def setUp(self):
+        self.source = start_server(FakeEventSource, requests=[], sids=set(),
+                                   granted=1800,
+                                   received=threading.Event())
+        self.device = FakeDevice(self.source.url('/tr64desc.xml'))
+        self.server = gena.EventServer(callback_host='127.0.0.1')
+        self.events = []
+
+    def tearDown(self):
+        self.server.close()
+        stop_server(self.source)
+
+    def subscribe(self, **kwargs):
+        return self.server.subscribe(self.device, HOSTS_TYPE,
+                                     self.events.append, **kwargs)
+
+    def test_subscribe(self):
+        subscription = self.subscribe(timeout=600)
+        method, headers = self.source.requests[0]
+        self.assertEqual(method, 'SUBSCRIBE')
+        self.assertEqual(headers['callback'], '<http://127.0.0.1:%d/%s>' % (
+            self.server.port, subscription.token))
+        self.assertEqual(headers['nt'], 'upnp:event')
+        self.assertEqual(headers['timeout'], 'Second-600')
+        self.assertEqual(subscription.sid, 'uuid:sid-1')
+        self.assertAlmostEqual(subscription.expires, time.time() + 1800,
+                               delta=5)
+        self.assertEqual(len(self.server), 1)
+
+    def test_notify(self):
+        subscription = self.subscribe(
+            converters={'HostNumberOfEntries': datatypes.to_int})
+        self.assertEqual(notify(subscription, 0, 5).status_code, 200)
+        self.assertEqual(notify(subscription, 1, 6).status_code, 200)
+        self.assertEqual([_.seq for _ in self.events], [0, 1])
+        self.assertEqual(self.events[1].changes['HostNumberOfEntries'], 6)
+        self.assertIs(self.events[0].subscription, subscription)
+        self.assertEqual(subscription.values['HostNumberOfEntries'], 6)
+
+    def test_stale_event_dropped(self):
+        subscription = self.subscribe()
+        notify(subscription, 0)
+        notify(subscription, 2)
+        notify(subscription, 1)
+        self.assertEqual([_.seq for _ in self.events], [0, 2])
+
+    def test_unknown_subscription(self):
+        subscription = self.subscribe()
+        response = notify(subscription, 0, sid='uuid:other')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.events, [])
+
+    def test_renewal(self):
+        self.source.granted = 2
+        subscription = self.subscribe()
+        self.source.received.clear()
+        self.assertTrue(self.source.received.wait(5))
+        method, headers = self.source.requests[1]
+        self.assertEqual(headers['sid'], subscription.sid)
+        self.assertIsNone(headers['callback'])
+
+    def test_lost_subscription(self):
+        self.source.granted = 2
+        subscription = self.subscribe()
+        self.source.sids.clear()
+        deadline = time.time() + 5
+        while subscription.sid != 'uuid:sid-3' and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.source.requests[2][1]['sid'], None)
+        self.assertEqual(subscription.sid, 'uuid:sid-3')
+
+    def test_rejected(self):
+        self.device.event_url = lambda _: 'http://127.0.0.1:1/missing'
+        with self.assertRaises(Exception):
+            self.subscribe()
+        self.assertEqual(len(self.server), 0)
+
+    def test_close(self):
+        subscription = self.subscribe()
+        sid = subscription.sid
+        self.server.close()
+        self.assertEqual(self.source.requests[-1],
+                         ('UNSUBSCRIBE', {'sid': sid}))
+        self.assertEqual(len(self.server), 0)
+
+
+# vim: set path+=fritzclient :
@@ -0,0 +1,239 @@
+from unittest import TestCase
+import threading
+
+from mock import Mock, patch
+import requests
+
+from fritzclient.cache import ResultCache
+from fritzclient.hosts import Host, Hosts, parse_host_list
+from fritzclient.minisoap import SOAPError
+from fritzclient.model import proxy_class
+
+HOST_LIST = (
+    b'<?xml version="1.0" ?>'
+    b'<List>'
+    b'<Item><Index>1</Index><IPAddress>192.168.179.20</IPAddress>'
+    b'<AddressSource>DHCP</AddressSource>'
+    b'<LeaseTimeRemaining>3600</LeaseTimeRemaining>'
+    b'<MACAddress>00:11:22:33:44:00</MACAddress>'
+    b'<InterfaceType>Ethernet</InterfaceType><Active>1</Active>'
+    b'<HostName>laptop</HostName></Item>'
+    b'<Item><Index>2</Index><IPAddress>192.168.179.21</IPAddress>'
+    b'<AddressSource>Static</AddressSource>'
+    b'<LeaseTimeRemaining>0</LeaseTimeRemaining>'
+    b'<MACAddress>00:11:22:33:44:01</MACAddress>'
+    b'<InterfaceType>802.11</InterfaceType><Active>0</Active>'
+    b'<HostName>phone</HostName></Item>'
+    b'</List>'
+)
+
+
+def make_host(number):
+    return {
+        'NewMACAddress': '00:11:22:33:44:%02x' % number,
+        'NewIPAddress': '192.168.179.%d' % number,
+        'NewAddressSource': 'DHCP',
+        'NewLeaseTimeRemaining': 3600,
+        'NewInterfaceType': 'Ethernet',
+        'NewActive': True,
+        'NewHostName': 'host%d' % number,
+    }
+
+
+def invalid_index():
+    return SOAPError('713: SpecifiedArrayIndexInvalid', 's:Client',
+                     'UPnPError', '', '', '', {})
+
+
+class FakeHostTable(object):
+    """
+    Answers the actions of the Hosts service from a list of hosts. The
+    *on_entry* callback can change the table while it is read.
+    """
+
+    def __init__(self, count, list_path=None):
+        self.table = [make_host(_) for _ in range(count)]
+        self.list_path = list_path
+        self.entry_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.on_entry = None
+        self.lock = threading.Lock()
+
+    def __call__(self, url, namespace, action, params=None, **kwargs):
+        if action == 'X_AVM-DE_GetHostListPath':
+            if self.list_path is None:
+                raise SOAPError('401: Invalid Action', 's:Client',
+                                'UPnPError', '', '', '', {})
+            return {'NewX_AVM-DE_HostListPath': self.list_path}
+        if action == 'GetHostNumberOfEntries':
+            return {'NewHostNumberOfEntries': len(self.table)}
+        with self.lock:
+            self.entry_requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self.on_entry is not None:
+                self.on_entry(self)
+        try:
+            index = params['NewIndex']
+            if index >= len(self.table):
+                raise invalid_index()
+            return self.table[index]
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class TestHosts(TestCase):
+
+    def setUp(self):
+        self.patcher = patch('fritzclient.model.minisoap.execute')
+        self.execute = self.patcher.start()
+        self.transport = Mock()
+        self.hosts = Hosts(
+            {Hosts.TYPE: '/upnp/control/hosts'}, None,
+            ('http', '192.168.179.1:49000'), transport=self.transport)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_scan(self):
+        table = FakeHostTable(20)
+        self.execute.side_effect = table
+        result = list(self.hosts.hosts(window=4))
+        self.assertEqual([_.host_name for _ in result],
+                         ['host%d' % _ for _ in range(20)])
+        self.assertEqual([_.index for _ in result], list(range(20)))
+        self.assertEqual(result[0].lease_time_remaining, 3600)
+        self.assertEqual(table.entry_requests, 20)
+        self.assertLessEqual(table.max_in_flight, 4)
+        actions = [_[0][2] for _ in self.execute.call_args_list]
+        self.assertEqual(actions.count('GetHostNumberOfEntries'), 2)
+
+    def test_empty_table(self):
+        self.execute.side_effect = FakeHostTable(0)
+        self.assertEqual(list(self.hosts.hosts()), [])
+
+    def test_host_removed_during_scan(self):
+        table = FakeHostTable(12)
+
+        def remove_first(table):
+            if table.entry_requests == 5:
+                del table.table[0]
+
+        table.on_entry = remove_first
+        self.execute.side_effect = table
+        result = list(self.hosts.hosts(window=4))
+        self.assertEqual(sorted(_.host_name for _ in result),
+                         sorted('host%d' % _ for _ in range(12)))
+
+    def test_host_added_during_scan(self):
+        table = FakeHostTable(10)
+
+        def add_first(table):
+            if table.entry_requests == 3:
+                table.table.insert(0, make_host(99))
+
+        table.on_entry = add_first
+        self.execute.side_effect = table
+        result = list(self.hosts.hosts(window=4))
+        names = [_.host_name for _ in result]
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(set(names),
+                         set('host%d' % _ for _ in list(range(10)) + [99]))
+
+    def test_shrinking_below_batch(self):
+        table = FakeHostTable(8)
+
+        def truncate(table):
+            if table.entry_requests == 1:
+                del table.table[6:]
+
+        table.on_entry = truncate
+        self.execute.side_effect = table
+        result = list(self.hosts.hosts(window=8))
+        self.assertEqual([_.host_name for _ in result],
+                         ['host%d' % _ for _ in range(6)])
+
+    def test_invalid_index_without_change(self):
+        self.execute.side_effect = FakeHostTable(3)
+        with patch.object(Hosts, 'number_of_entries', return_value=4):
+            with self.assertRaises(SOAPError):
+                list(self.hosts.hosts(window=4))
+
+    def test_host_list_document(self):
+        table = FakeHostTable(20, list_path='/devicehostlist.lua?sid=1234')
+        self.execute.side_effect = table
+        self.transport.get.return_value.content = HOST_LIST
+        result = list(self.hosts.hosts())
+        self.transport.get.assert_called_once_with(
+            'http://192.168.179.1:49000/devicehostlist.lua?sid=1234')
+        self.assertEqual(table.entry_requests, 0)
+        self.assertEqual(result[1], Host(
+            index=1, mac_address='00:11:22:33:44:01',
+            ip_address='192.168.179.21', address_source='Static',
+            lease_time_remaining=0, interface_type='802.11', active=False,
+            host_name='phone'))
+
+    def test_list_path_is_requested_per_scan(self):
+        table = FakeHostTable(20, list_path='/devicehostlist.lua?sid=1234')
+        self.execute.side_effect = table
+        self.transport.get.return_value.content = HOST_LIST
+        list(self.hosts.hosts())
+        table.list_path = '/devicehostlist.lua?sid=5678'
+        list(self.hosts.hosts())
+        self.transport.get.assert_called_with(
+            'http://192.168.179.1:49000/devicehostlist.lua?sid=5678')
+
+    def test_missing_list_is_remembered(self):
+        table = FakeHostTable(2)
+        self.execute.side_effect = table
+        list(self.hosts.hosts())
+        list(self.hosts.hosts())
+        actions = [_[0][2] for _ in self.execute.call_args_list]
+        self.assertEqual(actions.count('X_AVM-DE_GetHostListPath'), 1)
+
+    def test_list_download_fails(self):
+        table = FakeHostTable(3, list_path='/devicehostlist.lua?sid=1234')
+        self.execute.side_effect = table
+        self.transport.get.return_value.raise_for_status.side_effect = (
+            requests.HTTPError('403 Client Error: Forbidden'))
+        result = list(self.hosts.hosts())
+        self.assertEqual([_.host_name for _ in result],
+                         ['host0', 'host1', 'host2'])
+
+    def test_host_removed_with_result_cache(self):
+        self.hosts = Hosts(
+            {Hosts.TYPE: '/upnp/control/hosts'}, None,
+            ('http', '192.168.179.1:49000'), transport=self.transport,
+            result_cache=ResultCache(default_ttl=60))
+        table = FakeHostTable(12)
+        self.execute.side_effect = table
+        self.assertEqual(len(list(self.hosts.hosts(window=4))), 12)
+
+        def remove_last(table):
+            if table.entry_requests == 14:
+                del table.table[-1]
+
+        table.on_entry = remove_last
+        result = list(self.hosts.hosts(window=4))
+        self.assertEqual(sorted(_.host_name for _ in result),
+                         sorted('host%d' % _ for _ in range(11)))
+
+    def test_not_registered(self):
+        self.assertIsNot(proxy_class(Hosts.TYPE), Hosts)
+
+    def test_without_list(self):
+        table = FakeHostTable(3, list_path='/devicehostlist.lua')
+        self.execute.side_effect = table
+        self.assertEqual(len(list(self.hosts.hosts(use_list=False))), 3)
+        self.assertFalse(self.transport.get.called)
+
+    def test_parse_host_list(self):
+        result = list(parse_host_list(HOST_LIST))
+        self.assertEqual([_.host_name for _ in result], ['laptop', 'phone'])
+        self.assertEqual(result[0].active, True)
+        self.assertEqual(result[0].lease_time_remaining, 3600)
+
+
+# vim: set path+=fritzclient :
@@ -0,0 +1,169 @@
+from unittest import TestCase
+import time
+
+from mock import patch
+
+from fritzclient import instrument
+from fritzclient.instrument import Histogram, Statistics
+from fritzclient.transport import Transport
+import fritzclient.minisoap as soap
+from fritzclient.tests.helpers import (
+    FAULT, RESPONSE, KeepAliveHandler, start_server, stop_server)
+
+DEVICE_INFO = 'urn:dslforum-org:service:DeviceInfo:1'
+
+
+class SlowSOAPHandler(KeepAliveHandler):
+    """
+    Answers after ``server.delay`` seconds and sends the body in two parts
+    ``server.delay`` seconds apart.
+    """
+
+    def do_POST(self):
+        self.read_body()
+        delay = self.server.delay
+        time.sleep(delay)
+        invalid = 'Invalid' in self.headers.get('soapaction')
+        body = FAULT if invalid else RESPONSE
+        self.send_response(500 if invalid else 200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body[:10])
+        self.wfile.flush()
+        time.sleep(delay)
+        self.wfile.write(body[10:])
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        self.server = start_server(SlowSOAPHandler, delay=0.05)
+        self.url = self.server.url('/upnp/control/deviceinfo')
+        self.calls = []
+        instrument.add_listener(self.calls.append)
+
+    def tearDown(self):
+        instrument.remove_listener(self.calls.append)
+        stop_server(self.server)
+
+    def test_phases(self):
+        with Transport() as transport:
+            for _ in range(2):
+                result = soap.execute(self.url, DEVICE_INFO,
+                                      'GetSecurityPort', transport=transport)
+                self.assertEqual(result['NewSecurityPort'], 49443)
+        first, second = self.calls
+        self.assertEqual(first.host, '127.0.0.1')
+        self.assertEqual(first.service_type, DEVICE_INFO)
+        self.assertEqual(first.action, 'GetSecurityPort')
+        self.assertEqual(first.status, 200)
+        self.assertIsNone(first.error)
+        self.assertEqual(first.response_size, len(RESPONSE))
+        self.assertEqual(first.request_size, len(soap.render_message(
+            DEVICE_INFO, 'GetSecurityPort')))
+        self.assertGreater(first.connect, 0)
+        # The second call reuses the pooled connection.
+        self.assertEqual(second.connect, 0)
+        for call in self.calls:
+            self.assertGreaterEqual(call.wait, 0.04)
+            self.assertGreaterEqual(call.transfer, 0.04)
+            self.assertGreaterEqual(call.render, 0)
+            self.assertGreaterEqual(call.parse, 0)
+            self.assertGreaterEqual(call.total, call.wait + call.transfer)
+
+    def test_without_transport(self):
+        soap.execute(self.url, DEVICE_INFO, 'GetSecurityPort')
+        self.assertIsNone(self.calls[0].connect)
+        self.assertGreaterEqual(self.calls[0].transfer, 0.04)
+
+    def test_fault(self):
+        with self.assertRaises(soap.SOAPError):
+            soap.execute(self.url, DEVICE_INFO, 'InvalidAction')
+        call = self.calls[0]
+        self.assertEqual(call.status, 500)
+        self.assertEqual(call.fault_code, '401')
+        self.assertIsInstance(call.error, soap.SOAPError)
+        self.assertIsNotNone(call.parse)
+
+    def test_connection_error(self):
+        url = 'http://127.0.0.1:1/upnp/control/deviceinfo'
+        with Transport(connect_timeout=1) as transport:
+            with self.assertRaises(Exception):
+                soap.execute(url, DEVICE_INFO, 'GetInfo',
+                             transport=transport)
+        call = self.calls[0]
+        self.assertIsNone(call.status)
+        self.assertIsNotNone(call.error)
+        self.assertIsNotNone(call.total)
+
+    def test_failing_listener(self):
+        def fail(call):
+            raise ValueError(call)
+        instrument.add_listener(fail)
+        try:
+            result = soap.execute(self.url, DEVICE_INFO, 'GetSecurityPort')
+        finally:
+            instrument.remove_listener(fail)
+        self.assertEqual(result['NewSecurityPort'], 49443)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_statistics(self):
+        stats = Statistics()
+        instrument.add_listener(stats)
+        try:
+            with Transport() as transport:
+                for action in ('GetSecurityPort', 'GetSecurityPort',
+                               'InvalidAction'):
+                    try:
+                        soap.execute(self.url, DEVICE_INFO, action,
+                                     transport=transport)
+                    except soap.SOAPError:
+                        pass
+        finally:
+            instrument.remove_listener(stats)
+        self.assertEqual(len(stats), 2)
+        ok = stats['127.0.0.1', DEVICE_INFO, 'GetSecurityPort']
+        self.assertEqual(ok.calls, 2)
+        self.assertEqual(ok.errors, 0)
+        self.assertEqual(ok.statuses, {200: 2})
+        self.assertEqual(ok.response_bytes, 2 * len(RESPONSE))
+        self.assertEqual(ok.phases['wait'].count, 2)
+        self.assertGreaterEqual(ok.phases['total'].mean, 0.08)
+        failed = stats['127.0.0.1', DEVICE_INFO, 'InvalidAction']
+        self.assertEqual(failed.errors, 1)
+        self.assertEqual(failed.faults, {'401': 1})
+        stats.reset()
+        self.assertEqual(stats.keys(), [])
+
+
+class TestWithoutListeners(TestCase):
+
+    @patch('fritzclient.minisoap._execute_instrumented')
+    @patch('fritzclient.minisoap.requests')
+    def test_not_measured(self, mock_requests, mock_instrumented):
+        mock_requests.post.return_value.headers = {
+            'content-type': 'text/xml'}
+        mock_requests.post.return_value.status_code = 200
+        mock_requests.post.return_value.text = RESPONSE
+        soap.execute('http://127.0.0.1/', DEVICE_INFO, 'GetSecurityPort')
+        self.assertFalse(mock_instrumented.called)
+        self.assertNotIn('stream', mock_requests.post.call_args[1])
+
+
+class TestHistogram(TestCase):
+
+    def test_buckets(self):
+        histogram = Histogram((0.1, 1.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in (0.05, 0.1, 0.5, 0.7, 3.0):
+            histogram.add(value)
+        self.assertEqual(histogram.counts, [2, 2, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.mean, 0.87)
+        self.assertEqual(histogram.quantile(0.4), 0.1)
+        self.assertEqual(histogram.quantile(0.5), 1.0)
+        self.assertEqual(histogram.quantile(1.0), float('inf'))
+
+
+# vim: set path+=fritzclient :
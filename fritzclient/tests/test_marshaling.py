@@ -1,5 +1,8 @@
+from io import BytesIO
 from unittest import TestCase
-from pkg_resources import resource_string
+import xml.etree.ElementTree as etree
+
+from pkg_resources import resource_stream, resource_string
 
 import fritzclient.marshal as codec
 import fritzclient.model as mdl
@@ -221,4 +224,72 @@ class TestMarshalingTr064Desc(TestCase):
         self.assertIsInstance(result.devices[0], mdl.Device)
 
 
+class TestRegistry(TestCase):
+
+    def test_file_like_object(self):
+        stream = resource_stream('fritzclient', 'tests/data/tr64desc.xml')
+        with stream:
+            result = codec.decode(stream)
+        self.assertEqual(result.udn,
+                         'uuid:739f2409-bccb-40e7-8e6c-0896D74C6BF8')
+
+    def test_incremental_reads(self):
+
+        class Trickle(object):
+            """
+            Returns the document in small pieces, like a slow connection.
+            """
+
+            def __init__(self, data):
+                self.stream = BytesIO(data)
+
+            def read(self, size=-1):
+                return self.stream.read(min(size, 64) if size > 0 else 64)
+
+        data = resource_string('fritzclient', 'tests/data/tr64desc.xml')
+        result = codec.decode(Trickle(data))
+        expected = codec.decode(data)
+        self.assertEqual(result.spec_version, '1.0')
+        self.assertEqual(list(result.iter_services()),
+                         list(expected.iter_services()))
+        self.assertEqual(len(list(result.iter_services())), 26)
+
+    def test_decode_element(self):
+        root = etree.fromstring(resource_string(
+            'fritzclient', 'tests/data/scpd/deviceinfoSCPD.xml'))
+        result = mdl.SCPD.decode(root, '{urn:dslforum-org:service-1-0}')
+        self.assertIn('GetInfo', result.actions)
+        self.assertEqual(len(root), 3)
+
+    def test_scpd(self):
+        result = codec.decode(resource_string(
+            'fritzclient', 'tests/data/scpd/deviceinfoSCPD.xml'))
+        self.assertIsInstance(result, mdl.SCPD)
+        self.assertIn('GetInfo', result.actions)
+
+    def test_unsupported_root(self):
+        with self.assertRaises(ValueError):
+            codec.decode(b'<root xmlns="urn:dslforum-org:device-1-1" />')
+        with self.assertRaises(ValueError):
+            codec.decode(b'<notroot xmlns="urn:dslforum-org:device-1-0" />')
+
+    def test_subclass_of_subclass(self):
+        registry = dict(codec.REGISTRY)
+        try:
+            class Special(mdl.Device):
+                NS = ('urn:example-org:device-1-0',)
+
+            class MoreSpecial(Special):
+                NS = ('urn:example-org:device-2-0',)
+
+            result = codec.decode(BytesIO(
+                b'<root xmlns="urn:example-org:device-2-0"><device>'
+                b'<UDN>uuid:1</UDN></device></root>'))
+            self.assertIsInstance(result, MoreSpecial)
+            self.assertEqual(result.udn, 'uuid:1')
+        finally:
+            codec.REGISTRY.clear()
+            codec.REGISTRY.update(registry)
+
+
 # vim: set path+=fritzclient :
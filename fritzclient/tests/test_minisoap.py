@@ -4,9 +4,26 @@ import xml.etree.ElementTree as etree
 from mock import patch, create_autospec
 from requests import Response
 
+from fritzclient import datatypes
 import fritzclient.minisoap as soap
 
 
+def render_with_elementtree(context, method, args=None):
+    """
+    Reference implementation of render_message using ElementTree.
+    """
+    etree.register_namespace('s', soap.SOAP_ENVELOPE_NS)
+    etree.register_namespace('u', context)
+    ns = soap.SOAP_ENVELOPE_NS
+    doc = etree.Element(etree.QName(ns, 'Envelope'))
+    doc.set(etree.QName(ns, 'encodingStyle'), soap.SOAP_ENCODING_NS)
+    body = etree.SubElement(doc, etree.QName(ns, 'Body'))
+    method_el = etree.SubElement(body, etree.QName(context, method))
+    for key, value in (args or {}).items():
+        etree.SubElement(method_el, key).text = str(value)
+    return etree.tostring(doc)
+
+
 class TestMiniSoap(TestCase):
     """
     Test a simplified SOAP implementation.
@@ -34,6 +51,33 @@ class TestMiniSoap(TestCase):
         result = {_.tag: _.text for _ in body[0]}
         self.assertEqual(result, expected)
 
+    def test_render_message_matches_elementtree(self):
+        cases = [
+            ('urn:dslforum-org:service:DeviceInfo:1', 'GetInfo', None),
+            ('urn:dslforum-org:service:Hosts:1', 'GetGenericHostEntry',
+             {'NewIndex': 3}),
+            ('urn:dslforum-org:service:DeviceConfig:1',
+             'ConfigurationStarted',
+             {'NewSessionID': 'a<b & "c" > \'d\'', 'Empty': '',
+              'Number': 20}),
+        ]
+        for context, method, args in cases:
+            self.assertEqual(soap.render_message(context, method, args),
+                             render_with_elementtree(context, method, args))
+
+    def test_render_message_keeps_namespace_registry(self):
+        etree.register_namespace('u', 'urn:unrelated')
+        soap.render_message('urn:dslforum-org:service:Time:1', 'GetInfo')
+        element = etree.Element('{urn:unrelated}foo')
+        self.assertIn(b'xmlns:u="urn:unrelated"', etree.tostring(element))
+
+    def test_template_cache(self):
+        first = soap.get_template('urn:x', 'Foo', ('A', 'B'))
+        second = soap.get_template('urn:x', 'Foo', ('A', 'B'))
+        other = soap.get_template('urn:x', 'Foo', ('B', 'A'))
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
     def test_parse_response(self):
         response_data = (
             b'<?xml version="1.0"?>'
@@ -49,6 +93,85 @@ class TestMiniSoap(TestCase):
         output = soap.parse_response(response_data)
         self.assertEqual(output['NewSecurityPort'], 49443)
 
+    CONTAINER_XML = (
+        b'<Body><u:GetInfoResponse xmlns:u="urn:DeviceInfo:1">'
+        b'<NewModelName>FRITZ!Box</NewModelName>'
+        b'<NewUpTime>1234</NewUpTime>'
+        b'<NewDeviceLog></NewDeviceLog>'
+        b'<Twice>1</Twice><Twice>2</Twice>'
+        b'</u:GetInfoResponse></Body>'
+    )
+
+    def test_container_lookup(self):
+        container = soap.Container(etree.fromstring(self.CONTAINER_XML))
+        self.assertEqual(container['NewModelName'], 'FRITZ!Box')
+        self.assertEqual(container['NewUpTime'], 1234)
+        self.assertEqual(container['NewDeviceLog'].tag, 'NewDeviceLog')
+        self.assertEqual(container.get('Missing', 'default'), 'default')
+        self.assertIn('NewUpTime', container)
+        self.assertNotIn('Missing', container)
+
+    def test_container_missing_and_duplicate_keys(self):
+        container = soap.Container(etree.fromstring(self.CONTAINER_XML))
+        with self.assertRaises(KeyError):
+            container['Missing']
+        with self.assertRaises(KeyError):
+            container['Twice']
+        self.assertIsNone(container.get('Twice'))
+
+    def test_container_index_is_lazy(self):
+        element = etree.fromstring(self.CONTAINER_XML)
+        container = soap.Container(element)
+        element[0].append(etree.Element('Late'))
+        self.assertEqual(container['Late'].tag, 'Late')
+        element[0].remove(element[0][-1])
+        self.assertEqual(container['Late'].tag, 'Late')
+
+    def test_container_bulk_access(self):
+        container = soap.Container(etree.fromstring(self.CONTAINER_XML))
+        self.assertEqual(container.keys(),
+                         ['NewModelName', 'NewUpTime', 'NewDeviceLog'])
+        result = container.as_dict()
+        self.assertEqual(result['NewModelName'], 'FRITZ!Box')
+        self.assertEqual(result['NewUpTime'], 1234)
+        self.assertEqual(result['NewDeviceLog'].tag, 'NewDeviceLog')
+        self.assertEqual(dict(container.items()), result)
+
+    def test_container_converters(self):
+        converters = {
+            'NewModelName': datatypes.to_string,
+            'NewUpTime': datatypes.to_string,
+            'NewDeviceLog': datatypes.to_string,
+            'NewOffset': datatypes.to_int,
+            'NewEnable': datatypes.to_boolean,
+        }
+        element = etree.fromstring(
+            b'<Body><u:GetInfoResponse xmlns:u="urn:DeviceInfo:1">'
+            b'<NewUpTime>0042</NewUpTime>'
+            b'<NewDeviceLog></NewDeviceLog>'
+            b'<NewOffset>-5</NewOffset>'
+            b'<NewEnable>1</NewEnable>'
+            b'<NewOther>7</NewOther>'
+            b'</u:GetInfoResponse></Body>')
+        container = soap.Container(element, converters)
+        self.assertEqual(container['NewUpTime'], '0042')
+        self.assertEqual(container['NewDeviceLog'], '')
+        self.assertEqual(container['NewOffset'], -5)
+        self.assertIs(container['NewEnable'], True)
+        self.assertEqual(container['NewOther'], 7)
+
+    def test_container_empty_converted_element(self):
+        element = etree.fromstring(
+            b'<Body><u:GetInfoResponse xmlns:u="urn:DeviceInfo:1">'
+            b'<NewOffset></NewOffset>'
+            b'</u:GetInfoResponse></Body>')
+        container = soap.Container(element, {'NewOffset': datatypes.to_int})
+        self.assertIsNone(container['NewOffset'])
+        self.assertIn('NewOffset', container)
+        self.assertEqual(container.as_dict(), {'NewOffset': None})
+        with self.assertRaises(KeyError):
+            container['Missing']
+
     @patch('fritzclient.minisoap.requests')
     def test_execute_faulty_content_type(self, mock_requests):
 
@@ -1,9 +1,11 @@
-from contextlib import nested
-from pkg_resources import resource_string
+from datetime import date, datetime, timedelta
+from pkg_resources import resource_stream, resource_string
 from unittest import TestCase
 
-from mock import patch
+from mock import Mock, patch
+from requests import ConnectionError
 
+from fritzclient import datatypes
 import fritzclient.model as mdl
 
 
@@ -12,9 +14,8 @@ class TR064Test(TestCase):
     def setUp(self):
         tr064desc = resource_string('fritzclient',
                                     'tests/data/tr64desc.xml')
-        with nested(patch('fritzclient.model.tr064'),
-                    patch('fritzclient.model.minisoap')) as (mock_tr064,
-                                                             mock_soap):
+        with patch('fritzclient.model.tr064') as mock_tr064, \
+                patch('fritzclient.model.minisoap'):
             mock_tr064.get_tr064desc.return_value = tr064desc
             mock_tr064.discover.return_value = {
                 'status_code': 200,
@@ -47,10 +48,128 @@ class TestInternetGatewayDeviceDiscovery(TR064Test):
         tr064desc = resource_string('fritzclient',
                                     'tests/data/tr64desc.xml')
         mock_tr064.get_tr064desc.return_value = tr064desc
+        mock_tr064.discover.return_value = {
+            'location': 'http://192.168.179.1:49000/tr64desc.xml'}
         mdl.get_root_device()
         self.assertTrue(mock_tr064.discover.called,
                         'SSDP discovery was not executed!')
 
+    @patch('fritzclient.model.tr064')
+    def test_streamed_description(self, mock_tr064):
+        stream = resource_stream('fritzclient', 'tests/data/tr64desc.xml')
+        mock_tr064.get_tr064desc.return_value = stream
+        with stream:
+            device = mdl.get_root_device(
+                'http://192.168.179.1:49000/tr64desc.xml')
+        self.assertEqual(mock_tr064.get_tr064desc.call_args[1]['stream'],
+                         True)
+        self.assertEqual(device.udn,
+                         'uuid:739f2409-bccb-40e7-8e6c-0896D74C6BF8')
+        self.assertEqual(
+            device.control_urls['urn:dslforum-org:service:Hosts:1'],
+            '/upnp/control/hosts')
+
+
+class TestSecurityPort(TR064Test):
+
+    @patch('fritzclient.model.minisoap')
+    def test_use_security_port(self, mock_soap):
+        mock_soap.execute.return_value = {'NewSecurityPort': 49443}
+        self.assertFalse(self.dev.secure)
+        self.dev.use_security_port()
+        self.assertTrue(self.dev.secure)
+        self.assertEqual(mock_soap.execute.call_args[0][:3], (
+            'http://192.168.179.1:49000/upnp/control/deviceinfo',
+            mdl.DeviceInfo.TYPE, 'GetSecurityPort'))
+        info = self.dev.service(mdl.DeviceInfo)
+        self.assertEqual(info._control_url(),
+                         'https://192.168.179.1:49443/upnp/control/deviceinfo')
+
+    def test_explicit_port(self):
+        self.dev.use_security_port(443)
+        info = self.dev.service(mdl.DeviceInfo)
+        self.assertEqual(info._control_url(),
+                         'https://192.168.179.1:443/upnp/control/deviceinfo')
+
+    def test_event_url(self):
+        self.dev.use_security_port(443)
+        self.assertEqual(
+            self.dev.event_url('urn:dslforum-org:service:Hosts:1'),
+            'http://192.168.179.1:49000/upnp/control/hosts')
+        with self.assertRaises(KeyError):
+            self.dev.event_url('urn:dslforum-org:service:Unknown:1')
+
+
+class TestDiscoveryCache(TestCase):
+
+    @patch('fritzclient.model.tr064')
+    def test_stale_location_is_rediscovered(self, mock_tr064):
+        tr064desc = resource_string('fritzclient',
+                                    'tests/data/tr64desc.xml')
+        stale = 'http://192.168.179.1:49000/tr64desc.xml'
+        fresh = 'http://192.168.179.2:49000/tr64desc.xml'
+
+        def get_tr064desc(location, transport, stream=False):
+            if location == stale:
+                raise ConnectionError('No route to host')
+            return tr064desc
+
+        mock_tr064.get_tr064desc.side_effect = get_tr064desc
+        discovery_cache = Mock()
+        discovery_cache.get.side_effect = [{'location': stale},
+                                           {'location': fresh}]
+
+        device = mdl.get_root_device(discovery_cache=discovery_cache)
+
+        self.assertEqual(device.location, fresh)
+        discovery_cache.invalidate.assert_called_with(stale)
+        self.assertFalse(mock_tr064.discover.called)
+
+
+class TestLazyDeviceInfo(TestCase):
+
+    def setUp(self):
+        self.info = mdl.DeviceInfo(
+            {mdl.DeviceInfo.TYPE: '/upnp/control/deviceinfo'},
+            None, ('http', '192.168.179.1:49000'))
+
+    @patch('fritzclient.model.minisoap')
+    def test_no_request_until_read(self, mock_soap):
+        mdl.DeviceInfo({}, None, ('http', '192.168.179.1:49000'))
+        self.assertFalse(mock_soap.execute.called)
+
+    @patch('fritzclient.model.minisoap')
+    def test_one_request_for_all_values(self, mock_soap):
+        mock_soap.execute.return_value = {'NewModelName': 'FRITZ!Box 7390',
+                                          'NewUpTime': 10}
+        self.assertEqual(self.info.model_name, 'FRITZ!Box 7390')
+        self.assertEqual(self.info.uptime, 10)
+        self.assertIsNone(self.info.serial_number)
+        self.assertEqual(mock_soap.execute.call_count, 1)
+
+    @patch('fritzclient.model.minisoap')
+    def test_refresh(self, mock_soap):
+        mock_soap.execute.side_effect = [{'NewUpTime': 10},
+                                         {'NewUpTime': 20}]
+        self.assertEqual(self.info.uptime, 10)
+        self.assertIs(self.info.refresh(), self.info)
+        self.assertEqual(self.info.uptime, 20)
+
+    @patch('fritzclient.model.time')
+    @patch('fritzclient.model.minisoap')
+    def test_max_age(self, mock_soap, mock_time):
+        info = mdl.DeviceInfo(
+            {mdl.DeviceInfo.TYPE: '/upnp/control/deviceinfo'},
+            None, ('http', '192.168.179.1:49000'), max_age=30)
+        mock_soap.execute.side_effect = [{'NewUpTime': 10},
+                                         {'NewUpTime': 45}]
+        mock_time.time.return_value = 1000
+        self.assertEqual(info.uptime, 10)
+        mock_time.time.return_value = 1030
+        self.assertEqual(info.uptime, 10)
+        mock_time.time.return_value = 1031
+        self.assertEqual(info.uptime, 45)
+
 
 class TestDevice(TR064Test):
 
@@ -183,13 +302,13 @@ class TestDevice(TR064Test):
 
         result = set([
             (
-                ('service_type', _._service_type),
-                ('service_id', _._service_id),
-                ('control_url', _._control_url),
-                ('event_sub_url', _._event_sub_url),
-                ('scpd_url', _._scpd_url)
+                ('service_type', _.service_type),
+                ('service_id', _.service_id),
+                ('control_url', _.control_url),
+                ('event_sub_url', _.event_suburl),
+                ('scpd_url', _.scpdurl)
             )
-            for self.dev.services[_] in self.dev.services])
+            for _ in self.dev.services])
 
         self.assertEqual(result, expected)
 
@@ -198,8 +317,7 @@ class TestDevice(TR064Test):
             'urn:dslforum-org:device:LANDevice:1',
             'urn:dslforum-org:device:WANDevice:1'
         ])
-        result = set([self.dev.devices[_].device_type
-                      for _ in self.dev.devices])
+        result = set([_.device_type for _ in self.dev.devices])
         self.assertEqual(result, expected)
 
     def test_metadata(self):
@@ -216,11 +334,11 @@ class TestDevice(TR064Test):
             'presentationURL': 'http://fritz.box',
             'icons': [
                 {
-                    'mimetype', 'image/gif',
-                    'width', '118',
-                    'height', '119',
-                    'depth', '8',
-                    'url', '/ligd.gif',
+                    'mimetype': 'image/gif',
+                    'width': '118',
+                    'height': '119',
+                    'depth': '8',
+                    'url': '/ligd.gif',
                 }
             ],
         }
@@ -303,6 +421,14 @@ class TestService(TestCase):
 
         self.assertEqual(result, expected)
 
+    def test_action_callables(self):
+        self.assertIn('GetSSID', dir(self.service))
+        self.assertEqual(self.service.GetSSID.__name__, 'GetSSID')
+        with self.assertRaises(AttributeError):
+            self.service.NoSuchAction
+        with self.assertRaises(ValueError):
+            self.service.GetSSID()
+
     def test_actions(self):
 
         expected = set([
@@ -336,10 +462,76 @@ class TestService(TestCase):
             'X_AVM_DE_GetNightControl',
         ])
 
-        result = set([_.__name__ for _ in dir(self.service)
-                      if hasattr(getattr(self.service, _), '__call__')])
+        result = set([getattr(self.service, _).__name__
+                      for _ in dir(self.service) if not _.startswith('_') and
+                      hasattr(getattr(self.service, _), '__call__')])
 
         self.assertEqual(result, expected)
 
 
+class TestSCPD(TestCase):
+
+    def setUp(self):
+        self.scpd = mdl.SCPD.parse(resource_string(
+            'fritzclient', 'tests/data/scpd/deviceinfoSCPD.xml'))
+
+    def test_arguments(self):
+        action = self.scpd.actions['GetInfo']
+        self.assertEqual(action.in_arguments, [])
+        uptime = [_ for _ in action.out_arguments if _.name == 'NewUpTime']
+        self.assertEqual(uptime[0].variable.name, 'UpTime')
+        self.assertEqual(uptime[0].variable.data_type, 'ui4')
+
+    def test_converters(self):
+        converters = self.scpd.actions['GetInfo'].converters
+        self.assertIs(converters['NewUpTime'], datatypes.to_int)
+        self.assertIs(converters['NewModelName'], datatypes.to_string)
+
+    def test_compact_definitions(self):
+        other = mdl.SCPD.parse(resource_string(
+            'fritzclient', 'tests/data/scpd/deviceinfoSCPD.xml'))
+        for first, second in zip(self.scpd.variables, other.variables):
+            self.assertIsNot(first, second)
+            self.assertIs(first.name, second.name)
+            self.assertIs(first.data_type, second.data_type)
+        self.assertFalse(hasattr(self.scpd.variables[0], '__dict__'))
+        self.assertFalse(hasattr(self.scpd.actions['GetInfo'], '__dict__'))
+
+    def test_not_an_scpd(self):
+        with self.assertRaises(ValueError):
+            mdl.SCPD.parse(b'<root xmlns="urn:dslforum-org:device-1-0" />')
+
+
+class TestDatatypes(TestCase):
+
+    def test_integers(self):
+        self.assertEqual(datatypes.converter('i4')('-12'), -12)
+        self.assertEqual(datatypes.converter('ui4')('4294967295'),
+                         4294967295)
+        self.assertIsNone(datatypes.converter('ui2')(''))
+
+    def test_boolean(self):
+        to_boolean = datatypes.converter('boolean')
+        self.assertIs(to_boolean('1'), True)
+        self.assertIs(to_boolean('false'), False)
+        with self.assertRaises(ValueError):
+            to_boolean('maybe')
+
+    def test_datetime(self):
+        to_datetime = datatypes.converter('dateTime')
+        self.assertEqual(to_datetime('2016-03-01T12:30:05'),
+                         datetime(2016, 3, 1, 12, 30, 5))
+        value = to_datetime('2016-03-01T12:30:05+01:00')
+        self.assertEqual(value.utcoffset(), timedelta(hours=1))
+
+    def test_date(self):
+        to_date = datatypes.converter('date')
+        self.assertEqual(to_date('2016-03-01'), date(2016, 3, 1))
+        self.assertIs(type(to_date('2016-03-01')), date)
+        self.assertIsNone(to_date(''))
+
+    def test_unknown_types_are_strings(self):
+        self.assertEqual(datatypes.converter('bin.base64')('0042'), '0042')
+
+
 # vim: set path+=fritzclient :
@@ -0,0 +1,168 @@
+from datetime import datetime
+from io import BytesIO
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from fritzclient.ontel import OnTel, CallList, iter_contacts
+
+CALL = (
+    '<Call><Id>%d</Id><Type>%d</Type><Caller>0301234567</Caller>'
+    '<Called>SIP: 987654</Called><CalledNumber>987654</CalledNumber>'
+    '<Name>Caller %d</Name><Numbertype>sip</Numbertype>'
+    '<Device>Telefon</Device><Port>10</Port><Date>27.10.16 12:34</Date>'
+    '<Duration>1:05</Duration><Count></Count><Path /></Call>'
+)
+
+
+def call_list(ids, timestamp=1477564440):
+    calls = ''.join(CALL % (_, 1, _) for _ in ids)
+    return ('<?xml version="1.0" encoding="UTF-8"?><root>'
+            '<timestamp>%d</timestamp>%s</root>' % (timestamp, calls)
+            ).encode('utf-8')
+
+
+PHONEBOOK = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<phonebooks><phonebook owner="1" name="Telefonbuch">'
+    b'<timestamp>1477564440</timestamp>'
+    b'<contact><category>0</category>'
+    b'<person><realName>Jane Doe</realName></person>'
+    b'<telephony nid="2">'
+    b'<number type="home" prio="1" id="0">0301234567</number>'
+    b'<number type="mobile" prio="0" id="1">01701234567</number>'
+    b'</telephony><services /><setup /><mod_time>1400000000</mod_time>'
+    b'<uniqueid>1</uniqueid></contact>'
+    b'<contact><category>1</category>'
+    b'<person><realName>John Roe</realName></person>'
+    b'<telephony nid="1">'
+    b'<number type="work" prio="1" id="0">0401234567</number>'
+    b'</telephony><mod_time>1477000000</mod_time>'
+    b'<uniqueid>2</uniqueid></contact>'
+    b'</phonebook></phonebooks>'
+)
+
+
+class TrickleReader(object):
+    """
+    Returns a few bytes per read and records how much was read.
+    """
+
+    def __init__(self, data, size=64):
+        self.data = data
+        self.size = size
+        self.position = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        chunk = self.data[self.position:self.position + self.size]
+        self.position += len(chunk)
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+class TestCallList(TestCase):
+
+    def test_parse(self):
+        calls = CallList(BytesIO(call_list([3, 2, 1])))
+        result = list(calls)
+        self.assertEqual([_.id for _ in result], [3, 2, 1])
+        self.assertEqual(result[0].name, 'Caller 3')
+        self.assertEqual(result[0].date, datetime(2016, 10, 27, 12, 34))
+        self.assertEqual(result[0].duration, 3900)
+        self.assertEqual(result[0].path, '')
+        self.assertEqual(calls.timestamp, 1477564440)
+        self.assertEqual(calls.last_id, 3)
+
+    def test_since_id(self):
+        calls = CallList(BytesIO(call_list([5, 4, 3, 2])), since_id=3)
+        self.assertEqual([_.id for _ in calls], [5, 4])
+        self.assertEqual(calls.last_id, 5)
+
+    def test_nothing_new(self):
+        calls = CallList(BytesIO(call_list([2, 1])), since_id=2)
+        self.assertEqual(list(calls), [])
+        self.assertEqual(calls.last_id, 2)
+
+    def test_incremental(self):
+        reader = TrickleReader(call_list(range(1000, 0, -1)))
+        calls = iter(CallList(reader))
+        self.assertEqual(next(calls).id, 1000)
+        self.assertLess(reader.position, len(reader.data) // 10)
+        self.assertEqual(len(list(calls)), 999)
+        self.assertTrue(reader.closed)
+
+
+class TestContacts(TestCase):
+
+    def test_parse(self):
+        result = list(iter_contacts(BytesIO(PHONEBOOK)))
+        self.assertEqual([_.name for _ in result], ['Jane Doe', 'John Roe'])
+        self.assertEqual(result[0].numbers, (('home', '0301234567'),
+                                             ('mobile', '01701234567')))
+        self.assertEqual(result[0].unique_id, 1)
+        self.assertEqual(result[1].category, 1)
+        self.assertEqual(result[1].mod_time, 1477000000)
+
+    def test_modified_since(self):
+        result = list(iter_contacts(BytesIO(PHONEBOOK),
+                                    modified_since=1450000000))
+        self.assertEqual([_.unique_id for _ in result], [2])
+
+
+class TestOnTel(TestCase):
+
+    def setUp(self):
+        self.patcher = patch('fritzclient.model.minisoap.execute')
+        self.execute = self.patcher.start()
+        self.transport = Mock()
+        self.ontel = OnTel(
+            {OnTel.TYPE: '/upnp/control/x_contact'}, None,
+            ('http', '192.168.179.1:49000'), transport=self.transport)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_calls(self):
+        self.execute.return_value = {
+            'NewCallListURL': 'http://192.168.179.1:49000/calllist.lua'
+                              '?sid=1234'}
+        self.transport.get.return_value.raw = BytesIO(call_list([9, 8]))
+        calls = self.ontel.calls(since_id=7, days=7)
+        self.assertEqual([_.id for _ in calls], [9, 8])
+        self.transport.get.assert_called_once_with(
+            'http://192.168.179.1:49000/calllist.lua?sid=1234&days=7&id=7',
+            stream=True)
+        self.assertEqual(self.execute.call_args[0][2], 'GetCallList')
+
+    def test_calls_since_timestamp(self):
+        self.execute.return_value = {'NewCallListURL': '/calllist.lua'}
+        self.transport.get.return_value.raw = BytesIO(call_list([]))
+        calls = self.ontel.calls(timestamp=1477564440)
+        self.assertEqual(list(calls), [])
+        self.transport.get.assert_called_once_with(
+            'http://192.168.179.1:49000/calllist.lua?timestamp=1477564440',
+            stream=True)
+
+    def test_contacts(self):
+        self.execute.return_value = {
+            'NewPhonebookURL': 'http://192.168.179.1:49000/phonebook.lua'
+                               '?sid=1234&pbid=1',
+            'NewPhonebookName': 'Telefonbuch',
+        }
+        self.transport.get.return_value.raw = BytesIO(PHONEBOOK)
+        contacts = list(self.ontel.contacts(1))
+        self.assertEqual(len(contacts), 2)
+        self.assertEqual(self.execute.call_args[0][2:4],
+                         ('GetPhonebook', {'NewPhonebookID': 1}))
+
+    def test_phonebook_ids(self):
+        self.execute.return_value = {'NewPhonebookList': '0,1,2'}
+        self.assertEqual(self.ontel.phonebook_ids(), [0, 1, 2])
+        self.execute.return_value = {'NewPhonebookList': 0}
+        self.assertEqual(self.ontel.phonebook_ids(), [0])
+
+
+# vim: set path+=fritzclient :
@@ -0,0 +1,104 @@
+from unittest import TestCase
+import time
+
+from fritzclient.scheduler import Scheduler
+from fritzclient.tests.helpers import FakeDevice
+
+WAN_TYPE = 'urn:dslforum-org:service:WANCommonInterfaceConfig:1'
+
+
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler(workers=4, jitter=0)
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def wait_for(self, condition, timeout=3.0):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_periodic(self):
+        device = FakeDevice(responses={
+            (WAN_TYPE, 'GetTotalBytesSent'): {'NewTotalBytesSent': 1}})
+        results = []
+        job = self.scheduler.add(device, WAN_TYPE, 'GetTotalBytesSent', 0.05,
+                                 callback=results.append)
+        self.assertTrue(self.wait_for(lambda: job.runs >= 4))
+        self.assertEqual(job.overruns, 0)
+        self.assertIs(results[0].item, job)
+        self.assertEqual(results[0].value, {'NewTotalBytesSent': 1})
+        self.assertIsNone(results[0].error)
+
+    def test_jitter(self):
+        scheduler = Scheduler(workers=1, jitter=1.0)
+        try:
+            start = time.time()
+            jobs = [scheduler.add(FakeDevice(), WAN_TYPE, 'GetInfo', 60)
+                    for _ in range(20)]
+        finally:
+            scheduler.close()
+        offsets = [_.due - start for _ in jobs]
+        self.assertTrue(all(0 <= _ <= 60.1 for _ in offsets))
+        self.assertGreater(len(set(round(_) for _ in offsets)), 5)
+
+    def test_overrun(self):
+        device = FakeDevice(delay=0.12)
+        job = self.scheduler.add(device, WAN_TYPE, 'GetTotalBytesSent', 0.05)
+        self.assertTrue(self.wait_for(lambda: job.runs >= 2))
+        self.assertGreater(job.overruns, 0)
+        self.assertEqual(device.max_in_flight, 1)
+        self.assertGreaterEqual(job.duration, 0.12)
+
+    def test_batch_per_host(self):
+        device = FakeDevice()
+        other = FakeDevice('http://10.0.0.2:49000/tr64desc.xml')
+        actions = ('GetTotalBytesSent', 'GetTotalBytesReceived',
+                   'GetCommonLinkProperties')
+        jobs = [self.scheduler.add(device, WAN_TYPE, _, 0.2, delay=0.1)
+                for _ in actions]
+        jobs.append(self.scheduler.add(other, WAN_TYPE, actions[0], 0.2,
+                                       delay=0.1))
+        self.assertTrue(self.wait_for(lambda: all(_.runs for _ in jobs)))
+        self.assertEqual(sorted(_[0] for _ in device.calls[:3]),
+                         sorted(actions))
+        self.assertEqual(len(set(_[1] for _ in device.calls[:3])), 1)
+        self.assertEqual(device.max_in_flight, 1)
+
+    def test_errors(self):
+        results = []
+        job = self.scheduler.add(FakeDevice(), WAN_TYPE, 'Fail', 0.05,
+                                 callback=results.append)
+        self.assertTrue(self.wait_for(lambda: job.runs >= 2))
+        self.assertEqual(job.errors, job.runs)
+        self.assertIsInstance(results[0].error, ValueError)
+
+    def test_remove(self):
+        device = FakeDevice()
+        job = self.scheduler.add(device, WAN_TYPE, 'GetTotalBytesSent', 0.05)
+        self.assertTrue(self.wait_for(lambda: job.runs >= 1))
+        self.scheduler.remove(job)
+        time.sleep(0.07)
+        runs = job.runs
+        time.sleep(0.15)
+        self.assertEqual(job.runs, runs)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_stats(self):
+        device = FakeDevice()
+        jobs = [self.scheduler.add(device, WAN_TYPE, _, 0.05)
+                for _ in ('GetTotalBytesSent', 'Fail')]
+        self.assertTrue(self.wait_for(lambda: all(_.runs >= 2
+                                                  for _ in jobs)))
+        stats = self.scheduler.stats()
+        self.assertEqual(stats.jobs, 2)
+        self.assertGreaterEqual(stats.runs, 4)
+        self.assertGreaterEqual(stats.errors, 2)
+        self.assertGreaterEqual(stats.max_lag, stats.mean_lag)
+        self.assertGreaterEqual(stats.mean_lag, 0)
+
+
+# vim: set path+=fritzclient :
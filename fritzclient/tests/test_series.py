@@ -0,0 +1,131 @@
+from unittest import TestCase
+import sys
+
+from fritzclient.series import CounterSeries, CounterStore
+
+
+class TestCounterSeries(TestCase):
+
+    def test_rates(self):
+        series = CounterSeries()
+        for second, value in enumerate((0, 1000, 3000, 6000)):
+            series.append(100.0 + second * 2, value)
+        times, rates = series.rates()
+        self.assertEqual(list(times), [102.0, 104.0, 106.0])
+        self.assertEqual(list(rates), [500.0, 1000.0, 1500.0])
+        self.assertEqual(series.total(), 6000)
+
+    def test_wraparound(self):
+        series = CounterSeries()
+        series.append(0.0, 2 ** 32 - 100)
+        series.append(1.0, 50)
+        series.append(2.0, 150)
+        self.assertEqual(list(series.deltas()[1]), [150.0, 100.0])
+
+    def test_wider_counter(self):
+        series = CounterSeries(bits=64)
+        series.append(0.0, 2 ** 32 + 10)
+        series.append(1.0, 2 ** 33)
+        self.assertEqual(list(series.deltas()[1]), [2 ** 32 - 10])
+
+    def test_64_bit_counter_is_exact(self):
+        series = CounterSeries(bits=64)
+        series.append(0.0, 2 ** 64 - 3)
+        series.append(1.0, 2 ** 64 - 1)
+        series.append(2.0, 4)
+        self.assertEqual(series.values()[1], 2 ** 64 - 1)
+        self.assertEqual(list(series.deltas()[1]), [2, 5])
+        self.assertEqual(series.total(), 7)
+        self.assertEqual(series.latest(), (2.0, 4))
+
+    def test_reset(self):
+        series = CounterSeries()
+        series.append(0.0, 5000)
+        series.append(10.0, 300, reset=True)
+        series.append(20.0, 800)
+        self.assertEqual(list(series.deltas()[1]), [300.0, 500.0])
+
+    def test_ring_buffer(self):
+        series = CounterSeries(capacity=4)
+        for second in range(10):
+            series.append(float(second), second * 10)
+        self.assertEqual(len(series), 4)
+        self.assertEqual(list(series.times()), [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(list(series.values()), [60.0, 70.0, 80.0, 90.0])
+        self.assertEqual(series.latest(), (9.0, 90.0))
+        self.assertEqual(list(series.rates()[1]), [10.0, 10.0, 10.0])
+
+    def test_empty(self):
+        series = CounterSeries()
+        self.assertIsNone(series.latest())
+        self.assertEqual(list(series.rates()[1]), [])
+        self.assertEqual(list(series.downsample(60)[1]), [])
+        series.append(0.0, 1)
+        self.assertEqual(list(series.rates()[1]), [])
+
+    def test_downsample(self):
+        series = CounterSeries()
+        for second in range(0, 130, 10):
+            # 100 per second until 60, 400 per second afterwards.
+            value = second * 100 if second <= 60 else 6000 + (
+                second - 60) * 400
+            series.append(float(second), value)
+        starts, rates = series.downsample(60)
+        self.assertEqual(list(starts), [0.0, 60.0, 120.0])
+        self.assertEqual(list(rates), [100.0, 350.0, 400.0])
+
+    def test_compact(self):
+        series = CounterSeries(capacity=1000)
+        for second in range(1000):
+            series.append(float(second), second)
+        buffers = (series._times, series._values, series._flags)
+        self.assertLess(sum(sys.getsizeof(_) for _ in buffers), 18 * 1000)
+
+    def test_clear(self):
+        series = CounterSeries(capacity=2)
+        for second in range(3):
+            series.append(float(second), second)
+        series.clear()
+        self.assertEqual(len(series), 0)
+        series.append(5.0, 1)
+        self.assertEqual(list(series.times()), [5.0])
+
+
+class TestCounterStore(TestCase):
+
+    def test_record(self):
+        store = CounterStore(capacity=16, bits={'sent64': 64})
+        store.record('uuid:a', 0.0, {'sent': 0, 'sent64': 0}, uptime=100)
+        store.record('uuid:a', 10.0, {'sent': 1000, 'sent64': 1000},
+                     uptime=110)
+        store.record('uuid:b', 10.0, {'sent': 5}, uptime=5)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(store.keys()), [
+            ('uuid:a', 'sent'), ('uuid:a', 'sent64'), ('uuid:b', 'sent')])
+        self.assertEqual(list(store['uuid:a', 'sent'].rates()[1]), [100.0])
+        self.assertEqual(store['uuid:a', 'sent64'].modulus, 2 ** 64)
+        self.assertEqual(store['uuid:a', 'sent'].capacity, 16)
+
+    def test_reboot(self):
+        store = CounterStore()
+        store.record('uuid:a', 0.0, {'sent': 9000, 'received': 100},
+                     uptime=5000)
+        store.record('uuid:a', 60.0, {'sent': 600, 'received': 60},
+                     uptime=40)
+        store.record('uuid:a', 120.0, {'sent': 1200, 'received': 120},
+                     uptime=100)
+        self.assertEqual(list(store['uuid:a', 'sent'].deltas()[1]),
+                         [600.0, 600.0])
+        self.assertEqual(list(store['uuid:a', 'received'].deltas()[1]),
+                         [60.0, 60.0])
+
+    def test_remove(self):
+        store = CounterStore()
+        store.record('uuid:a', 0.0, {'sent': 1})
+        store.record('uuid:b', 0.0, {'sent': 1})
+        store.remove('uuid:a')
+        self.assertNotIn(('uuid:a', 'sent'), store)
+        self.assertIn(('uuid:b', 'sent'), store)
+
+
+# vim: set path+=fritzclient :
@@ -1,9 +1,10 @@
 from unittest import TestCase
 from pkg_resources import resource_string
 
-from mock import patch
+from mock import Mock, patch
 
-from fritzclient.ssdp import discover
+from fritzclient.ssdp import DiscoveryCache, discover, discover_all
+from fritzclient.tests.helpers import FakeClock
 
 
 class TestDiscovery(TestCase):
@@ -31,4 +32,109 @@ class TestDiscovery(TestCase):
         self.assertEqual(response, expected)
 
 
+class TestDiscoverAll(TestCase):
+
+    def setUp(self):
+        self.response = resource_string('fritzclient',
+                                        'tests/data/ssdp_response.txt')
+        self.repeater = (
+            self.response
+            .replace(b'192.168.179.1', b'192.168.179.2')
+            .replace(b'0024FE6E00C3', b'0024FE6E00C4'))
+
+    @patch('fritzclient.ssdp.select.select')
+    @patch('fritzclient.ssdp.socket.socket')
+    def test_all_responses_deduplicated(self, socket, select):
+        sock = socket()
+        sock.recvfrom.side_effect = [
+            (self.response, ('192.168.179.1', 1900)),
+            (self.response, ('192.168.179.1', 1900)),
+            (self.repeater, ('192.168.179.2', 1900)),
+        ]
+        select.side_effect = [([sock], [], [])] * 3 + [([], [], [])]
+
+        result = [_['location'] for _ in discover_all(mx=1)]
+
+        self.assertEqual(result, [
+            'http://192.168.179.1:49000/tr64desc.xml',
+            'http://192.168.179.2:49000/tr64desc.xml',
+        ])
+        self.assertTrue(sock.close.called)
+
+    @patch('fritzclient.ssdp.select.select')
+    @patch('fritzclient.ssdp.socket.socket')
+    def test_multiple_interfaces(self, socket, select):
+        select.return_value = ([], [], [])
+        list(discover_all(interfaces=['192.168.1.10', '10.0.0.10'], mx=1))
+
+        sock = socket()
+        bound = [_[0][0][0] for _ in sock.bind.call_args_list]
+        self.assertEqual(bound, ['192.168.1.10', '10.0.0.10'])
+        self.assertEqual(sock.sendto.call_count, 2)
+        self.assertIn(b'MX: 1', sock.sendto.call_args[0][0])
+
+    @patch('fritzclient.ssdp.select.select')
+    @patch('fritzclient.ssdp.socket.socket')
+    def test_stream(self, socket, select):
+        sock = socket()
+        sock.recvfrom.return_value = (self.response, ('192.168.179.1', 1900))
+        select.return_value = ([sock], [], [])
+
+        first = next(discover_all(mx=1))
+
+        self.assertEqual(first['location'],
+                         'http://192.168.179.1:49000/tr64desc.xml')
+        self.assertEqual(select.call_count, 1)
+
+
+def response(location, usn, max_age=1800):
+    return {
+        'status_code': 200,
+        'location': location,
+        'cache-control': 'max-age={}'.format(max_age),
+        'st': 'urn:dslforum-org:device:InternetGatewayDevice:1',
+        'usn': usn,
+    }
+
+
+@patch('fritzclient.ssdp.threading.Timer')
+class TestDiscoveryCache(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.box = response('http://192.168.179.1:49000/tr64desc.xml',
+                            'uuid:box1', max_age=100)
+        self.discover = Mock(side_effect=lambda st: iter([self.box]))
+        self.cache = DiscoveryCache(self.discover, clock=self.clock)
+
+    def test_cached_until_max_age(self, timer):
+        self.assertEqual(self.cache.get(), self.box)
+        self.clock.now += 99
+        self.assertEqual(self.cache.get(), self.box)
+        self.assertEqual(self.discover.call_count, 1)
+        self.clock.now += 2
+        self.cache.get()
+        self.assertEqual(self.discover.call_count, 2)
+
+    def test_background_refresh(self, timer):
+        self.cache.get()
+        delay, func, args = timer.call_args[0]
+        self.assertEqual(delay, 90)
+        self.assertTrue(timer().start.called)
+
+        moved = dict(self.box, location='http://192.168.179.9:49000/')
+        self.discover.side_effect = lambda st: iter([moved])
+        func(*args)
+        self.clock.now += 99
+        self.assertEqual(self.cache.get()['location'],
+                         'http://192.168.179.9:49000/')
+        self.assertEqual(self.discover.call_count, 2)
+
+    def test_invalidate(self, timer):
+        self.cache.get()
+        self.cache.invalidate(self.box['location'])
+        self.cache.get()
+        self.assertEqual(self.discover.call_count, 2)
+
+
 # vim: set path+=fritzclient :
@@ -0,0 +1,242 @@
+from unittest import TestCase, skipUnless
+import hashlib
+import ssl
+import threading
+
+from mock import create_autospec
+from pkg_resources import resource_filename
+from requests import Response
+from requests.utils import parse_dict_header
+
+from fritzclient.auth import DigestAuth
+from fritzclient.transport import RESUMPTION, Transport
+import fritzclient.minisoap as soap
+from fritzclient.tests.helpers import (
+    RESPONSE, SOAPHandler, start_server, stop_server)
+
+
+def md5(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class DigestSOAPHandler(SOAPHandler):
+    """
+    Requires digest authentication like a FritzBox. A nonce is valid for
+    ``server.nonce_uses`` requests, after that it is reported as stale if
+    ``server.report_stale`` is set and replaced without notice otherwise.
+    """
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        header = self.headers.get('authorization', '')
+        if header.startswith('Digest '):
+            params = parse_dict_header(header[len('Digest '):])
+            nonce = params['nonce']
+            count = int(params['nc'], 16)
+            ha1 = md5('%s:HTTPS Access:%s' % (params['username'],
+                                              server.password))
+            ha2 = md5('POST:%s' % params['uri'])
+            expected = md5('%s:%s:%s:%s:auth:%s' % (
+                ha1, nonce, params['nc'], params['cnonce'], ha2))
+            if nonce in server.nonces and params['response'] == expected:
+                if count in server.nonces[nonce]:
+                    return self.challenge(stale=False)
+                if count > server.nonce_uses:
+                    return self.challenge(stale=server.report_stale)
+                server.nonces[nonce].add(count)
+                return SOAPHandler.do_POST(self)
+        return self.challenge(stale=False)
+
+    def challenge(self, stale):
+        self.read_body()
+        server = self.server
+        server.challenges += 1
+        nonce = 'nonce%d' % server.challenges
+        server.nonces[nonce] = set()
+        self.reply(401, b'', headers={'WWW-Authenticate': (
+            'Digest realm="HTTPS Access", nonce="%s", algorithm=MD5, '
+            'qop="auth"%s' % (nonce, ', stale=TRUE' if stale else ''))})
+
+
+class ClosingSOAPHandler(SOAPHandler):
+    """
+    Closes the connection after each response, so every request needs a new
+    TLS handshake.
+    """
+
+    def do_POST(self):
+        if self.connection.session_reused:
+            self.server.resumed += 1
+        self.close_connection = True
+        self.read_body()
+        self.reply(200, RESPONSE, headers={'Connection': 'close'})
+
+
+class TestTransport(TestCase):
+
+    def setUp(self):
+        self.server = start_server(SOAPHandler)
+        self.url = self.server.url('/upnp/control/deviceinfo')
+
+    def tearDown(self):
+        stop_server(self.server)
+
+    def test_connection_reuse(self):
+        with Transport() as transport:
+            for _ in range(5):
+                result = soap.execute(self.url, 'ns', 'GetSecurityPort',
+                                      transport=transport)
+                self.assertEqual(result['NewSecurityPort'], 49443)
+        self.assertEqual(self.server.accepted, 1)
+
+    def test_no_reuse_without_transport(self):
+        for _ in range(3):
+            soap.execute(self.url, 'ns', 'GetSecurityPort')
+        self.assertEqual(self.server.accepted, 3)
+
+    def test_pool_size(self):
+        transport = Transport(pool_size=2)
+        adapter = transport._session.get_adapter(self.url)
+        self.assertEqual(adapter._pool_maxsize, 2)
+
+    def test_timeouts(self):
+        transport = Transport(connect_timeout=1.5, read_timeout=7)
+        self.assertEqual(transport.timeout, (1.5, 7))
+
+
+class TestDigestAuth(TestCase):
+
+    def setUp(self):
+        self.server = start_server(DigestSOAPHandler, password='secret',
+                                   nonce_uses=100, report_stale=True,
+                                   nonces={}, requests=0, challenges=0)
+        self.url = self.server.url('/upnp/control/deviceinfo')
+
+    def tearDown(self):
+        stop_server(self.server)
+
+    def execute(self, transport):
+        return soap.execute(self.url, 'ns', 'GetSecurityPort',
+                            transport=transport)
+
+    def test_one_round_trip_after_first_challenge(self):
+        with Transport(username='admin', password='secret') as transport:
+            for _ in range(5):
+                self.assertEqual(self.execute(transport)['NewSecurityPort'],
+                                 49443)
+        self.assertEqual(self.server.challenges, 1)
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(self.server.accepted, 1)
+
+    def test_stale_nonce(self):
+        self.server.nonce_uses = 2
+        with Transport(username='admin', password='secret') as transport:
+            for _ in range(5):
+                self.execute(transport)
+        self.assertEqual(self.server.challenges, 3)
+        self.assertEqual(self.server.requests, 8)
+
+    def test_replaced_nonce(self):
+        self.server.nonce_uses = 2
+        self.server.report_stale = False
+        with Transport(username='admin', password='secret') as transport:
+            for _ in range(5):
+                self.assertEqual(self.execute(transport)['NewSecurityPort'],
+                                 49443)
+        self.assertEqual(self.server.challenges, 3)
+        self.assertEqual(self.server.requests, 8)
+
+    def test_wrong_password(self):
+        with Transport(username='admin', password='wrong') as transport:
+            with self.assertRaises(Exception):
+                self.execute(transport)
+            with self.assertRaises(Exception):
+                self.execute(transport)
+        # Each rejection comes with a new nonce, which is tried once.
+        self.assertEqual(self.server.requests, 4)
+
+    def test_unsupported_algorithm(self):
+        auth = DigestAuth('admin', 'secret')
+        self.assertFalse(auth.challenge(
+            self.url, 'Digest realm="F!Box", nonce="1234", '
+            'algorithm=SHA-512-256', None))
+        self.assertIsNone(auth.authorization('POST', self.url))
+        self.assertEqual(auth.challenges, 0)
+
+    def test_concurrent_requests(self):
+        transport = Transport(username='admin', password='secret')
+        self.execute(transport)
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(10):
+                    self.execute(transport)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transport.close()
+        self.assertEqual(errors, [])
+
+
+@skipUnless(RESUMPTION, 'TLS session resumption needs Python 3.6')
+class TestTLS(TestCase):
+
+    def setUp(self):
+        self.cert = resource_filename('fritzclient',
+                                      'tests/data/tls-cert.pem')
+        key = resource_filename('fritzclient', 'tests/data/tls-key.pem')
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert, key)
+        self.server = start_server(ClosingSOAPHandler, context, resumed=0)
+        self.url = self.server.url('/upnp/control/deviceinfo')
+
+    def tearDown(self):
+        stop_server(self.server)
+
+    def test_session_resumption(self):
+        with Transport(verify=self.cert) as transport:
+            for _ in range(5):
+                result = soap.execute(self.url, 'ns', 'GetSecurityPort',
+                                      transport=transport)
+                self.assertEqual(result['NewSecurityPort'], 49443)
+        self.assertEqual(self.server.accepted, 5)
+        self.assertEqual(transport.tls.handshakes, 5)
+        self.assertGreaterEqual(transport.tls.resumed, 4)
+        self.assertGreaterEqual(self.server.resumed, 4)
+
+    def test_verification_failure(self):
+        with Transport() as transport:
+            with self.assertRaises(Exception):
+                soap.execute(self.url, 'ns', 'GetSecurityPort',
+                             transport=transport)
+
+    def test_no_verification(self):
+        with Transport(verify=False) as transport:
+            result = soap.execute(self.url, 'ns', 'GetSecurityPort',
+                                  transport=transport)
+        self.assertEqual(result['NewSecurityPort'], 49443)
+
+
+class TestExecuteWithTransport(TestCase):
+
+    def test_execute_uses_transport(self):
+        transport = create_autospec(Transport)
+        mock_response = create_autospec(Response)
+        mock_response.headers = {'content-type': 'text/xml'}
+        mock_response.status_code = 200
+        mock_response.text = RESPONSE
+        transport.post.return_value = mock_response
+        result = soap.execute('/foo', 'ns', 'GetSecurityPort',
+                              transport=transport)
+        self.assertTrue(transport.post.called)
+        self.assertEqual(result['NewSecurityPort'], 49443)
+
+
+# vim: set path+=fritzclient :
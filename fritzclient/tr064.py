@@ -1,57 +1,44 @@
+"""
+Access to TR-064 device and service descriptions.
+"""
 import logging
-import socket
 
 import requests
 
-LOG = logging.getLogger(__name__)
-
-SSDP_GRP = '239.255.255.250'
-SSDP_PORT = 1900
-
-DISCO_MESSAGE = (
-    b'M-SEARCH * HTTP/1.1\n'
-    b'Host: 239.255.255.250:1900\n'
-    b'Man: "ssdp:discover"\n'
-    b'MX: 5\n'
-    b'ST: urn:dslforum-org:device:InternetGatewayDevice:1\n'
+# Discovery used to live in this module.
+from fritzclient.ssdp import (  # NOQA
+    DISCO_MESSAGE,
+    SSDP_GRP,
+    SSDP_PORT,
+    DiscoveryCache,
+    SSDPError,
+    discover,
+    discover_all,
 )
 
+LOG = logging.getLogger(__name__)
 
-class SSDPError(Exception):
-    pass
-
-
-def discover():
-    sock = socket.socket(socket.AF_INET,
-                         socket.SOCK_DGRAM,
-                         socket.IPPROTO_UDP)
-    sock.settimeout(1.0)
-    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
-    sock.sendto(DISCO_MESSAGE, (SSDP_GRP, SSDP_PORT))
-    LOG.debug('Listening on {}'.format(sock))
-    try:
-        response = sock.recv(4096)
-    except socket.error as exc:
-        raise SSDPError(str(exc))
-    else:
-
-        output = {}
-        for line in response.splitlines():
-            if not line.strip():
-                continue
-            if line.startswith('HTTP/1.1'):
-                _, status, _ = line.split()
-                status = int(status)
-                output['status_code'] = status
-                continue
-
-            name, value = line.split(':', 1)
-            name = name.lower().strip()
-            output[name] = value.strip()
 
-        return output
+def get_tr064desc(location, transport=None, stream=False):
+    """
+    Fetch the ``tr64desc.xml`` document.
+
+    @param location: The URL of the document.
+    @param transport: An optional :py:class:`fritzclient.transport.Transport`.
+    @param stream: If true, return a file-like object reading the body while
+                   it is received instead of the complete document.
+    """
+    get = transport.get if transport else requests.get
+    if stream:
+        response = get(location, stream=True)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response.raw
+    desc = get(location)
+    return desc.text
 
 
-def get_tr064desc(location):
-    desc = requests.get(location)
-    return desc.text
+def get_scpd(url, transport=None):
+    get = transport.get if transport else requests.get
+    response = get(url)
+    return response.content
@@ -0,0 +1,294 @@
+"""
+HTTP transport used to talk to TR-064 devices.
+
+A FritzBox is slow to accept new connections. Compared to that, the SOAP
+processing of an action is cheap. A :py:class:`Transport` keeps a small pool
+of keep-alive connections to one host so repeated actions can reuse them.
+
+The same holds for TLS on the ``SecurityPort``: a full handshake takes a
+FritzBox hundreds of milliseconds. New TLS connections of a transport
+resume the session of an earlier connection (see :py:class:`TLSContext`),
+which needs Python 3.6 or newer.
+"""
+import logging
+import ssl
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from fritzclient import instrument
+from fritzclient.auth import DigestAuth
+
+LOG = logging.getLogger(__name__)
+
+#: Maximum number of keep-alive connections kept open per host.
+DEFAULT_POOL_SIZE = 4
+
+#: Seconds to wait for a TCP connection to be established.
+DEFAULT_CONNECT_TIMEOUT = 5.0
+
+#: Seconds to wait for the device to send data.
+DEFAULT_READ_TIMEOUT = 30.0
+
+#: Whether TLS sessions can be resumed with this Python version.
+RESUMPTION = hasattr(ssl, 'SSLSession')
+
+
+class _ResumableSocket(ssl.SSLSocket):
+    """
+    Hands its TLS session to the context before the connection is closed.
+    With TLS 1.3 the session ticket only arrives after the handshake, so
+    this is the latest point at which a resumable session is known.
+    """
+
+    def close(self):
+        self.context.remember(self)
+        super(_ResumableSocket, self).close()
+
+
+class TLSContext(ssl.SSLContext):
+    """
+    A client SSL context which resumes TLS sessions.
+
+    The last resumable session of each server address is kept. New
+    connections to that address offer it, so the server can skip the
+    expensive key exchange. ``handshakes`` counts all handshakes and
+    ``resumed`` those which resumed a session.
+    """
+
+    def __new__(cls, protocol=None):
+        if protocol is None:
+            protocol = ssl.PROTOCOL_TLS_CLIENT
+        return super(TLSContext, cls).__new__(cls, protocol)
+
+    def __init__(self, protocol=None):
+        # Host names are matched by urllib3, which also handles IP
+        # addresses as used for TR-064 devices.
+        self.check_hostname = False
+        self.sslsocket_class = _ResumableSocket
+        self.handshakes = 0
+        self.resumed = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def remember(self, sock):
+        """
+        Keep the session of the TLS socket *sock* if it can be resumed.
+        """
+        try:
+            session = sock.session
+            address = sock.getpeername()[:2]
+        except (OSError, ValueError):
+            return
+        if session is not None and (session.has_ticket or session.id):
+            with self._lock:
+                self._sessions[address] = session
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        address = sock.getpeername()[:2]
+        if kwargs.get('session') is None:
+            with self._lock:
+                kwargs['session'] = self._sessions.get(address)
+        sslsock = super(TLSContext, self).wrap_socket(sock, *args, **kwargs)
+        with self._lock:
+            self.handshakes += 1
+            if sslsock.session_reused:
+                self.resumed += 1
+        self.remember(sslsock)
+        return sslsock
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    """
+    Reports the time taken to connect to :py:mod:`fritzclient.instrument`.
+    """
+
+    def connect(self):
+        started = instrument.clock()
+        try:
+            super(_TimedHTTPConnection, self).connect()
+        finally:
+            instrument._add_connect_time(instrument.clock() - started)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    """
+    Reports the time taken to connect, including the TLS handshake, to
+    :py:mod:`fritzclient.instrument`.
+    """
+
+    def connect(self):
+        started = instrument.clock()
+        try:
+            super(_TimedHTTPSConnection, self).connect()
+        finally:
+            instrument._add_connect_time(instrument.clock() - started)
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _Adapter(HTTPAdapter):
+    """
+    Passes an SSL context to the connection pools and times new
+    connections.
+    """
+
+    def __init__(self, ssl_context=None, **kwargs):
+        self._ssl_context = ssl_context
+        super(_Adapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._ssl_context is not None:
+            kwargs['ssl_context'] = self._ssl_context
+        super(_Adapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _HTTPConnectionPool,
+            'https': _HTTPSConnectionPool,
+        }
+
+
+class Transport(object):
+    """
+    A reusable HTTP transport for one host.
+
+    All requests sent through the same instance share a bounded pool of
+    keep-alive connections. Create one instance per device and pass it to
+    everything which talks to that device.
+
+        pool_size
+            The maximum number of connections kept open to the host.
+
+        connect_timeout
+            Seconds to wait for a connection to be established.
+
+        read_timeout
+            Seconds to wait for the device to send data.
+
+        block
+            If ``True`` (the default), callers wait for a free connection
+            when all pooled connections are in use. If ``False``, extra
+            connections are opened and discarded after use.
+
+        username, password
+            Optional credentials for protected actions. They are sent with
+            HTTP digest authentication (see
+            :py:class:`fritzclient.auth.DigestAuth`).
+
+        verify
+            Certificate verification for ``https`` URLs: ``True``, ``False``
+            or the path of a CA bundle. FritzBoxes use self-signed
+            certificates, which can be exported and given here. Unlike
+            :py:attr:`requests.Session.verify`, this is not overridden by
+            the ``REQUESTS_CA_BUNDLE`` environment variable.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, block=True,
+                 username=None, password=None, verify=True):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify = verify
+        self.auth = None
+        if password is not None:
+            self.auth = DigestAuth(username or '', password)
+        #: The :py:class:`TLSContext` of ``https`` connections, or ``None``
+        #: if sessions cannot be resumed.
+        self.tls = TLSContext() if RESUMPTION else None
+        self._session = requests.Session()
+        adapter = _Adapter(ssl_context=self.tls,
+                           pool_connections=1,
+                           pool_maxsize=pool_size,
+                           pool_block=block)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def post(self, url, data=None, headers=None, stream=False):
+        """
+        Send a POST request over a pooled connection.
+
+        @param url: The target URL.
+        @param data: The request body.
+        @param headers: An optional dictionary of HTTP headers.
+        @param stream: If true, the body is not read until it is accessed.
+        """
+        return self._request('POST', url, data=data, headers=headers,
+                             stream=stream)
+
+    def get(self, url, headers=None, stream=False):
+        """
+        Send a GET request over a pooled connection.
+
+        @param url: The target URL.
+        @param headers: An optional dictionary of HTTP headers.
+        @param stream: If true, the body is not read until it is accessed.
+                       The connection returns to the pool once the body has
+                       been read completely.
+        """
+        return self._request('GET', url, headers=headers, stream=stream)
+
+    def request(self, method, url, data=None, headers=None):
+        """
+        Send a request with any HTTP method, e.g. ``SUBSCRIBE``, over a
+        pooled connection.
+
+        @param method: The HTTP method.
+        @param url: The target URL.
+        @param data: An optional request body.
+        @param headers: An optional dictionary of HTTP headers.
+        """
+        return self._request(method, url, data=data, headers=headers)
+
+    def _request(self, method, url, data=None, headers=None, stream=False):
+        """
+        Send a request, authorizing it with the cached digest nonce if
+        possible. A ``401`` response is only answered with a second request
+        if the nonce was missing, stale or replaced.
+        """
+        if self.auth is None:
+            return self._session.request(method, url, data=data,
+                                         headers=headers, stream=stream,
+                                         timeout=self.timeout,
+                                         verify=self.verify)
+
+        headers = dict(headers or {})
+        sent = self.auth.authorization(method, url)
+        if sent is not None:
+            headers['Authorization'] = sent
+        response = self._session.request(method, url, data=data,
+                                         headers=headers, stream=stream,
+                                         timeout=self.timeout,
+                                         verify=self.verify)
+        if response.status_code != 401 or not self.auth.challenge(
+                url, response.headers.get('www-authenticate', ''), sent):
+            return response
+
+        # Read the body so the connection can be reused for the retry.
+        response.content
+        response.close()
+        headers['Authorization'] = self.auth.authorization(method, url)
+        return self._session.request(method, url, data=data, headers=headers,
+                                     stream=stream, timeout=self.timeout,
+                                     verify=self.verify)
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        LOG.debug('Closing transport %r', self)
+        self._session.close()